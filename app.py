@@ -1,26 +1,50 @@
 import base64
-import io
 import json
 import os
 import time
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Request, Response, render_template, request, jsonify, send_file
 from PIL import Image
 
-from src.io_utils import b64_to_image, exif_to_dict, fmt_size, image_to_dataurl, stats_for
+from src.io_utils import (
+    ALLOWED_EXPORT, PREVIEW_MAX_SIDE, b64_to_image, bytes_to_image, encoder_profile, exif_to_dict, fmt_size,
+    image_to_bytes, image_to_dataurl, open_image, reduced_decode, stats_for,
+)
 from src.ops import convert_img, remove_background
+from src.anim_stream import ANIMATION_FORMATS, animation_format
 from src.gif_ops import (
     HAS_GIF, resize_gif, trim_gif, extract_gif_frames,
     change_gif_speed, reverse_gif, gif_to_frames_zip,
-    gif_info, optimize_gif, pingpong_gif, poster_frame,
+    gif_info, optimize_gif, pingpong_gif, poster_frame, iter_frames_zip,
 )
-from src.seam import HAS_SEAM, SEAM_BACKEND, seam_carve
-from src.bg_remove import HAS_REMBG, remove_bg_ai
-from src.exporter import prepare_download
+from src.seam import HAS_SEAM, SEAM_BACKEND, parse_pyramid, seam_carve, seam_carve_precomputed
+from src.bg_remove import HAS_REMBG, preload_enabled, preload_sessions, prepare_models, rembg_stats, remove_bg_ai
+from src.batch import BATCH_MAX_MB, BatchError, batch_steps, collect_items, iter_batch_zip
+from src.exporter import ImageSetError, iter_image_set_zip, parse_image_set, prepare_download
 from src.heif_support import register_heif
+from src.pipeline import PipelineError, run_pipeline
+from src.jobs import JOB_OPS, JOB_QUEUE, JobError, QueueFull
+from src.image_store import IMAGE_STORE, ImageNotStored
+from src.result_cache import RESULT_CACHE
 
 register_heif()
 
+if preload_enabled():
+    # Imports rembg and fetches model files; sessions are created per worker
+    # (see gunicorn.conf.py) because onnxruntime does not survive fork.
+    prepare_models()
+
+class _Request(Request):
+    """Flask's request, with the larger ``BATCH_MAX_MB`` body limit on ``/api/batch``."""
+
+    @property
+    def max_content_length(self) -> int | None:
+        if self.endpoint == "api_batch":
+            return BATCH_MAX_MB * 1024 * 1024
+        return super().max_content_length
+
+
 app = Flask(__name__)
+app.request_class = _Request
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-key-change-in-prod")
 app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024
 app.config["ASSET_VERSION"] = (
@@ -37,13 +61,122 @@ def inject_asset_version():
 
 
 def _open_uploaded_image(field: str = "image"):
+    """The uploaded image with only its header read, and its bytes."""
     upload = request.files.get(field)
     if upload is None:
         raise ValueError("No uploaded image provided")
     raw = upload.read()
-    image = Image.open(io.BytesIO(raw))
-    image.load()
-    return image, raw
+    return open_image(raw), raw
+
+
+def _binary_request() -> bool:
+    """True when the client sent pixels as multipart or a raw body instead of JSON."""
+    return not request.is_json
+
+
+def _request_params():
+    if request.is_json:
+        return request.json
+    if request.files or request.form:
+        return request.form
+    return request.args
+
+
+def _request_payload(field: str = "image"):
+    """Return the encoded image and the parameters for any request flavour.
+
+    JSON bodies carry a data URL plus parameters, multipart bodies carry the
+    file plus form fields, and raw bodies carry the bytes with parameters in
+    the query string. Any of them may name a stored image by ``handle``
+    instead of sending pixels.
+    """
+    params = _request_params()
+    if params.get("handle") and not params.get(field):
+        return IMAGE_STORE.get_bytes(params["handle"]), params
+    if request.is_json:
+        return params[field], params
+    upload = request.files.get(field)
+    if upload is not None:
+        return upload.read(), params
+    raw = request.get_data()
+    if not raw:
+        raise ValueError("No image provided")
+    return raw, params
+
+
+def _request_image(field: str = "image"):
+    params = _request_params()
+    if params.get("handle") and not params.get(field):
+        return IMAGE_STORE.get_image(params["handle"]), params
+    data, params = _request_payload(field)
+    img = bytes_to_image(data) if isinstance(data, bytes) else b64_to_image(data)
+    return img, params
+
+
+def _flag(value, default: bool = True) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in {"", "0", "false", "no", "off"}
+    return bool(value)
+
+
+def _timeout(value) -> float | None:
+    """Parse an optional ``timeout`` param in seconds; ``ValueError`` unless it is a positive number."""
+    if value in (None, ""):
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = float("nan")
+    if not 0 < seconds < float("inf"):
+        raise ValueError("timeout must be a positive number of seconds")
+    return seconds
+
+
+def _binary_response(raw: bytes, mime: str, **headers) -> Response:
+    resp = Response(raw, mimetype=mime)
+    for key, value in headers.items():
+        resp.headers["X-" + key.replace("_", "-").title()] = str(value)
+    return resp
+
+
+def _uses_handle() -> bool:
+    return bool(_request_params().get("handle"))
+
+
+def _image_reply(img: Image.Image, fmt: str = "PNG", quality: int = 92, profile: str = "fast"):
+    """Answer with a data URL for JSON callers and raw bytes otherwise.
+
+    Requests that worked from a stored handle also get the result stored, so
+    the next edit step can refer to it without uploading it again.
+    """
+    if not _binary_request() and not _uses_handle():
+        return jsonify({"img": image_to_dataurl(img, fmt, quality, profile)})
+    raw, mime = image_to_bytes(img, fmt, quality, profile)
+    extra = {"image_handle": IMAGE_STORE.put(raw, img)} if _uses_handle() else {}
+    if not _binary_request():
+        payload = f"data:{mime};base64," + base64.b64encode(raw).decode("ascii")
+        return jsonify({"img": payload, "handle": extra["image_handle"]})
+    return _binary_response(raw, mime, image_width=img.width, image_height=img.height, **extra)
+
+
+def _gif_reply(result: str | bytes, mime: str = "image/gif"):
+    """Like ``_image_reply`` for results gif_ops has already encoded."""
+    if isinstance(result, str):
+        if not _uses_handle():
+            return jsonify({"img": result})
+        result = base64.b64decode(result.split(",", 1)[1])
+    extra = {"image_handle": IMAGE_STORE.put(result)} if _uses_handle() else {}
+    if not _binary_request():
+        payload = f"data:{mime};base64," + base64.b64encode(result).decode("ascii")
+        return jsonify({"img": payload, "handle": extra["image_handle"]} if extra else {"img": payload})
+    return _binary_response(result, mime, **extra)
+
+
+@app.errorhandler(ImageNotStored)
+def _image_not_stored(exc):
+    return jsonify({"error": "Unknown or expired image handle; upload the image again."}), 404
 
 
 @app.get("/")
@@ -66,134 +199,320 @@ def health_check():
     return "ok", 200
 
 
+@app.get("/api/cache/stats")
+def api_cache_stats():
+    return jsonify({"results": RESULT_CACHE.stats(), "store": IMAGE_STORE.stats(), "jobs": JOB_QUEUE.stats()})
+
+
+@app.get("/api/rembg/status")
+def api_rembg_status():
+    return jsonify(rembg_stats())
+
+
 @app.post("/api/inspect_upload")
 def api_inspect_upload():
     img, raw = _open_uploaded_image()
     meta = stats_for(img)
     meta["file_size"] = len(raw)
     meta["file_size_str"] = fmt_size(len(raw))
-    return jsonify({"meta": meta, "exif": exif_to_dict(img)})
+    result = {"meta": meta, "exif": exif_to_dict(img)}
+    preview_side = min(int(request.form.get("preview", 0) or 0), PREVIEW_MAX_SIDE)
+    if preview_side > 0:
+        # Starts from the reduced decode stats_for already did.
+        preview = reduced_decode(img, preview_side)
+        preview.thumbnail((preview_side, preview_side))
+        alpha = preview.has_transparency_data
+        result["preview"] = image_to_dataurl(preview.convert("RGBA" if alpha else "RGB"), "PNG" if alpha else "JPEG", 85)
+    return jsonify(result)
+
+
+@app.post("/api/store")
+def api_store():
+    """Upload an image once and get back a handle other routes accept."""
+    data, _ = _request_payload()
+    raw = data if isinstance(data, bytes) else base64.b64decode(data.split(",", 1)[-1])
+    handle = IMAGE_STORE.put(raw)
+    img = IMAGE_STORE.get_image(handle)
+    return jsonify({
+        "handle": handle,
+        "format": (img.format or "").upper(),
+        "width": img.width,
+        "height": img.height,
+        "file_size": len(raw),
+    })
+
+
+@app.get("/api/store/<handle>")
+def api_store_fetch(handle: str):
+    raw = IMAGE_STORE.get_bytes(handle)
+    img = open_image(raw)  # header only: the bytes go back as they are
+    mime = Image.MIME.get(img.format or "", "application/octet-stream")
+    return _binary_response(raw, mime, image_width=img.width, image_height=img.height)
 
 
 @app.post("/api/convert")
 def api_convert():
-    d = request.json
-    img = b64_to_image(d["image"])
-    return jsonify({"img": convert_img(img, d.get("to", "png"), int(d.get("quality", 92)))})
+    img, d = _request_image()
+    profile = encoder_profile(d.get("profile"), "fast")
+    if not _binary_request() and not _uses_handle():
+        return jsonify({"img": convert_img(img, d.get("to", "png"), int(d.get("quality", 92)), profile)})
+    fmt, _ = ALLOWED_EXPORT.get((d.get("to") or "png").lower(), ("PNG", "image/png"))
+    return _image_reply(img, fmt, int(d.get("quality", 92)), profile)
 
 
 @app.post("/api/background_remove")
 def api_background_remove():
-    d = request.json
-    img = b64_to_image(d["image"])
+    img, d = _request_image()
     out = remove_background(img, float(d.get("tolerance", 18.0)))
-    return jsonify({"img": image_to_dataurl(out, "PNG")})
+    return _image_reply(out, "PNG")
 
 
 @app.post("/api/background_remove_ai")
 def api_background_remove_ai():
     if not HAS_REMBG:
         return jsonify({"error": "Local AI background removal is not available. Install rembg and onnxruntime on the server."}), 400
-    d = request.json
-    img = b64_to_image(d["image"])
+    img, d = _request_image()
     try:
-        out = remove_bg_ai(img)
+        proxy = d.get("proxy_max_side")
+        out = remove_bg_ai(img, d.get("model") or None, int(proxy) if proxy not in (None, "") else None)
     except RuntimeError as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception:
         app.logger.exception("AI background removal failed")
         return jsonify({"error": "AI background removal failed on the server."}), 500
-    return jsonify({"img": image_to_dataurl(out, "PNG")})
+    return _image_reply(out, "PNG")
 
 
 @app.post("/api/seam_carve")
 def api_seam():
     if not HAS_SEAM:
         return jsonify({"error": "Seam carving is not available."}), 400
-    d = request.json
-    img = b64_to_image(d["image"])
-    out = seam_carve(
+    img, d = _request_image()
+    args = (
         img,
         int(d.get("target_width", img.width)),
         int(d.get("target_height", img.height)),
         d.get("order", "width-first"),
         d.get("energy_mode", "backward"),
     )
-    return jsonify({"img": image_to_dataurl(out)})
+    if _flag(d.get("precomputed"), default=False):
+        out = seam_carve_precomputed(*args)
+    else:
+        out = seam_carve(*args, parse_pyramid(d.get("pyramid")))
+    return _image_reply(out)
+
+
+@app.post("/api/pipeline")
+def api_pipeline():
+    """Run an ordered list of steps on one image, encoding only the final result."""
+    start = time.perf_counter()
+    img, d = _request_image()
+    decode_ms = round((time.perf_counter() - start) * 1000, 2)
+    steps = d.get("steps") or []
+    if isinstance(steps, str):
+        try:
+            steps = json.loads(steps)
+        except ValueError:
+            return jsonify({"error": "steps must be a JSON list"}), 400
+    try:
+        raw, mime, _, timings = run_pipeline(img, steps)
+    except PipelineError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 400
+    timings.insert(0, {"op": "decode", "ms": decode_ms})
+    total_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    extra = {"image_handle": IMAGE_STORE.put(raw)} if _uses_handle() else {}
+    if not _binary_request():
+        payload = {
+            "img": f"data:{mime};base64," + base64.b64encode(raw).decode("ascii"),
+            "timings": timings,
+            "total_ms": total_ms,
+        }
+        if extra:
+            payload["handle"] = extra["image_handle"]
+        return jsonify(payload)
+    return _binary_response(raw, mime, pipeline_timings=json.dumps(timings), total_ms=total_ms, **extra)
+
+
+@app.post("/api/jobs")
+def api_job_submit():
+    """Queue a slow operation and answer with a job ID straight away."""
+    data, d = _request_payload()
+    op = d.get("op")
+    if op not in JOB_OPS:
+        return jsonify({"error": f"op must be one of: {', '.join(sorted(JOB_OPS))}"}), 400
+    if op == "seam_carve" and not HAS_SEAM:
+        return jsonify({"error": "Seam carving is not available."}), 400
+    if op == "background_remove_ai" and not HAS_REMBG:
+        return jsonify({"error": "Local AI background removal is not available. Install rembg and onnxruntime on the server."}), 400
+
+    params = d.to_dict() if hasattr(d, "to_dict") else dict(d)
+    params.pop("image", None)
+    if isinstance(params.get("steps"), str):
+        try:
+            params["steps"] = json.loads(params["steps"])
+        except ValueError:
+            return jsonify({"error": "steps must be a JSON list"}), 400
+    raw = data if isinstance(data, bytes) else base64.b64decode(data.split(",", 1)[-1])
+    try:
+        timeout = _timeout(params.get("timeout"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    try:
+        job_id = JOB_QUEUE.submit(op, raw, params, timeout)
+    except QueueFull as exc:
+        return jsonify({"error": str(exc)}), 503
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }), 202
+
+
+@app.get("/api/jobs/<job_id>")
+def api_job_status(job_id: str):
+    try:
+        return jsonify(JOB_QUEUE.status(job_id))
+    except JobError as exc:
+        return jsonify({"error": str(exc)}), 404
+
+
+@app.get("/api/jobs/<job_id>/result")
+def api_job_result(job_id: str):
+    try:
+        status = JOB_QUEUE.status(job_id)
+        if status["status"] != "done":
+            return jsonify(status), 409
+        raw, mime = JOB_QUEUE.result(job_id)
+    except JobError as exc:
+        return jsonify({"error": str(exc)}), 404
+    if _flag(request.args.get("dataurl"), default=False):
+        return jsonify({"img": f"data:{mime};base64," + base64.b64encode(raw).decode("ascii")})
+    return _binary_response(raw, mime, job_id=job_id)
+
+
+@app.delete("/api/jobs/<job_id>")
+def api_job_cancel(job_id: str):
+    try:
+        return jsonify(JOB_QUEUE.cancel(job_id))
+    except JobError as exc:
+        return jsonify({"error": str(exc)}), 404
+
+
+@app.post("/api/batch")
+def api_batch():
+    """Apply one op or pipeline to every uploaded image (multipart ``images`` or a ZIP), streaming a ZIP back."""
+    d = _request_params()
+    # Read now: uploads are closed with the request, before the response is streamed.
+    if request.files:
+        uploads = [(upload.filename or "image", upload.read()) for upload in request.files.getlist("images")]
+    else:
+        uploads = [("upload.zip", request.get_data())]
+    try:
+        timeout = _timeout(d.get("timeout"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    try:
+        steps = batch_steps(d.get("op"), d.to_dict() if hasattr(d, "to_dict") else dict(d))
+        items = collect_items(uploads)
+    except BatchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return Response(iter_batch_zip(items, steps, timeout),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": "attachment; filename=batch.zip"})
+
+
+def _animation_reply(result: str | bytes, fmt: str):
+    return _gif_reply(result, ANIMATION_FORMATS[fmt])
 
 
 @app.post("/api/gif/resize")
 def api_gif_resize():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    return jsonify({
-        "img": resize_gif(
-            d["image"],
-            int(d.get("width", 0)),
-            int(d.get("height", 0)),
-            bool(d.get("keep_aspect", True)),
-        )
-    })
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(resize_gif(
+        data,
+        int(d.get("width", 0)),
+        int(d.get("height", 0)),
+        _flag(d.get("keep_aspect", True)),
+        fmt,
+    ), fmt)
 
 
 @app.post("/api/gif/trim")
 def api_gif_trim():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    return jsonify({"img": trim_gif(d["image"], int(d.get("start_frame", 0)), int(d.get("end_frame", -1)))})
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(trim_gif(data, int(d.get("start_frame", 0)), int(d.get("end_frame", -1)), fmt), fmt)
 
 
 @app.post("/api/gif/speed")
 def api_gif_speed():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    return jsonify({"img": change_gif_speed(d["image"], float(d.get("speed_factor", 1.0)))})
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(change_gif_speed(data, float(d.get("speed_factor", 1.0)), fmt), fmt)
 
 
 @app.post("/api/gif/reverse")
 def api_gif_reverse():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    return jsonify({"img": reverse_gif(request.json["image"])})
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(reverse_gif(data, fmt), fmt)
 
 
 @app.post("/api/gif/pingpong")
 def api_gif_pingpong():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    return jsonify({"img": pingpong_gif(request.json["image"])})
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(pingpong_gif(data, fmt), fmt)
 
 
 @app.post("/api/gif/optimize")
 def api_gif_optimize():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    return jsonify({
-        "img": optimize_gif(
-            d["image"],
-            int(d.get("colors", 128)),
-            int(d.get("frame_step", 1)),
-        )
-    })
+    data, d = _request_payload()
+    fmt = animation_format(d.get("format"))
+    return _animation_reply(optimize_gif(
+        data,
+        int(d.get("colors", 128)),
+        int(d.get("frame_step", 1)),
+        fmt,
+    ), fmt)
 
 
 @app.post("/api/gif/poster")
 def api_gif_poster():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    return jsonify({"img": poster_frame(d["image"], int(d.get("frame", 0)))})
+    data, d = _request_payload()
+    return _gif_reply(poster_frame(data, int(d.get("frame", 0))), "image/png")
 
 
 @app.post("/api/gif/frames_zip")
 def api_gif_frames_zip():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    raw = gif_to_frames_zip(request.json["image"])
+    data, d = _request_payload()
+    level = int(d["compress_level"]) if d.get("compress_level") not in (None, "") else None
+    deflate = _flag(d["deflate"]) if d.get("deflate") is not None else None
+    if _binary_request():
+        # Chunked: each frame is written to the client as soon as it is encoded.
+        return Response(iter_frames_zip(data, level, deflate), mimetype="application/zip",
+                        headers={"Content-Disposition": "attachment; filename=frames.zip"})
+    raw = gif_to_frames_zip(data, level, deflate)
     payload = "data:application/zip;base64," + base64.b64encode(raw).decode("ascii")
     return jsonify({"zip": payload})
 
@@ -202,31 +521,36 @@ def api_gif_frames_zip():
 def api_gif_info():
     if not HAS_GIF:
         return jsonify({"error": "GIF support is not available."}), 400
-    d = request.json
-    info = gif_info(d["image"])
-    info["frames"] = extract_gif_frames(d["image"], max_frames=10)
+    data, _ = _request_payload()
+    info = gif_info(data)
+    info["frames"] = extract_gif_frames(data, max_frames=10)
     return jsonify(info)
 
 
 @app.post("/api/export")
 def api_export():
-    if request.files.get("image"):
-        img, _ = _open_uploaded_image()
-        fmt_key = (request.form.get("format") or "png").lower()
-        quality = int(request.form.get("quality", 92))
-        metadata_raw = request.form.get("metadata") or "{}"
+    img, d = _request_image()
+    fmt_key = (d.get("format") or "png").lower()
+    quality = int(d.get("quality", 92))
+    profile = encoder_profile(d.get("profile"), "smallest")
+    metadata = d.get("metadata") or {}
+    if isinstance(metadata, str):
         try:
-            metadata = json.loads(metadata_raw)
+            metadata = json.loads(metadata)
         except Exception:
             metadata = {}
-    else:
-        d = request.json
-        img = b64_to_image(d["image"])
-        fmt_key = (d.get("format") or "png").lower()
-        quality = int(d.get("quality", 92))
-        metadata = d.get("metadata", {})
 
-    buf, mime = prepare_download(img, fmt_key, quality, metadata)
+    if d.get("widths"):
+        # Responsive image set: every width in every format, streamed as a ZIP.
+        try:
+            widths, fmt_keys = parse_image_set(img, d["widths"], d.get("formats") or fmt_key)
+        except ImageSetError as exc:
+            return jsonify({"error": str(exc)}), 400
+        return Response(iter_image_set_zip(img, widths, fmt_keys, quality, metadata, profile, "edited"),
+                        mimetype="application/zip",
+                        headers={"Content-Disposition": "attachment; filename=edited-set.zip"})
+
+    buf, mime = prepare_download(img, fmt_key, quality, metadata, profile)
     buf.seek(0)
     return send_file(buf, mimetype=mime, as_attachment=True, download_name=f"edited.{fmt_key}")
 
@@ -253,4 +577,6 @@ else:
 
 
 if __name__ == "__main__":
+    if preload_enabled():
+        preload_sessions(background=True)
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=not IS_PRODUCTION)
@@ -0,0 +1,17 @@
+# Gunicorn picks this file up automatically; command-line flags still win.
+import os
+
+_PRELOAD = os.environ.get("REMBG_PRELOAD", "0").lower() in {"1", "true", "yes"}
+
+# With REMBG_PRELOAD the app (numpy, Pillow, rembg and the model files) is
+# imported once in the master before forking, so workers start warm.
+preload_app = _PRELOAD
+
+
+def post_fork(server, worker):
+    if not _PRELOAD:
+        return
+    from src.bg_remove import preload_sessions
+
+    # onnxruntime sessions are created after fork; warm them off the request path.
+    preload_sessions(background=True)
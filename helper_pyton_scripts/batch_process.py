@@ -0,0 +1,244 @@
+# helper_pyton_scripts/batch_process.py
+"""Run one of the server-side operations over a directory tree, without the HTTP layer.
+
+Run from the repo root:
+    python helper_pyton_scripts/batch_process.py SRC DST --op background_remove -p tolerance=20
+    python helper_pyton_scripts/batch_process.py SRC DST --op convert -p to=webp -p quality=85
+    python helper_pyton_scripts/batch_process.py SRC DST --op pipeline --steps '[{"op": "seam_carve", ...}]'
+    python helper_pyton_scripts/batch_process.py SRC DST --op gif_reverse -p format=webp
+
+Outputs mirror the tree under DST, with the extension of the output format.
+Files whose output is newer than the input and was made with the same op
+and parameters (recorded in DST/.batch_process.json) are skipped, and
+outputs are written under a temporary name and renamed into place, so an
+interrupted run picks up where it stopped. Work is spread over a process pool, and a
+throughput line is printed every few seconds.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.anim_stream import animation_format  # noqa: E402
+from src.batch import BatchError, batch_steps  # noqa: E402
+from src.io_utils import ALLOWED_EXPORT  # noqa: E402
+from src.jobs import GIF_JOB_OPS, START_METHOD, run_job  # noqa: E402
+from src.pipeline import OUTPUT_STEPS, STEPS  # noqa: E402
+from src.result_cache import RESULT_CACHE  # noqa: E402
+
+IMAGE_INPUTS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff", ".gif", ".heic", ".heif"}
+GIF_INPUTS = {".gif"}
+_ANIMATION_EXTENSIONS = {"gif": "gif", "webp": "webp", "webp_lossless": "webp", "apng": "png"}
+OPS = sorted(set(STEPS) | OUTPUT_STEPS | {"pipeline"} | GIF_JOB_OPS)
+# Output path (relative to DST) -> fingerprint of the op and parameters that made it.
+MANIFEST_NAME = ".batch_process.json"
+
+_job = None  # (op, params) in each pool worker
+
+
+def plan(op: str, params: dict) -> tuple[str, dict, str]:
+    """``(job op, job params, output extension)`` for a command-line op."""
+    if op in GIF_JOB_OPS:
+        ext = "zip" if op == "gif_frames_zip" else _ANIMATION_EXTENSIONS[animation_format(params.get("format"))]
+        return op, params, ext
+    steps = batch_steps(op, params)
+    output = steps[-1] if steps[-1]["op"] in OUTPUT_STEPS else {}
+    fmt_key = (output.get("format") or output.get("to") or "png").lower()
+    return "pipeline", {"steps": steps}, fmt_key if fmt_key in ALLOWED_EXPORT else "png"
+
+
+def params_fingerprint(job_op: str, job_params: dict) -> str:
+    """Short hash of what an output depends on besides its input file."""
+    material = json.dumps([job_op, job_params], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def load_manifest(dst: str) -> dict:
+    try:
+        with open(os.path.join(dst, MANIFEST_NAME)) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(dst: str, manifest: dict):
+    path = os.path.join(dst, MANIFEST_NAME)
+    os.makedirs(dst, exist_ok=True)
+    with open(f"{path}.part", "w") as fh:
+        json.dump(manifest, fh, indent=0, sort_keys=True)
+    os.replace(f"{path}.part", path)
+
+
+def find_work(src: str, dst: str, ext: str, inputs: set, force: bool = False,
+              fingerprint: str | None = None, manifest: dict | None = None) -> tuple[list, int]:
+    """``(input, output)`` pairs still to do, and how many are already up to date.
+
+    An output is up to date when it is newer than its input and, given a
+    ``fingerprint``, ``manifest`` records it as made with that fingerprint.
+    """
+    manifest = manifest or {}
+    dst_abs = os.path.abspath(dst)
+    todo = []
+    claimed = set()
+    skipped = 0
+    for folder, dirs, files in os.walk(src):
+        dirs[:] = sorted(d for d in dirs
+                         if not d.startswith(".") and os.path.abspath(os.path.join(folder, d)) != dst_abs)
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in inputs:
+                continue
+            path = os.path.join(folder, name)
+            rel = os.path.relpath(path, src)
+            out = os.path.join(dst, f"{os.path.splitext(rel)[0]}.{ext}")
+            if out in claimed:  # photo.jpg and photo.png both in one folder
+                out = os.path.join(dst, f"{rel}.{ext}")
+            claimed.add(out)
+            if (not force and os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(path)
+                    and (fingerprint is None or manifest.get(os.path.relpath(out, dst)) == fingerprint)):
+                skipped += 1
+                continue
+            todo.append((path, out))
+    return todo, skipped
+
+
+def _init_worker(op: str, params: dict):
+    global _job
+    from src.heif_support import register_heif
+
+    register_heif()
+    # Every file is new to its worker; a memory cache would only hold results.
+    if "RESULT_CACHE_MB" not in os.environ:
+        RESULT_CACHE.resize(0)
+    _job = (op, params)
+
+
+def _process(task: tuple[str, str]) -> tuple[str, int, int, float, str | None]:
+    """Run the job on one file; return ``(input, in bytes, out bytes, seconds, error)``."""
+    path, out = task
+    start = time.perf_counter()
+    size = 0
+    try:
+        with open(path, "rb") as fh:
+            raw = fh.read()
+        size = len(raw)
+        result, _ = run_job(_job[0], raw, _job[1])
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        partial = f"{out}.part"
+        with open(partial, "wb") as fh:
+            fh.write(result)
+        os.replace(partial, out)
+    except Exception as exc:
+        return path, size, 0, time.perf_counter() - start, str(exc) or exc.__class__.__name__
+    return path, size, len(result), time.perf_counter() - start, None
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _report(done: int, failed: int, total: int, in_bytes: int, elapsed: float) -> str:
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else 0.0
+    return (f"{done:>{len(str(total))}}/{total} done, {failed} failed | {rate:.1f} img/s, "
+            f"{in_bytes / 1e6 / elapsed if elapsed else 0.0:.1f} MB/s in | "
+            f"elapsed {_duration(elapsed)}, eta {_duration(eta)}")
+
+
+def run(src: str, dst: str, op: str, params: dict, workers: int | None = None, force: bool = False,
+        report_every: float = 2.0) -> int:
+    """Process the tree and return the number of failed files."""
+    job_op, job_params, ext = plan(op, params)
+    fingerprint = params_fingerprint(job_op, job_params)
+    manifest = load_manifest(dst)
+    todo, skipped = find_work(src, dst, ext, GIF_INPUTS if op in GIF_JOB_OPS else IMAGE_INPUTS, force,
+                              fingerprint, manifest)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    print(f"{len(todo)} to process, {skipped} up to date, {workers} workers, op {op} -> .{ext}")
+    if not todo:
+        return 0
+
+    ctx = multiprocessing.get_context(START_METHOD)
+    outputs = dict(todo)
+    start = time.perf_counter()
+    last_report = start
+    done = failed = in_bytes = out_bytes = 0
+    busy_s = 0.0
+    try:
+        with ctx.Pool(workers, _init_worker, (job_op, job_params)) as pool:
+            for path, size, out_size, seconds, error in pool.imap_unordered(_process, todo):
+                done += 1
+                in_bytes += size
+                out_bytes += out_size
+                busy_s += seconds
+                if error:
+                    failed += 1
+                    print(f"failed {os.path.relpath(path, src)}: {error}", file=sys.stderr)
+                else:
+                    manifest[os.path.relpath(outputs[path], dst)] = fingerprint
+                now = time.perf_counter()
+                if now - last_report >= report_every:
+                    print(_report(done, failed, len(todo), in_bytes, now - start), flush=True)
+                    save_manifest(dst, manifest)
+                    last_report = now
+    finally:
+        save_manifest(dst, manifest)
+
+    elapsed = time.perf_counter() - start
+    print(_report(done, failed, len(todo), in_bytes, elapsed))
+    print(f"{in_bytes / 1e6:.1f} MB in, {out_bytes / 1e6:.1f} MB out, "
+          f"{busy_s / done * 1000:.0f} ms per file, pool {busy_s / elapsed / workers:.0%} busy")
+    return failed
+
+
+def _parse_params(pairs: list[str]) -> dict:
+    params = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"parameter {pair!r} must be key=value")
+        params[key.strip()] = value
+    return params
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run one operation over every image under SRC, writing to DST.")
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("--op", required=True, choices=OPS)
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="operation parameter, as the HTTP form field of the same name")
+    parser.add_argument("--steps", help="pipeline steps as JSON, or @file")
+    parser.add_argument("-j", "--workers", type=int, help="processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="redo files whose output is up to date")
+    parser.add_argument("--report-every", type=float, default=2.0, metavar="SECONDS")
+    args = parser.parse_args(argv)
+
+    try:
+        params = _parse_params(args.param)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+    if args.steps:
+        if args.steps.startswith("@"):
+            with open(args.steps[1:]) as fh:
+                params["steps"] = json.load(fh)
+        else:
+            params["steps"] = args.steps
+    if not os.path.isdir(args.src):
+        parser.error(f"{args.src} is not a directory")
+    try:
+        failed = run(args.src, args.dst, args.op, params, args.workers, args.force, args.report_every)
+    except BatchError as exc:
+        parser.error(str(exc))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,403 @@
+# helper_pyton_scripts/bench_suite.py
+"""Time every server-side operation on synthetic fixtures and compare with a baseline.
+
+Run from the repo root:
+    python helper_pyton_scripts/bench_suite.py                   # full suite, compare with the baseline
+    python helper_pyton_scripts/bench_suite.py --quick -k gif    # smaller fixtures, only cases matching "gif"
+    python helper_pyton_scripts/bench_suite.py --save-baseline   # record this run as the baseline
+    python helper_pyton_scripts/bench_suite.py --check           # as the first, but a missing baseline fails
+
+Fixtures are JPEG photos with EXIF, flat-background product shots (PNG) and
+animated GIFs at several resolutions and frame counts. They are written to
+a temporary directory by a separate process. Each case then runs in a fresh
+process, so its peak RSS growth is its own. A case reports the best wall
+time over its repeats and the peak memory above what the loaded input
+already used. Results are written as JSON (``--output``). A case regresses
+when it is slower or larger than the baseline by more than the tolerance
+and by more than a small absolute margin. Regressions give exit code 1;
+with ``--check``, so does running without a baseline. Cases that need an
+optional package (rembg) are skipped when it is not installed.
+"""
+import argparse
+import base64
+import datetime
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BASELINE = os.path.join(ROOT, "helper_pyton_scripts", "bench_baseline.json")
+DEFAULT_OUTPUT = os.path.join(ROOT, "bench_results.json")
+
+PHOTO_MEGAPIXELS = {"full": (1, 4, 12), "quick": (1, 4)}
+SHOT_MEGAPIXELS = {"full": (1, 4, 12), "quick": (1, 4)}
+GIF_SHAPES = {"full": ((320, 240, 20), (320, 240, 100), (800, 600, 50)), "quick": ((320, 240, 20), (320, 240, 100))}
+# Seam carving is timed only up to this size; beyond it a single case takes minutes.
+SEAM_MAX_MEGAPIXELS = 4
+# Seams removed by the seam_engine cases, as a fraction of the width.
+SEAM_FRACTION = 0.05
+
+# A case regresses only past both the relative tolerance and these margins.
+MIN_SECONDS = 0.005
+MIN_PEAK_BYTES = 8 * 1024 * 1024
+
+
+def photo(megapixels: float, seed: int = 0) -> Image.Image:
+    """Smooth lighting, texture and a few hard edges, roughly like a photo."""
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    light = 0.6 + 0.4 * np.sin(xx / width * 3.1) * np.cos(yy / height * 2.3)
+    texture = np.sin(xx / 7.0) * np.sin(yy / 11.0) * 18
+    arr = np.stack([light * 200 + texture, light * 170 + texture * 0.5, light * 120 + 20], axis=-1)
+    arr += rng.normal(0, 5, size=arr.shape).astype(np.float32)
+    arr[height // 3:height // 2, width // 4:width // 2] = (40, 90, 150)
+    return Image.fromarray(arr.clip(0, 255).astype(np.uint8), "RGB")
+
+
+def _photo_exif() -> Image.Exif:
+    exif = Image.Exif()
+    exif[0x010F] = "Bench Camera Co."  # Make
+    exif[0x0110] = "Model 7"  # Model
+    exif[0x0132] = "2026:01:02 03:04:05"  # DateTime
+    exif[0x0131] = "bench_suite"  # Software
+    sub = exif.get_ifd(0x8769)
+    sub[0x829A] = 1 / 250  # ExposureTime
+    sub[0x829D] = 2.8  # FNumber
+    sub[0x8827] = 200  # ISOSpeedRatings
+    gps = exif.get_ifd(0x8825)
+    gps[1] = "N"
+    gps[2] = (52.0, 30.0, 0.0)
+    return exif
+
+
+def write_fixtures(folder: str, size: str) -> dict:
+    """Write every fixture for ``size`` ("full" or "quick"); return {name: path}."""
+    from benchmarks import animated_gif, product_shot
+
+    paths = {}
+    for megapixels in PHOTO_MEGAPIXELS[size]:
+        path = paths[f"photo-{megapixels}mp"] = os.path.join(folder, f"photo-{megapixels}mp.jpg")
+        photo(megapixels).save(path, quality=90, exif=_photo_exif())
+    for megapixels in SHOT_MEGAPIXELS[size]:
+        path = paths[f"shot-{megapixels}mp"] = os.path.join(folder, f"shot-{megapixels}mp.png")
+        product_shot(megapixels).save(path, compress_level=1)
+    for width, height, frames in GIF_SHAPES[size]:
+        name = f"gif-{width}x{height}x{frames}"
+        path = paths[name] = os.path.join(folder, f"{name}.gif")
+        animated_gif(path, frames, (width, height))
+    return paths
+
+
+def _src(module: str):
+    """``src.<module>``, imported only inside the case processes."""
+    return importlib.import_module(f"src.{module}")
+
+
+def _decoded(raw: bytes) -> Image.Image:
+    return _src("io_utils").bytes_to_image(raw)
+
+
+def _opened(raw: bytes) -> Image.Image:
+    return _src("io_utils").open_image(raw)
+
+
+def _data_url(raw: bytes) -> str:
+    return "data:image/gif;base64," + base64.b64encode(raw).decode("ascii")
+
+
+def _same(raw):
+    return raw
+
+
+def _decode_all_frames(raw: bytes) -> int:
+    gif_ops = _src("gif_ops")
+    return sum(1 for _ in gif_ops.iter_frames(gif_ops._b64_to_gif(raw)))
+
+
+def _seam(img: Image.Image):
+    return _src("seam").seam_carve.uncached(img, int(img.width * 0.95), img.height, "width-first", "backward")
+
+
+def _image_set(img: Image.Image) -> int:
+    exporter = _src("exporter")
+    widths, fmt_keys = exporter.parse_image_set(img, [480, 960, 1920], ["jpeg", "webp"])
+    return sum(len(chunk) for chunk in exporter.iter_image_set_zip(img, widths, fmt_keys, 85))
+
+
+def _gif(op: str, *args):
+    return lambda data: getattr(_src("gif_ops"), op).uncached(data, *args)
+
+
+def _pixels(raw: bytes):
+    return _src("seam")._pixels(_decoded(raw))
+
+
+def _pyramid_carve(pixels):
+    height, width = pixels.shape[:2]
+    return _src("seam_engine").carve(pixels, int(width * (1 - SEAM_FRACTION)), height, levels=2)
+
+
+def _seam_map(pixels):
+    width = pixels.shape[1]
+    return _src("seam_engine").removal_ranks(pixels, int(width * (1 - SEAM_FRACTION)), levels=2)
+
+
+def _with_seam_map(raw: bytes):
+    pixels = _pixels(raw)
+    return pixels, _seam_map(pixels)
+
+
+def _apply_seam_map(item):
+    pixels, ranks = item
+    return _src("seam_engine").apply_ranks(pixels, ranks, int(pixels.shape[1] * (1 - SEAM_FRACTION / 2)))
+
+
+PIPELINE_STEPS = [
+    {"op": "remove_background", "tolerance": 18},
+    {"op": "export", "format": "webp", "quality": 85, "profile": "fast"},
+]
+
+
+def _store_put_get(raw: bytes) -> int:
+    """Store an upload and read it back decoded, all in memory."""
+    store = _src("image_store").ImageStore(directory=None)
+    return store.get_image(store.put(raw)).width
+
+
+def _store_spill(raw: bytes) -> int:
+    """Push an upload out of a one-entry memory cap to disk, then read it back."""
+    store_module = _src("image_store")
+    with tempfile.TemporaryDirectory() as folder:
+        store = store_module.ImageStore(memory_bytes=len(raw) + 1, directory=folder)
+        handle = store.put(raw)
+        store.put(raw + b"\0")  # evicts the first upload to disk
+        return store.get_image(handle).width
+
+
+def _remove_bg_ai(proxy_max_side: int):
+    return lambda img: _src("bg_remove").remove_bg_ai.uncached(img, None, proxy_max_side)
+
+
+# name -> (fixture kind, prepare, run); ``prepare`` runs outside the timing.
+# src is imported lazily so the parent process stays small.
+CASES = {
+    "bytes_to_image": ("photo", _same, _decoded),
+    "reduced_decode": ("photo", _same, lambda raw: _src("io_utils").reduced_decode(_opened(raw))),
+    "exif_to_dict": ("photo", _opened, lambda img: _src("io_utils").exif_to_dict(img)),
+    "stats_for": ("photo", _opened, lambda img: _src("io_utils").stats_for(img)),
+    "convert_img.webp": ("photo", _decoded, lambda img: _src("ops").convert_img.uncached(img, "webp", 85)),
+    "prepare_download.jpeg": ("photo", _decoded, lambda img: _src("exporter").prepare_download(img, "jpeg", 90)),
+    "image_set": ("photo", _decoded, _image_set),
+    "image_to_bytes.png": ("shot", _decoded, lambda img: _src("io_utils").image_to_bytes(img, "PNG")),
+    "prepare_download.png": ("shot", _decoded, lambda img: _src("exporter").prepare_download(img, "png", 92)),
+    "remove_background": ("shot", _decoded, lambda img: _src("ops").remove_background.uncached(img, 18.0)),
+    "seam_carve": ("shot", _decoded, _seam),
+    "seam_engine.pyramid": ("shot", _pixels, _pyramid_carve),
+    "seam_engine.removal_ranks": ("shot", _pixels, _seam_map),
+    "seam_engine.apply_ranks": ("shot", _with_seam_map, _apply_seam_map),
+    "run_pipeline": ("shot", _decoded, lambda img: _src("pipeline").run_pipeline(img, PIPELINE_STEPS)),
+    "image_store.put_get": ("photo", _same, _store_put_get),
+    "image_store.spill": ("photo", _same, _store_spill),
+    "remove_bg_ai": ("shot", _decoded, _remove_bg_ai(0)),
+    "remove_bg_ai.proxy": ("shot", _decoded, _remove_bg_ai(1024)),
+    "gif_info": ("gif", _same, lambda raw: _src("gif_ops").gif_info(raw)),
+    "gif_decode_frames": ("gif", _same, _decode_all_frames),
+    "extract_gif_frames": ("gif", _same, lambda raw: _src("gif_ops").extract_gif_frames(raw, max_frames=10)),
+    "resize_gif": ("gif", _same, _gif("resize_gif", 160, 0, True)),
+    "resize_gif.dataurl": ("gif", _data_url, _gif("resize_gif", 160, 0, True)),
+    "resize_gif.webp": ("gif", _same, _gif("resize_gif", 160, 0, True, "webp")),
+    "trim_gif": ("gif", _same, _gif("trim_gif", 2, -3)),
+    "change_gif_speed": ("gif", _same, _gif("change_gif_speed", 1.5)),
+    "reverse_gif": ("gif", _same, _gif("reverse_gif")),
+    "pingpong_gif": ("gif", _same, _gif("pingpong_gif")),
+    "optimize_gif": ("gif", _same, _gif("optimize_gif", 64, 2)),
+    "poster_frame": ("gif", _same, _gif("poster_frame", 3)),
+    "gif_to_frames_zip": ("gif", _same, _gif("gif_to_frames_zip")),
+}
+
+# Cases that need optional packages; they are skipped when one is missing.
+CASE_REQUIRES = {
+    "remove_bg_ai": ("rembg", "onnxruntime"),
+    "remove_bg_ai.proxy": ("rembg", "onnxruntime"),
+}
+
+
+def missing_packages(name: str) -> list[str]:
+    return [package for package in CASE_REQUIRES.get(name, ()) if importlib.util.find_spec(package) is None]
+
+
+def _megapixels(fixture: str) -> float:
+    return float(fixture.split("-")[1].removesuffix("mp")) if fixture.endswith("mp") else 0.0
+
+
+def case_list(fixtures: dict, pattern: str | None = None) -> list[tuple[str, str, str]]:
+    """``(case id, case name, fixture)`` for every case and matching fixture."""
+    cases = []
+    for name, (kind, _, _) in CASES.items():
+        for fixture in fixtures:
+            if not fixture.startswith(kind + "-"):
+                continue
+            if name == "seam_carve" and _megapixels(fixture) > SEAM_MAX_MEGAPIXELS:
+                continue
+            case_id = f"{name}[{fixture}]"
+            if pattern is None or pattern in case_id:
+                cases.append((case_id, name, fixture))
+    return cases
+
+
+def run_case(name: str, path: str, repeat: int) -> dict:
+    """Run one case in this (fresh) process: best wall time and peak RSS growth."""
+    _, prepare, run = CASES[name]
+    # Cases that go through memoized code (run_pipeline) must not time cache hits.
+    _src("result_cache").RESULT_CACHE.resize(0)
+    with open(path, "rb") as fh:
+        subject = prepare(fh.read())
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    best = float("inf")
+    runs = 0
+    spent = 0.0
+    # Slow cases run once; the rest repeat up to ``repeat`` times within about a second.
+    while runs < repeat and (runs == 0 or spent < 1.0):
+        start = time.perf_counter()
+        run(subject)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        runs += 1
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before
+    return {"seconds": round(best, 5), "peak_bytes": peak, "runs": runs}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def machine() -> dict:
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list[str]:
+    """Lines describing every case that got slower or larger than the baseline."""
+    regressions = []
+    for case_id, now in results.items():
+        before = baseline.get(case_id)
+        if before is None:
+            continue
+        if (now["seconds"] > before["seconds"] * (1 + time_tolerance)
+                and now["seconds"] - before["seconds"] > MIN_SECONDS):
+            regressions.append(f"{case_id}: {before['seconds'] * 1000:.1f} -> {now['seconds'] * 1000:.1f} ms "
+                               f"({now['seconds'] / before['seconds']:.2f}x)")
+        if (now["peak_bytes"] > before["peak_bytes"] * (1 + memory_tolerance)
+                and now["peak_bytes"] - before["peak_bytes"] > MIN_PEAK_BYTES):
+            regressions.append(f"{case_id}: peak {before['peak_bytes'] / 1e6:.0f} -> "
+                               f"{now['peak_bytes'] / 1e6:.0f} MB")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the server-side operations.")
+    parser.add_argument("--quick", action="store_true", help="only the smaller fixtures")
+    parser.add_argument("-k", dest="pattern", help="only cases whose id contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, best one counts (default 3)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="results JSON (default: %(default)s)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON (default: %(default)s)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--save-baseline", action="store_true", help="also write the results as the baseline")
+    mode.add_argument("--check", action="store_true", help="fail when there is no baseline to compare with")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="allowed slowdown (default 0.25)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.20, help="allowed peak growth (default 0.20)")
+    args = parser.parse_args(argv)
+    size = "quick" if args.quick else "full"
+    if args.check and not os.path.exists(args.baseline):
+        print(f"error: no baseline at {os.path.relpath(args.baseline)}, so nothing can be checked. "
+              f"Record one on this machine with --save-baseline and commit it.", file=sys.stderr)
+        return 1
+
+    skipped = {name: missing for name in CASES
+               if (args.pattern is None or args.pattern in name) and (missing := missing_packages(name))}
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Children inherit the parent's peak RSS, so fixtures are made in another process.
+        with ctx.Pool(1) as pool:
+            fixtures = pool.apply(write_fixtures, (tmp, size))
+        cases = [case for case in case_list(fixtures, args.pattern) if case[1] not in skipped]
+        print(f"{len(cases)} cases on {len(fixtures)} fixtures")
+        for name, missing in skipped.items():
+            print(f"skipped {name}: {', '.join(missing)} not installed")
+        print(f"{'case':<44} {'ms':>10} {'peak MB':>9} {'runs':>5}")
+        with ctx.Pool(1, maxtasksperchild=1) as pool:
+            for case_id, name, fixture in cases:
+                result = pool.apply(run_case, (name, fixtures[fixture], args.repeat))
+                results[case_id] = result
+                print(f"{case_id:<44} {result['seconds'] * 1000:>10.1f} {result['peak_bytes'] / 1e6:>9.1f} "
+                      f"{result['runs']:>5}", flush=True)
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "fixtures": size,
+        "machine": machine(),
+        "results": results,
+    }
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"results written to {os.path.relpath(args.output)}")
+
+    failed = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if baseline.get("machine") != report["machine"]:
+            print(f"note: the baseline was recorded on a different machine ({baseline.get('machine')})")
+        regressions = compare(results, baseline.get("results", {}), args.time_tolerance, args.memory_tolerance)
+        compared = sum(case_id in baseline.get("results", {}) for case_id in results)
+        print(f"{compared} cases compared with {os.path.relpath(args.baseline)} "
+              f"(commit {baseline.get('commit')}): {len(regressions)} regressions")
+        for line in regressions:
+            print(f"  regression: {line}")
+        failed = 1 if regressions else 0
+    elif not args.save_baseline:
+        print(f"no baseline at {os.path.relpath(args.baseline)}; record one with --save-baseline")
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fh:
+                # Keep cases this run skipped (with -k or --quick).
+                report["results"] = json.load(fh).get("results", {}) | results
+        with open(args.baseline, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"baseline written to {os.path.relpath(args.baseline)}")
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,956 @@
+# helper_pyton_scripts/benchmarks.py
+"""Ad-hoc timing checks for the server-side image operations.
+
+Run from the repo root:
+    python helper_pyton_scripts/benchmarks.py [flood transport ...]
+"""
+from collections import deque
+import base64
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.ops import _flood_background, _flood_background_banded, remove_background  # noqa: E402
+
+
+def _reference_flood(similar: np.ndarray) -> np.ndarray:
+    """The original per-pixel BFS, kept here to check the vectorized version."""
+    height, width = similar.shape
+    visited = np.zeros_like(similar, dtype=bool)
+    queue = deque()
+
+    def enqueue(x, y):
+        if 0 <= x < width and 0 <= y < height and similar[y, x] and not visited[y, x]:
+            visited[y, x] = True
+            queue.append((x, y))
+
+    for x in range(width):
+        enqueue(x, 0)
+        enqueue(x, height - 1)
+    for y in range(height):
+        enqueue(0, y)
+        enqueue(width - 1, y)
+
+    while queue:
+        x, y = queue.popleft()
+        enqueue(x + 1, y)
+        enqueue(x - 1, y)
+        enqueue(x, y + 1)
+        enqueue(x, y - 1)
+
+    return visited
+
+
+def product_shot_with_mask(megapixels: float, seed: int = 0) -> tuple[Image.Image, Image.Image]:
+    """A noisy flat background with a few solid shapes, plus their foreground mask."""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+    arr = np.full((height, width, 3), 236, dtype=np.int16)
+    arr += rng.integers(-6, 7, size=arr.shape, dtype=np.int16)
+    img = Image.fromarray(arr.clip(0, 255).astype(np.uint8), "RGB")
+    mask = Image.new("L", img.size, 0)
+    shapes = [
+        ("ellipse", (width * 0.2, height * 0.2, width * 0.6, height * 0.8), (180, 40, 40)),
+        ("rectangle", (width * 0.55, height * 0.35, width * 0.85, height * 0.9), (30, 60, 160)),
+    ]
+    for kind, box, color in shapes:
+        getattr(ImageDraw.Draw(img), kind)(box, fill=color)
+        getattr(ImageDraw.Draw(mask), kind)(box, fill=255)
+    return img, mask
+
+
+def product_shot(megapixels: float, seed: int = 0) -> Image.Image:
+    return product_shot_with_mask(megapixels, seed)[0]
+
+
+def _timed(fn, *args, repeat: int = 1):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def bench_transport():
+    """Compare peak Python allocations for JSON/base64 and binary requests."""
+    from app import app
+
+    client = app.test_client()
+    img = product_shot(2)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    raw = buf.getvalue()
+    data_url = "data:image/png;base64," + base64.b64encode(raw).decode("ascii")
+
+    json_peak, json_resp = _peak_bytes(lambda: client.post(
+        "/api/background_remove", json={"image": data_url, "tolerance": 18}))
+    raw_peak, raw_resp = _peak_bytes(lambda: client.post(
+        "/api/background_remove?tolerance=18", data=raw, content_type="image/png"))
+    assert json_resp.status_code == 200 and raw_resp.status_code == 200
+    assert raw_resp.mimetype == "image/png"
+
+    print(f"transport: {len(raw) / 1e6:.2f} MB PNG input")
+    print(f"{'variant':>8} {'peak MB':>9} {'response MB':>12}")
+    print(f"{'json':>8} {json_peak / 1e6:>9.2f} {len(json_resp.data) / 1e6:>12.2f}")
+    print(f"{'binary':>8} {raw_peak / 1e6:>9.2f} {len(raw_resp.data) / 1e6:>12.2f}")
+    if raw_peak >= json_peak:
+        print("transport: binary request did not lower peak allocations")
+        return 1
+    return 0
+
+
+def bench_cache():
+    """Time a cold remove_background call against a memoized repeat."""
+    from src.result_cache import RESULT_CACHE
+
+    img = product_shot(12)
+    RESULT_CACHE.clear()
+    cold_s, cold = _timed(remove_background, img, 18.0)
+    warm_s, warm = _timed(remove_background, img, 18, repeat=3)
+    assert np.array_equal(np.asarray(cold), np.asarray(warm))
+    print(f"cache: 12 MP remove_background cold {cold_s:.3f}s, cached {warm_s * 1000:.1f}ms")
+    print(f"cache: {RESULT_CACHE.stats()}")
+
+
+def bench_rembg_proxy():
+    """Quality and latency of proxy-resolution AI background removal at 12/24/48 MP.
+
+    Without rembg installed, only the mask upsampler is measured against a
+    synthetic ground truth (and compared to plain bilinear upsampling).
+    """
+    from src import bg_remove
+
+    sides = (1024, 2048)
+    print(f"{'MP':>4} {'mode':>12} {'seconds':>9} {'alpha MAE':>10} {'IoU':>7}")
+    for megapixels in (12, 24, 48):
+        img, mask = product_shot_with_mask(megapixels)
+        if bg_remove.HAS_REMBG:
+            full_s, full = _timed(bg_remove.remove_bg_ai.uncached, img, None, 0)
+            truth = np.asarray(full.getchannel("A"))
+            print(f"{megapixels:>4} {'full':>12} {full_s:>9.2f} {0.0:>10.2f} {1.0:>7.3f}")
+        else:
+            truth = np.asarray(mask)
+
+        for side in sides:
+            if bg_remove.HAS_REMBG:
+                run_s, out = _timed(bg_remove.remove_bg_ai.uncached, img, None, side)
+                alpha = np.asarray(out.getchannel("A"))
+                label = f"proxy {side}"
+            else:
+                scale = side / max(img.size)
+                low = mask.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.BOX)
+                run_s, up = _timed(bg_remove._upsample_mask, low, img)
+                alpha = np.asarray(up)
+                bilinear = np.asarray(low.resize(img.size, Image.Resampling.BILINEAR))
+                bl_mae = np.abs(bilinear.astype(np.int16) - truth).mean()
+                print(f"{megapixels:>4} {f'bilinear {side}':>12} {'':>9} {bl_mae:>10.2f} {'':>7}")
+                label = f"guided {side}"
+            mae = np.abs(alpha.astype(np.int16) - truth).mean()
+            fg, fg_truth = alpha >= 128, truth >= 128
+            iou = np.count_nonzero(fg & fg_truth) / max(1, np.count_nonzero(fg | fg_truth))
+            print(f"{megapixels:>4} {label:>12} {run_s:>9.2f} {mae:>10.2f} {iou:>7.3f}")
+
+
+def bench_flood():
+    rng = np.random.default_rng(1)
+    for shape in [(64, 64), (200, 300), (480, 640)]:
+        for density in (0.45, 0.6, 0.8):
+            similar = rng.random(shape) < density
+            reference = _reference_flood(similar)
+            assert np.array_equal(_flood_background(similar), reference), (shape, density)
+            for rows in (1, 7, 64):
+                assert np.array_equal(_flood_background_banded(similar, rows), reference), (shape, density, rows)
+    print("flood: vectorized and banded fills match the BFS reference")
+
+    print(f"{'MP':>6} {'flood s':>9} {'remove_background s':>20}")
+    for megapixels in (1, 4, 12, 24):
+        img = product_shot(megapixels)
+        arr = np.asarray(img, dtype=np.float32)
+        similar = np.linalg.norm(arr - 236.0, axis=2) <= 30.0
+        flood_s, _ = _timed(_flood_background, similar)
+        full_s, _ = _timed(remove_background.uncached, img, 18.0)
+        print(f"{megapixels:>6} {flood_s:>9.3f} {full_s:>20.3f}")
+
+
+def bench_seam():
+    """Built-in seam carving: shrink and enlarge on both axes, both energy modes."""
+    from src import seam_engine
+
+    img = np.asarray(product_shot(0.48))
+    height, width = img.shape[:2]
+    cases = [
+        ("shrink width 25%", int(width * 0.75), height),
+        ("shrink height 25%", width, int(height * 0.75)),
+        ("enlarge width 25%", int(width * 1.25), height),
+        ("both axes -15%", int(width * 0.85), int(height * 0.85)),
+    ]
+    print(f"input {width}x{height}")
+    print(f"{'case':>20} {'backward s':>11} {'forward s':>10}")
+    for label, target_w, target_h in cases:
+        row = []
+        for mode in seam_engine.ENERGY_MODES:
+            run_s, out = _timed(seam_engine.carve, img, target_w, target_h, "width-first", mode)
+            assert out.shape[:2] == (target_h, target_w), (label, mode, out.shape)
+            row.append(run_s)
+        print(f"{label:>20} {row[0]:>11.2f} {row[1]:>10.2f}")
+
+
+def bench_seam_map():
+    """Slider-style seam carving: build the seam-order map once, then many widths."""
+    from src.result_cache import RESULT_CACHE
+    from src.seam import seam_carve, seam_carve_precomputed
+
+    img = product_shot(0.48)
+    RESULT_CACHE.clear()
+    targets = [int(img.width * f) for f in (0.95, 0.85, 0.7, 0.55, 0.4, 1.1, 1.3)]
+    build_s, _ = _timed(seam_carve_precomputed, img, targets[0], img.height)
+    print(f"input {img.width}x{img.height}, map build + first target: {build_s:.2f}s")
+    print(f"{'target':>7} {'from map ms':>12} {'full carve s':>13}")
+    for target in targets[1:]:
+        map_s, _ = _timed(seam_carve_precomputed, img, target, img.height, repeat=3)
+        full_s, _ = _timed(seam_carve.uncached, img, target, img.height, "width-first", "backward")
+        print(f"{target:>7} {map_s * 1000:>12.1f} {full_s:>13.2f}")
+
+
+# Pyramid carving may remove at most this much more energy than exact carving.
+PYRAMID_ENERGY_BOUND = 2.0
+
+
+def bench_seam_pyramid():
+    """Pyramid vs exact seam search: speed, and removed energy relative to exact.
+
+    Removing a tenth of the width; exact carving is timed in full up to 4 MP
+    and extrapolated from a few seams above that.
+    """
+    from src import seam_engine
+
+    failed = 0
+    print(f"{'MP':>5} {'mode':>9} {'exact s':>9} {'pyramid s':>10} {'speedup':>8} {'energy ratio':>13}")
+    for megapixels in (1, 4, 24):
+        pixels = np.asarray(product_shot(megapixels, seed=3))
+        height, width = pixels.shape[:2]
+        count = width // 10
+        energy = seam_engine.backward_energy(seam_engine.luminance(pixels))
+        for mode in seam_engine.ENERGY_MODES:
+            pyramid_s, approx = _timed(seam_engine.pyramid_seam_order, pixels, count, mode, 2)
+            if megapixels <= 4:
+                exact_s, exact = _timed(seam_engine.seam_order, pixels, count, mode)
+                exact_energy = energy[seam_engine._removed_mask(height, width, exact)].sum()
+                ratio = energy[seam_engine._removed_mask(height, width, approx)].sum() / exact_energy
+                ratio_text = f"{ratio:.3f}"
+                failed |= ratio > PYRAMID_ENERGY_BOUND
+            else:
+                sample_s, _ = _timed(seam_engine.seam_order, pixels, 3, mode)
+                exact_s = sample_s / 3 * count
+                ratio_text = "-"
+            print(f"{megapixels:>5} {mode:>9} {exact_s:>9.1f} {pyramid_s:>10.1f} "
+                  f"{exact_s / pyramid_s:>7.1f}x {ratio_text:>13}")
+    if failed:
+        print(f"seam_pyramid: removed energy exceeded {PYRAMID_ENERGY_BOUND}x exact")
+    return failed
+
+
+def animated_gif(path: str, frames: int, size: tuple[int, int] = (800, 600)):
+    """Write a test animation (gradient with a moving disc) without holding its frames."""
+    from src.gif_stream import GifWriter
+
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, np.full_like(xx, 96)], axis=-1).astype(np.uint8)
+    with open(path, "wb") as fh:
+        writer = GifWriter(fh)
+        for index in range(frames):
+            cx = width * (0.2 + 0.6 * (index % 50) / 50)
+            disc = (xx - cx) ** 2 + (yy - height / 2) ** 2 < (height / 6) ** 2
+            frame = base.copy()
+            frame[disc] = (240, 220, 40)
+            writer.add(Image.fromarray(frame).convert("RGBA"), 40)
+        writer.close()
+
+
+def _hold_all_frames(ops, raw):
+    """What every transform used to do first: keep all frames as RGBA copies."""
+    frames = [frame.copy() for frame, _ in ops.iter_frames(ops._b64_to_gif(raw))]
+    return b"x" * len(frames)
+
+
+@contextlib.contextmanager
+def _without_blocks():
+    """Force the GIF transforms onto their decode and re-encode path."""
+    from src import gif_ops
+
+    saved = gif_ops._blocks
+    gif_ops._blocks = lambda data: None
+    try:
+        yield
+    finally:
+        gif_ops._blocks = saved
+
+
+def _composited(raw: bytes) -> list[np.ndarray]:
+    """Decoded RGBA frames with fully transparent pixels zeroed, for comparisons."""
+    from src import gif_ops
+
+    frames = []
+    for frame, _ in gif_ops.iter_frames(gif_ops._b64_to_gif(raw)):
+        pixels = np.asarray(frame).copy()
+        pixels[pixels[..., 3] < 128] = 0
+        frames.append(pixels)
+    return frames
+
+
+GIF_RSS_OPS = {
+    "hold_all": _hold_all_frames,
+    "resize": lambda ops, raw: ops.resize_gif.uncached(raw, 400, 0, True),
+    "speed": lambda ops, raw: ops.change_gif_speed.uncached(raw, 2.0),
+    "pingpong": lambda ops, raw: ops.pingpong_gif.uncached(raw),
+    "optimize": lambda ops, raw: ops.optimize_gif.uncached(raw, 64, 2),
+    "frames_zip": lambda ops, raw: ops.gif_to_frames_zip.uncached(raw),
+    "zip_stream": lambda ops, raw: sum(len(chunk) for chunk in ops.iter_frames_zip(raw)),
+}
+
+
+def _gif_peak_rss(op: str, path: str) -> tuple[int, int]:
+    """Run one GIF op in this (fresh) process; return (peak RSS, output bytes)."""
+    from src import gif_ops
+
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    with _without_blocks():
+        out = GIF_RSS_OPS[op](gif_ops, raw)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, out if isinstance(out, int) else len(out)
+
+
+def bench_gif_memory():
+    """Peak RSS of the GIF transforms at 100 and 400 frames of 800x600.
+
+    Each run happens in a fresh process. Fails if the extra 300 frames cost
+    more than a quarter of an RGBA frame each in peak memory, i.e. if frames
+    are being held instead of streamed. ``hold_all`` is the old behaviour,
+    shown for reference.
+    """
+    width, height = 800, 600
+    frame_bytes = width * height * 4
+    ctx = multiprocessing.get_context("spawn")
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for frames in (100, 400):
+            paths[frames] = os.path.join(tmp, f"anim_{frames}.gif")
+            animated_gif(paths[frames], frames, (width, height))
+        print(f"input: {os.path.getsize(paths[400]) / 1e6:.1f} MB for 400 frames; one RGBA frame is {frame_bytes / 1e6:.2f} MB")
+        print(f"{'op':>11} {'peak 100 fr MB':>15} {'peak 400 fr MB':>15} {'per extra frame KB':>19} {'out 400 MB':>11}")
+        for op in GIF_RSS_OPS:
+            peaks = {}
+            for frames, path in paths.items():
+                with ctx.Pool(1) as pool:
+                    peaks[frames] = pool.apply(_gif_peak_rss, (op, path))
+            per_frame = (peaks[400][0] - peaks[100][0]) / 300
+            if op != "hold_all":
+                failed |= per_frame > frame_bytes / 4
+            print(f"{op:>11} {peaks[100][0] / 1e6:>15.1f} {peaks[400][0] / 1e6:>15.1f} "
+                  f"{per_frame / 1e3:>19.1f} {peaks[400][1] / 1e6:>11.1f}")
+    if failed:
+        print("gif_memory: peak memory grows with frame count")
+    return failed
+
+
+GIF_PALETTE_OPS = {
+    "reverse": ("reverse_gif", ()),
+    "speed": ("change_gif_speed", (1.5,)),
+    "resize": ("resize_gif", (200, 0)),
+    "optimize": ("optimize_gif", (64, 1)),
+}
+
+
+def bench_gif_palette():
+    """Per-frame local palettes vs one shared global palette, on 60 frames of 400x300.
+
+    ``local src`` has a color table per frame (the old output), ``global src``
+    one global table that the reordering ops can reuse as is. Fails if reusing
+    the source palette is not lossless, or if the shared palette makes any
+    output more than 5% larger.
+    """
+    from src import gif_ops, gif_stream
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 60, (400, 300))
+        with open(path, "rb") as fh:
+            sources = {"local src": fh.read()}
+    sources["global src"] = gif_ops.optimize_gif.uncached(sources["local src"], 256)
+
+    print(f"{'source':>10} {'op':>9} {'local ms':>9} {'global ms':>10} {'local KB':>9} {'global KB':>10}")
+    saved_mode = gif_stream.PALETTE_MODE
+    try:
+        for source, raw in sources.items():
+            for name, (op, args) in GIF_PALETTE_OPS.items():
+                fn = getattr(gif_ops, op).uncached
+                results = {}
+                for mode in ("local", "global"):
+                    gif_stream.PALETTE_MODE = mode
+                    with _without_blocks():
+                        results[mode] = _timed(fn, raw, *args, repeat=3)
+                (local_s, local_out), (global_s, global_out) = results["local"], results["global"]
+                failed |= len(global_out) > len(local_out) * 1.05
+                print(f"{source:>10} {name:>9} {local_s * 1000:>9.0f} {global_s * 1000:>10.0f} "
+                      f"{len(local_out) / 1e3:>9.1f} {len(global_out) / 1e3:>10.1f}")
+    finally:
+        gif_stream.PALETTE_MODE = saved_mode
+
+    source = _composited(sources["global src"])
+    with _without_blocks():
+        reversed_frames = _composited(gif_ops.reverse_gif.uncached(sources["global src"]))
+    lossless = len(source) == len(reversed_frames) and all(
+        np.array_equal(a, b) for a, b in zip(source[::-1], reversed_frames)
+    )
+    print(f"reverse of global src lossless: {lossless}")
+    failed |= not lossless
+    if failed:
+        print("gif_palette: shared palette output is lossy or larger than per-frame palettes")
+    return failed
+
+
+GIF_DELTA_OPS = {
+    "reverse": ("reverse_gif", ()),
+    "pingpong": ("pingpong_gif", ()),
+    "trim": ("trim_gif", (5, 45)),
+    "resize": ("resize_gif", (200, 0)),
+    "optimize": ("optimize_gif", (64, 1)),
+}
+
+
+def bench_gif_delta():
+    """Full frames vs changed-rectangle delta frames, on 60 frames of 400x300.
+
+    Fails if a delta output is not smaller, or if the ops that keep the
+    source palette decode to different frames with and without deltas.
+    """
+    from src import gif_ops, gif_stream
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 60, (400, 300))
+        with open(path, "rb") as fh:
+            raw = gif_ops.optimize_gif.uncached(fh.read(), 256)
+
+    failed = 0
+    print(f"{'op':>9} {'full ms':>8} {'delta ms':>9} {'full KB':>8} {'delta KB':>9} {'same frames':>12}")
+    saved = gif_stream.DELTA_FRAMES
+    try:
+        for name, (op, args) in GIF_DELTA_OPS.items():
+            fn = getattr(gif_ops, op).uncached
+            results = {}
+            for delta in (False, True):
+                gif_stream.DELTA_FRAMES = delta
+                with _without_blocks():
+                    results[delta] = _timed(fn, raw, *args, repeat=3)
+            (full_s, full_out), (delta_s, delta_out) = results[False], results[True]
+            full_frames, delta_frames = _composited(full_out), _composited(delta_out)
+            same = len(full_frames) == len(delta_frames) and all(
+                np.array_equal(a, b) for a, b in zip(full_frames, delta_frames)
+            )
+            failed |= len(delta_out) >= len(full_out)
+            if name in ("reverse", "pingpong", "trim"):
+                failed |= not same
+            print(f"{name:>9} {full_s * 1000:>8.0f} {delta_s * 1000:>9.0f} {len(full_out) / 1e3:>8.1f} "
+                  f"{len(delta_out) / 1e3:>9.1f} {str(same):>12}")
+    finally:
+        gif_stream.DELTA_FRAMES = saved
+    if failed:
+        print("gif_delta: delta frames are larger or decode differently")
+    return failed
+
+
+GIF_THREAD_OPS = {
+    "resize": ("resize_gif", (1200, 0)),
+    "optimize": ("optimize_gif", (64, 1)),
+    "reverse": ("reverse_gif", ()),
+    "frames_zip": ("gif_to_frames_zip", ()),
+}
+
+
+def _zip_members(raw: bytes) -> list:
+    with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+        return [(name, archive.read(name)) for name in archive.namelist()]
+
+
+def bench_gif_threads():
+    """Frame-parallel GIF transforms at 1, 2, 4 and 8 threads (40 frames of 800x600).
+
+    Speedup depends on the cores available; the bench fails only if the
+    output changes with the thread count.
+    """
+    from src import gif_ops, gif_stream
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 40, (800, 600))
+        with open(path, "rb") as fh:
+            raw = fh.read()
+
+    counts = (1, 2, 4, 8)
+    print(f"{os.cpu_count()} cores available")
+    print(f"{'op':>11} " + " ".join(f"{f'{n} thr ms':>9}" for n in counts) + f" {'speedup@4':>10}")
+    failed = 0
+    saved = gif_stream.GIF_THREADS
+    try:
+        for name, (op, args) in GIF_THREAD_OPS.items():
+            fn = getattr(gif_ops, op).uncached
+            times, outputs = {}, {}
+            for threads in counts:
+                gif_stream.GIF_THREADS = threads
+                with _without_blocks():
+                    times[threads], out = _timed(fn, raw, *args, repeat=2)
+                outputs[threads] = _zip_members(out) if op == "gif_to_frames_zip" else out
+            failed |= any(outputs[n] != outputs[1] for n in counts)
+            print(f"{name:>11} " + " ".join(f"{times[n] * 1000:>9.0f}" for n in counts)
+                  + f" {times[1] / times[4]:>9.2f}x")
+    finally:
+        gif_stream.GIF_THREADS = saved
+    if failed:
+        print("gif_threads: output depends on the thread count")
+    return failed
+
+
+def bench_gif_blocks():
+    """Block-level timing and order edits vs decoding, on 60 full frames of 400x300.
+
+    Fails if a block-level result does not decode to exactly the source
+    frames (reordered or trimmed) with the expected delays.
+    """
+    from src import gif_ops
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 60, (400, 300))
+        with open(path, "rb") as fh:
+            raw = fh.read()
+
+    source = _composited(raw)
+    count = len(source)
+    cases = {
+        "info": (gif_ops.gif_info, (), None),
+        "speed": (gif_ops.change_gif_speed.uncached, (2.0,), list(range(count))),
+        "trim": (gif_ops.trim_gif.uncached, (10, 40), list(range(10, 40))),
+        "reverse": (gif_ops.reverse_gif.uncached, (), list(range(count - 1, -1, -1))),
+        "pingpong": (gif_ops.pingpong_gif.uncached, (), list(range(count)) + list(range(count - 2, 0, -1))),
+    }
+    failed = 0
+    print(f"{'op':>9} {'blocks ms':>10} {'decode ms':>10} {'lossless':>9}")
+    for name, (fn, args, order) in cases.items():
+        block_s, out = _timed(fn, raw, *args, repeat=3)
+        with _without_blocks():
+            decode_s, _ = _timed(fn, raw, *args)
+        lossless = True
+        if order is not None:
+            frames = _composited(out)
+            lossless = len(frames) == len(order) and all(
+                np.array_equal(frame, source[index]) for frame, index in zip(frames, order)
+            )
+        failed |= not lossless
+        print(f"{name:>9} {block_s * 1000:>10.2f} {decode_s * 1000:>10.0f} {str(lossless):>9}")
+    if failed:
+        print("gif_blocks: block-level edits changed the frames")
+    return failed
+
+
+ANIM_FORMAT_OPS = {
+    "reverse": ("reverse_gif", ()),
+    "speed": ("change_gif_speed", (2.0,)),
+    "resize": ("resize_gif", (200, 0, True)),
+    "optimize": ("optimize_gif", (64, 1)),
+}
+
+
+def bench_anim_formats():
+    """Output size vs encode time per animation format, on 60 frames of 400x300.
+
+    GIF runs its decode and re-encode path so every format does the same
+    work. Fails if lossless WebP or APNG output of the reorder and retime
+    ops does not decode to exactly the source frames.
+    """
+    from src import gif_ops
+    from src.anim_stream import ANIMATION_FORMATS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 60, (400, 300))
+        with open(path, "rb") as fh:
+            raw = fh.read()
+
+    source = _composited(raw)
+    failed = 0
+    print(f"{'op':>9} {'format':>14} {'ms':>7} {'KB':>8} {'vs gif':>7} {'lossless':>9}")
+    for name, (op, args) in ANIM_FORMAT_OPS.items():
+        fn = getattr(gif_ops, op).uncached
+        gif_size = None
+        for fmt in ANIMATION_FORMATS:
+            with _without_blocks():
+                seconds, out = _timed(fn, raw, *args, fmt, repeat=2)
+            gif_size = gif_size or len(out)
+            lossless = ""
+            if name in ("reverse", "speed"):
+                frames = _composited(out)
+                expected = source[::-1] if name == "reverse" else source
+                same = len(frames) == len(expected) and all(np.array_equal(a, b) for a, b in zip(frames, expected))
+                lossless = str(same)
+                if fmt in ("webp_lossless", "apng"):
+                    failed |= not same
+            print(f"{name:>9} {fmt:>14} {seconds * 1000:>7.0f} {len(out) / 1e3:>8.1f} "
+                  f"{len(out) / gif_size:>6.2f}x {lossless:>9}")
+    if failed:
+        print("anim_formats: lossless WebP/APNG output changed the frames")
+    return failed
+
+
+FRAMES_ZIP_SETTINGS = [(6, True), (1, False), (6, False), (9, False)]
+
+
+def bench_frames_zip():
+    """Frame ZIP export per PNG level and archive compression, on 120 frames of 400x300.
+
+    (6, deflated) is the old fixed setting. Fails if a streamed archive is
+    not a valid ZIP of every frame, or if its PNGs differ from the frames.
+    """
+    from src import gif_ops
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "anim.gif")
+        animated_gif(path, 120, (400, 300))
+        with open(path, "rb") as fh:
+            raw = fh.read()
+
+    source = _composited(raw)
+    failed = 0
+    print(f"{'png level':>9} {'archive':>9} {'ms':>7} {'KB':>8} {'largest chunk KB':>17} {'valid':>6}")
+    for level, deflate in FRAMES_ZIP_SETTINGS:
+        chunks = []
+        start = time.perf_counter()
+        for chunk in gif_ops.iter_frames_zip(raw, level, deflate):
+            chunks.append(chunk)
+        seconds = time.perf_counter() - start
+        archive = b"".join(chunks)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+            names = zf.namelist()
+            valid = zf.testzip() is None and len(names) == len(source) and all(
+                np.array_equal(np.asarray(Image.open(io.BytesIO(zf.read(name))).convert("RGBA")) * (frame[..., 3:] > 0),
+                               frame)
+                for name, frame in zip(names, source)
+            )
+        failed |= not valid
+        print(f"{level:>9} {'deflated' if deflate else 'stored':>9} {seconds * 1000:>7.0f} {len(archive) / 1e3:>8.1f} "
+              f"{max(map(len, chunks)) / 1e3:>17.1f} {str(valid):>6}")
+    if failed:
+        print("frames_zip: streamed archive is invalid or its frames differ")
+    return failed
+
+
+def _inspect_run(path: str, reduced: bool) -> tuple[float, int, list]:
+    """Inspect one file in this (fresh) process; return (seconds, peak RSS growth, mean RGB)."""
+    from PIL import ImageStat
+    from src.io_utils import exif_to_dict, open_image, stats_for
+
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    start = time.perf_counter()
+    if reduced:
+        img = open_image(raw)
+        mean = stats_for(img)["mean_rgb"]
+    else:
+        # The old path: full decode, then a full-size RGB copy for the mean.
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+        mean = [int(x) for x in ImageStat.Stat(img.convert("RGB")).mean]
+    exif_to_dict(img)
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before, list(mean)
+
+
+def _write_photos(paths: dict):
+    img = product_shot(50)
+    img.save(paths["jpeg"], quality=90)
+    img.save(paths["png"], compress_level=1)
+
+
+def bench_inspect():
+    """Upload inspection with full vs reduced decoding, on 50 MP JPEG and PNG photos.
+
+    Each run happens in a fresh process. Fails if the reduced JPEG path is
+    not at least 5x faster with a tenth of the memory, or if a mean color
+    moves by more than 2 levels.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"jpeg": os.path.join(tmp, "photo.jpg"), "png": os.path.join(tmp, "photo.png")}
+        # Children inherit the parent's peak RSS, so the 50 MP image is made elsewhere too.
+        with ctx.Pool(1) as pool:
+            pool.apply(_write_photos, (paths,))
+        print(f"{'format':>7} {'path':>8} {'ms':>8} {'peak MB':>9} {'mean rgb':>16}")
+        for fmt, path in paths.items():
+            runs = {}
+            for reduced in (False, True):
+                with ctx.Pool(1) as pool:
+                    runs[reduced] = pool.apply(_inspect_run, (path, reduced))
+                seconds, peak, mean = runs[reduced]
+                print(f"{fmt:>7} {'reduced' if reduced else 'full':>8} {seconds * 1000:>8.0f} {peak / 1e6:>9.1f} "
+                      f"{str(tuple(mean)):>16}")
+            failed |= max(abs(a - b) for a, b in zip(runs[False][2], runs[True][2])) > 2
+            if fmt == "jpeg":
+                failed |= runs[True][0] * 5 > runs[False][0] or runs[True][1] * 10 > runs[False][1]
+    if failed:
+        print("inspect: reduced decoding is too slow, too large or changes the mean color")
+    return failed
+
+
+def _reference_remove_background(img: Image.Image, tol: float) -> Image.Image:
+    """The original whole-frame float32 remove_background, to check the banded one."""
+    from PIL import ImageFilter
+
+    arr = np.array(img.convert("RGBA"), dtype=np.uint8)
+    rgb = arr[:, :, :3].astype(np.float32)
+    border = np.concatenate([rgb[0, :, :], rgb[-1, :, :], rgb[:, 0, :], rgb[:, -1, :]], axis=0)
+    background_color = np.median(border, axis=0)
+    distance = np.linalg.norm(rgb - background_color, axis=2)
+    threshold = max(8.0, 12.0 + (tol / 100.0) * 120.0)
+    connected_bg = _flood_background(distance <= threshold)
+    soft_lo = threshold * 0.62
+    soft_hi = threshold * 1.55
+    soft_alpha = np.clip((distance - soft_lo) / max(1.0, soft_hi - soft_lo), 0.0, 1.0) * 255.0
+    alpha = arr[:, :, 3].astype(np.float32)
+    alpha[connected_bg] = np.minimum(alpha[connected_bg], soft_alpha[connected_bg])
+    alpha_img = Image.fromarray(alpha.astype(np.uint8), "L")
+    alpha_img = alpha_img.filter(ImageFilter.GaussianBlur(radius=max(0.8, tol / 24.0)))
+    alpha = np.array(alpha_img, dtype=np.uint8)
+    return Image.fromarray(np.dstack([rgb.astype(np.uint8), alpha]), "RGBA")
+
+
+def _save_product_shot(megapixels: float, path: str):
+    product_shot(megapixels).save(path, compress_level=1)
+
+
+def _bg_peak_run(path: str, banded: bool) -> tuple[float, int, str]:
+    """remove_background in this (fresh) process; return (seconds, peak RSS growth, output digest)."""
+    import hashlib
+
+    img = Image.open(path)
+    img.load()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    start = time.perf_counter()
+    out = remove_background.uncached(img, 18.0) if banded else _reference_remove_background(img, 18.0)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before
+    return seconds, peak, hashlib.blake2b(out.tobytes(), digest_size=16).hexdigest()
+
+
+def bench_bg_memory():
+    """Peak memory of whole-frame vs banded remove_background at 2, 8 and 24 MP.
+
+    Each run happens in a fresh process. Peak growth excludes the input
+    image; the RGBA output alone is 4 bytes per pixel. Fails if the outputs
+    differ, or if the banded peak exceeds 8 bytes per pixel plus 64 MB for
+    the band buffers.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    failed = 0
+    print(f"{'MP':>4} {'path':>7} {'s':>7} {'peak MB':>9} {'B/px':>6} {'same':>5}")
+    for megapixels in (2, 8, 24):
+        runs = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "shot.png")
+            # Made in another process: children inherit the parent's peak RSS.
+            with ctx.Pool(1) as pool:
+                pool.apply(_save_product_shot, (megapixels, path))
+            for banded in (False, True):
+                with ctx.Pool(1) as pool:
+                    runs[banded] = pool.apply(_bg_peak_run, (path, banded))
+        same = runs[False][2] == runs[True][2]
+        failed |= not same or runs[True][1] > 8 * megapixels * 1e6 + 64e6
+        for banded, (seconds, peak, _) in runs.items():
+            print(f"{megapixels:>4} {'banded' if banded else 'whole':>7} {seconds:>7.2f} {peak / 1e6:>9.0f} "
+                  f"{peak / (megapixels * 1e6):>6.1f} {str(same):>5}")
+    if failed:
+        print("bg_memory: banded output differs or peak memory is too high")
+    return failed
+
+
+def bench_encoder_profiles():
+    """Encode latency and size per format and encoder profile, on a 2 MP cutout.
+
+    Fails if ``fast`` is not faster than ``smallest`` for PNG and WebP, or if
+    ``smallest`` is not the smallest output.
+    """
+    from src.io_utils import ENCODER_PROFILES, image_to_bytes
+
+    img, mask = product_shot_with_mask(2)
+    img.putalpha(mask)
+    failed = 0
+    print(f"{'format':>7} {'profile':>9} {'ms':>8} {'KB':>8} {'vs smallest':>12}")
+    for fmt in ("PNG", "JPEG", "WEBP"):
+        runs = {name: _timed(image_to_bytes, img, fmt, 92, name, repeat=3) for name in ENCODER_PROFILES}
+        smallest = len(runs["smallest"][1][0])
+        for name, (seconds, (raw, _)) in runs.items():
+            print(f"{fmt:>7} {name:>9} {seconds * 1000:>8.0f} {len(raw) / 1024:>8.0f} {len(raw) / smallest:>11.2f}x")
+        failed |= min(len(raw) for _, (raw, _) in runs.values()) < smallest
+        if fmt != "JPEG":
+            failed |= runs["fast"][0] >= runs["smallest"][0]
+    if failed:
+        print("encoder_profiles: fast is not faster or smallest is not smallest")
+    return failed
+
+
+def _naive_image_set(img: Image.Image, widths: list[int], fmt_keys: list[str]) -> int:
+    """One export call per variant: resize from the source each time, encode serially."""
+    from src.exporter import prepare_download
+
+    total = 0
+    for width in widths:
+        resized = img.resize((width, round(img.height * width / img.width)), Image.Resampling.LANCZOS)
+        for fmt_key in fmt_keys:
+            total += len(prepare_download(resized, fmt_key, 85)[0].getvalue())
+    return total
+
+
+def bench_image_set():
+    """Responsive image-set export against one export per variant, on a 12 MP shot.
+
+    Four widths x JPEG/WebP/PNG. Fails if the streamed ZIP is invalid or
+    its manifest does not match the members.
+    """
+    import json
+
+    from src.exporter import iter_image_set_zip, parse_image_set
+
+    img = product_shot(12)
+    widths, fmt_keys = parse_image_set(img, [480, 960, 1920, 3840], ["jpeg", "webp", "png"])
+    naive_s, _ = _timed(_naive_image_set, img, widths, fmt_keys)
+    set_s, raw = _timed(lambda: b"".join(iter_image_set_zip(img, widths, fmt_keys, 85)))
+    archive = zipfile.ZipFile(io.BytesIO(raw))
+    manifest = json.loads(archive.read("manifest.json"))
+    failed = archive.testzip() is not None
+    for variant in manifest["variants"]:
+        with Image.open(io.BytesIO(archive.read(variant["file"]))) as out:
+            failed |= out.size != (variant["width"], variant["height"])
+    print(f"{len(manifest['variants'])} variants, {len(raw) / 1e6:.1f} MB ZIP")
+    print(f"{'path':>14} {'s':>7}")
+    print(f"{'per variant':>14} {naive_s:>7.2f}")
+    print(f"{'image set':>14} {set_s:>7.2f}")
+    if failed:
+        print("image_set: invalid archive or manifest")
+    return failed
+
+
+def bench_batch():
+    """One /api/batch call against one /api/background_remove call per image, for 24 1 MP shots.
+
+    The batch runs on the job workers (``JOB_WORKERS``). Fails if any item
+    is missing from the archive or ``results.json``.
+    """
+    import json
+
+    from app import app
+    from src.jobs import JOB_QUEUE
+
+    client = app.test_client()
+    shots = []
+    for seed in range(24):
+        buf = io.BytesIO()
+        product_shot(1, seed).save(buf, format="PNG", compress_level=1)
+        shots.append(buf.getvalue())
+
+    def one_by_one():
+        for raw in shots:
+            assert client.post("/api/background_remove?tolerance=18", data=raw,
+                               content_type="image/png").status_code == 200
+
+    def batch():
+        files = [(io.BytesIO(raw), f"shot{index}.png") for index, raw in enumerate(shots)]
+        return client.post("/api/batch", data={"images": files, "op": "background_remove", "tolerance": "18"},
+                           content_type="multipart/form-data").data
+
+    single_s, _ = _timed(one_by_one)  # distinct seeds, so no cache hits
+    # Start the workers first so the timing leaves out their start-up.
+    client.post("/api/batch", data={"images": [(io.BytesIO(shots[0]), "warm.png")], "op": "convert"},
+                content_type="multipart/form-data")
+    batch_s, raw = _timed(batch)
+    JOB_QUEUE.shutdown()
+    archive = zipfile.ZipFile(io.BytesIO(raw))
+    results = json.loads(archive.read("results.json"))
+    failed = results["done"] != len(shots) or len(archive.namelist()) != len(shots) + 1
+    run_ms = sorted(entry["run_s"] * 1000 for entry in results["results"] if entry.get("run_s") is not None)
+    print(f"{len(shots)} images, {JOB_QUEUE.workers} workers, {os.cpu_count()} CPUs")
+    print(f"{'path':>10} {'s':>7} {'img/s':>7}")
+    print(f"{'one by one':>10} {single_s:>7.2f} {len(shots) / single_s:>7.1f}")
+    print(f"{'batch':>10} {batch_s:>7.2f} {len(shots) / batch_s:>7.1f}")
+    if run_ms:
+        print(f"batch item run ms: median {run_ms[len(run_ms) // 2]:.0f}, max {run_ms[-1]:.0f}")
+    if failed:
+        print("batch: items are missing from the archive or results.json")
+    return failed
+
+
+BENCHES = {
+    "flood": bench_flood,
+    "seam": bench_seam,
+    "seam_map": bench_seam_map,
+    "seam_pyramid": bench_seam_pyramid,
+    "gif_memory": bench_gif_memory,
+    "gif_palette": bench_gif_palette,
+    "gif_delta": bench_gif_delta,
+    "gif_threads": bench_gif_threads,
+    "gif_blocks": bench_gif_blocks,
+    "anim_formats": bench_anim_formats,
+    "frames_zip": bench_frames_zip,
+    "inspect": bench_inspect,
+    "bg_memory": bench_bg_memory,
+    "encoder_profiles": bench_encoder_profiles,
+    "image_set": bench_image_set,
+    "batch": bench_batch,
+    "transport": bench_transport,
+    "cache": bench_cache,
+    "rembg_proxy": bench_rembg_proxy,
+}
+
+
+def main(argv):
+    names = argv or list(BENCHES)
+    failed = 0
+    for name in names:
+        if name not in BENCHES:
+            print(f"unknown benchmark {name!r}; choose from {', '.join(BENCHES)}")
+            return 1
+        failed |= BENCHES[name]() or 0
+    return failed
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,362 @@
+"""Frame-at-a-time animated WebP and APNG encoding.
+
+GIF is limited to 256 colors and LZW; animated WebP (lossy VP8 or lossless
+VP8L) and APNG (deflate, full RGBA) are usually several times smaller for
+the same frames. The writers here take the same ``(frame, duration)``
+stream as ``gif_stream.GifWriter`` and share its interface (``prepare``,
+``add_prepared``, ``pack``/``add_packed``, ``close``), so every GIF
+transform can write any of ``ANIMATION_FORMATS`` through
+``animation_writer``.
+
+WebP frames are spooled as raw RGBA (in memory up to a limit, then on
+disk) and handed to Pillow's animated WebP writer on ``close``; libwebp
+works out the changed rectangles itself. APNG
+frames are written as they arrive: each one after the first stores the
+rectangle that changed since the previous frame, and is compressed on the
+frame pool.
+"""
+from collections import deque
+from typing import Callable, Iterable
+import io
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from PIL import Image, ImageFile, features
+
+from .gif_stream import GIF_THREADS, GifWriter, SharedPalette, _pool, encode_gif, frame_map
+
+HAS_WEBP = features.check_module("webp")
+
+# Output format key -> MIME type.
+ANIMATION_FORMATS = {
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "webp_lossless": "image/webp",
+    "apng": "image/png",
+}
+if not HAS_WEBP:
+    del ANIMATION_FORMATS["webp"], ANIMATION_FORMATS["webp_lossless"]
+
+# Lossy WebP quality (0-100) and effort (0 fastest - 6 smallest).
+WEBP_QUALITY = int(os.environ.get("ANIM_WEBP_QUALITY", "80"))
+WEBP_METHOD = int(os.environ.get("ANIM_WEBP_METHOD", "4"))
+# Raw WebP frames kept in memory before the spool moves to a temporary file.
+WEBP_SPOOL_BYTES = int(float(os.environ.get("ANIM_WEBP_SPOOL_MB", "64")) * 1024 * 1024)
+# zlib level for APNG frames.
+APNG_COMPRESS_LEVEL = int(os.environ.get("ANIM_APNG_COMPRESS_LEVEL", "6"))
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def animation_format(value: str | None) -> str:
+    """Normalize a requested output format; unknown or missing values mean GIF."""
+    key = (value or "gif").strip().lower().replace("-", "_")
+    return key if key in ANIMATION_FORMATS else "gif"
+
+
+def animation_settings() -> list:
+    """Environment settings that change WebP/APNG output, for the result cache key."""
+    return [WEBP_QUALITY, WEBP_METHOD, APNG_COMPRESS_LEVEL]
+
+
+def reduce_colors(frame: Image.Image, colors: int = 256, palette: SharedPalette | None = None) -> Image.Image:
+    """``frame`` as RGBA limited to ``colors`` colors, for formats without a palette of their own.
+
+    With a shared ``palette`` every pixel takes its palette color, exactly
+    as GIF output would show it; without one the frame gets its own octree
+    palette.
+    """
+    if palette is None:
+        return frame.convert("RGBA").quantize(colors, method=Image.Quantize.FASTOCTREE).convert("RGBA")
+    rgba = np.full((len(palette.colors), 4), 255, dtype=np.uint8)
+    rgba[:, :3] = palette.colors
+    if palette.transparency is not None:
+        rgba[palette.transparency] = 0
+    return Image.fromarray(rgba[palette.indices(frame.convert("RGBA"))], "RGBA")
+
+
+class _RgbaWriter:
+    """Canvas fitting, duplicate merging and packing shared by the RGBA writers.
+
+    Subclasses implement ``_write(frame, duration)`` for each distinct frame
+    and ``_finish()``.
+    """
+
+    palette = None
+
+    def __init__(self, fp, loop: int | None = 0, threads: int | None = None):
+        self.fp = fp
+        self.loop = loop
+        self.threads = GIF_THREADS if threads is None else threads
+        self.size = None
+        self.frames_written = 0
+        self._pending = None  # (frame, duration) waiting for a possible duplicate
+
+    def _fit(self, frame: Image.Image) -> Image.Image:
+        """``frame`` as RGBA at the canvas size; the first frame fixes that size."""
+        if frame.mode != "RGBA":
+            frame = frame.convert("RGBA")
+        if self.size is None:
+            self.size = frame.size
+        elif frame.size != self.size:
+            frame = frame.resize(self.size, Image.Resampling.LANCZOS)
+        return frame
+
+    def prepare(self, frame: Image.Image) -> Image.Image:
+        return self._fit(frame)
+
+    def add(self, frame: Image.Image, duration: int):
+        self.add_prepared(self.prepare(frame), duration)
+
+    def add_prepared(self, frame: Image.Image, duration: int):
+        """Add a frame that already went through ``prepare``."""
+        if self._pending is not None:
+            previous, previous_duration = self._pending
+            if previous.tobytes() == frame.tobytes():
+                self._pending = (previous, previous_duration + duration)
+                return
+        self._flush_pending()
+        self._pending = (frame, duration)
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            frame, duration = self._pending
+            self._pending = None
+            self._write(frame, duration)
+            self.frames_written += 1
+
+    def pack(self, frame: Image.Image, duration: int) -> tuple:
+        """The zlib-compressed pixels of ``frame``, for writing later in any order."""
+        frame = self._fit(frame)
+        return frame.size, zlib.compress(frame.tobytes(), 1)
+
+    def add_packed(self, packed: tuple, duration: int):
+        """Add a frame produced by ``pack``."""
+        size, data = packed
+        self.add_prepared(Image.frombytes("RGBA", size, zlib.decompress(data)), duration)
+
+    def close(self):
+        self._flush_pending()
+        self._finish()
+
+    def _write(self, frame: Image.Image, duration: int):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class _FrameSpool(ImageFile.ImageFile):
+    """Equal-sized RGBA frames stored back to back in ``fp``, read one frame per ``seek``."""
+
+    format = "RGBA"
+    format_description = "spooled RGBA frames"
+
+    def __init__(self, fp, size: tuple[int, int], frames: int):
+        self._spool = (size, frames)
+        super().__init__(fp)
+
+    def _open(self):
+        size, frames = self._spool
+        self._mode = "RGBA"
+        self._size = size
+        self.n_frames = frames
+        self.is_animated = frames > 1
+        self._fp = self.fp  # ``load`` drops ``fp``; multi-frame plugins keep it here
+        self._frame = -1
+        self.seek(0)
+
+    def seek(self, frame: int):
+        if not self._seek_check(frame):
+            return
+        width, height = self.size
+        self._frame = frame
+        self.fp = self._fp
+        self.tile = [("raw", (0, 0, width, height), frame * width * height * 4, ("RGBA", 0, 1))]
+
+    def tell(self) -> int:
+        return self._frame
+
+
+class WebPWriter(_RgbaWriter):
+    """Write an animated WebP through Pillow's ``save_all`` WebP writer.
+
+    Distinct frames are spooled as raw RGBA, in memory up to
+    ``WEBP_SPOOL_BYTES`` and in a temporary file beyond that. On ``close``
+    the spool is saved as one multi-frame image, which Pillow reads a frame
+    at a time, so only one decoded frame and libwebp's encoded output are
+    held while encoding.
+    """
+
+    def __init__(self, fp, loop: int | None = 0, lossless: bool = False, quality: int | None = None,
+                 method: int | None = None, threads: int | None = None):
+        if not HAS_WEBP:
+            raise RuntimeError("This Pillow build cannot write WebP.")
+        super().__init__(fp, loop, threads)
+        self.lossless = lossless
+        self.quality = WEBP_QUALITY if quality is None else quality
+        self.method = WEBP_METHOD if method is None else method
+        self._spool = tempfile.SpooledTemporaryFile(max_size=WEBP_SPOOL_BYTES)
+        self._durations = []
+
+    def _write(self, frame: Image.Image, duration: int):
+        self._spool.write(frame.tobytes())
+        self._durations.append(duration)
+
+    def _finish(self):
+        try:
+            if not self._durations:
+                return
+            self._spool.seek(0)
+            frames = _FrameSpool(self._spool, self.size, len(self._durations))
+            frames.save(self.fp, format="WEBP", save_all=True, duration=self._durations,
+                        loop=1 if self.loop is None else int(self.loop), lossless=self.lossless,
+                        quality=self.quality, method=self.method, alpha_quality=100)
+        finally:
+            self._spool.close()
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+class ApngWriter(_RgbaWriter):
+    """Write an APNG to ``fp`` one frame at a time.
+
+    After the first frame, each frame is the rectangle that changed since
+    the previous one. When every changed pixel in it is opaque, unchanged
+    pixels inside it are made transparent and blended over the canvas,
+    which compresses better; otherwise the rectangle replaces the canvas.
+    The frame count in the header is filled in on ``close``, so ``fp``
+    must be seekable.
+    """
+
+    def __init__(self, fp, loop: int | None = 0, compress_level: int | None = None,
+                 threads: int | None = None):
+        super().__init__(fp, loop, threads)
+        self.compress_level = APNG_COMPRESS_LEVEL if compress_level is None else compress_level
+        self._canvas = None  # pixels on screen after the last written frame
+        self._sequence = 0
+        self._actl_offset = None
+        self._encoding = deque()  # (fcTL fields, compressed data) futures, oldest first
+
+    def _write_header(self):
+        width, height = self.size
+        self.fp.write(_PNG_SIGNATURE)
+        self.fp.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        self._actl_offset = self.fp.tell()
+        self.fp.write(_chunk(b"acTL", struct.pack(">II", 0, 0)))
+
+    def _compress(self, region: Image.Image) -> bytes:
+        """The zlib stream of ``region`` as Pillow's PNG encoder filters and deflates it."""
+        buf = io.BytesIO()
+        region.save(buf, format="PNG", compress_level=self.compress_level)
+        data = buf.getvalue()
+        pos = len(_PNG_SIGNATURE)
+        parts = []
+        while pos < len(data):
+            length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+            if tag == b"IDAT":
+                parts.append(data[pos + 8:pos + 8 + length])
+            pos += 12 + length
+        return b"".join(parts)
+
+    def _plan(self, frame: Image.Image) -> tuple[Image.Image, tuple[int, int], int]:
+        """Region, offset and blend op of ``frame`` relative to what is on screen."""
+        pixels = np.asarray(frame)
+        canvas = self._canvas
+        self._canvas = pixels
+        if canvas is None:
+            return frame, (0, 0), 0
+        changed = (pixels != canvas).any(axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        cols = np.flatnonzero(changed.any(axis=0))
+        if not rows.size:
+            return frame.crop((0, 0, 1, 1)), (0, 0), 0
+        left, top, right, bottom = int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+        region = pixels[top:bottom, left:right]
+        changed = changed[top:bottom, left:right]
+        if (region[..., 3][changed] == 255).all():
+            region = np.where(changed[..., None], region, np.uint8(0))
+            return Image.fromarray(region, "RGBA"), (left, top), 1
+        return Image.fromarray(np.ascontiguousarray(region), "RGBA"), (left, top), 0
+
+    def _write(self, frame: Image.Image, duration: int):
+        region, offset, blend = self._plan(frame)
+        fields = (region.size, offset, max(0, min(0xFFFF, int(duration))), blend)
+        if self.threads <= 1:
+            self._write_frame(fields, self._compress(region))
+            return
+        self._encoding.append((fields, _pool(self.threads).submit(self._compress, region)))
+        while len(self._encoding) > 2 * self.threads:
+            fields, future = self._encoding.popleft()
+            self._write_frame(fields, future.result())
+
+    def _write_frame(self, fields: tuple, data: bytes):
+        (width, height), (left, top), delay, blend = fields
+        if self._actl_offset is None:
+            self._write_header()
+        first = self._sequence == 0
+        self.fp.write(_chunk(b"fcTL", struct.pack(">IIIIIHHBB", self._sequence, width, height, left, top,
+                                                  delay, 1000, 0, blend)))
+        self._sequence += 1
+        if first:
+            self.fp.write(_chunk(b"IDAT", data))
+        else:
+            self.fp.write(_chunk(b"fdAT", struct.pack(">I", self._sequence) + data))
+            self._sequence += 1
+
+    def _finish(self):
+        while self._encoding:
+            fields, future = self._encoding.popleft()
+            self._write_frame(fields, future.result())
+        if self._actl_offset is None:
+            return
+        self.fp.write(_chunk(b"IEND", b""))
+        end = self.fp.tell()
+        plays = 1 if self.loop is None else int(self.loop)
+        self.fp.seek(self._actl_offset)
+        self.fp.write(_chunk(b"acTL", struct.pack(">II", self.frames_written, plays)))
+        self.fp.seek(end)
+
+
+def animation_writer(fp, fmt: str = "gif", loop: int | None = 0, colors: int = 256,
+                     palette: SharedPalette | None = None):
+    """A streaming writer for ``fmt`` (a key of ``ANIMATION_FORMATS``).
+
+    ``colors`` and ``palette`` only apply to GIF; WebP and APNG keep full
+    color.
+    """
+    if fmt == "webp":
+        return WebPWriter(fp, loop)
+    if fmt == "webp_lossless":
+        return WebPWriter(fp, loop, lossless=True)
+    if fmt == "apng":
+        return ApngWriter(fp, loop)
+    return GifWriter(fp, loop, colors, palette=palette)
+
+
+def encode_animation(frames: Iterable[tuple[Image.Image, int]], fmt: str = "gif", loop: int | None = 0,
+                     colors: int = 256, palette: SharedPalette | None = None,
+                     transform: Callable[[Image.Image], Image.Image] | None = None) -> bytes:
+    """Encode ``(frame, duration)`` pairs as ``fmt``, streaming frame by frame.
+
+    Like ``gif_stream.encode_gif``, which it uses for GIF output,
+    ``transform`` runs on the frame pool.
+    """
+    if fmt == "gif":
+        return encode_gif(frames, loop, colors, palette=palette, transform=transform)
+    buf = io.BytesIO()
+    writer = animation_writer(buf, fmt, loop)
+
+    def prepare(item):
+        frame, duration = item
+        return writer.prepare(transform(frame) if transform else frame), duration
+
+    for prepared, duration in frame_map(prepare, frames, writer.threads):
+        writer.add_prepared(prepared, duration)
+    writer.close()
+    return buf.getvalue()
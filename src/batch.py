@@ -0,0 +1,190 @@
+"""Apply one operation or pipeline to many images in a single request.
+
+Images come from a multipart list or a ZIP. Each one runs as a ``pipeline``
+job on ``JOB_QUEUE``'s worker processes, a few at a time, and its result is
+written to the streamed response ZIP as soon as it finishes. ``results.json``
+closes the archive with every item's status, error and timings.
+"""
+import io
+import json
+import os
+import posixpath
+import time
+import zipfile
+from typing import Callable, Iterable, Iterator
+
+from .io_utils import ALLOWED_EXPORT
+from .jobs import JOB_QUEUE, JobQueue, QueueFull
+from .pipeline import OUTPUT_STEPS, STEPS, PipelineError, validate_steps
+from .zip_stream import ChunkSink
+
+# Largest batch request body, and most images one batch may hold, and the largest ZIP member read as one.
+BATCH_MAX_MB = int(os.environ.get("BATCH_MAX_MB", "512"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_ITEM_BYTES = int(float(os.environ.get("BATCH_MAX_ITEM_MB", "32")) * 1024 * 1024)
+# Jobs queued per worker at once; more items wait in the request.
+BATCH_JOBS_PER_WORKER = int(os.environ.get("BATCH_JOBS_PER_WORKER", "2"))
+
+_EXTENSIONS = {}
+for _key, (_fmt, _mime) in ALLOWED_EXPORT.items():
+    _EXTENSIONS.setdefault(_mime, _key)
+
+
+class BatchError(ValueError):
+    """Raised for a batch with no usable images or an unknown operation."""
+
+
+def batch_steps(op: str | None, params: dict) -> list[dict]:
+    """Pipeline steps for a batch ``op``: ``pipeline`` takes ``steps``, any other op is a single step."""
+    if op == "pipeline":
+        steps = params.get("steps")
+        if isinstance(steps, str):
+            try:
+                steps = json.loads(steps)
+            except ValueError:
+                raise BatchError("steps must be a JSON list") from None
+    elif op in STEPS or op in OUTPUT_STEPS:
+        # Same output as the op's own endpoint: PNG from the fast profile, except for export.
+        step = {key: value for key, value in params.items() if key not in ("op", "steps", "timeout")} | {"op": op}
+        if op != "export":
+            step.setdefault("profile", "fast")
+        steps = [step] if op in OUTPUT_STEPS else [step, {"op": "export", "format": "png", "profile": step["profile"]}]
+    else:
+        ops = sorted(set(STEPS) | OUTPUT_STEPS | {"pipeline"})
+        raise BatchError(f"op must be one of: {', '.join(ops)}")
+    try:
+        return validate_steps(steps)
+    except PipelineError as exc:
+        raise BatchError(str(exc)) from None
+
+
+def zip_items(raw: bytes) -> list[tuple[str, Callable[[], bytes]]]:
+    """``(name, read)`` for every file in a ZIP, skipping folders and macOS/hidden entries.
+
+    Members are read only when their turn comes, one at a time.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(raw))
+    except zipfile.BadZipFile:
+        raise BatchError("the upload is not a valid ZIP file") from None
+    items = []
+    for info in archive.infolist():
+        parts = info.filename.split("/")
+        if info.is_dir() or parts[0] == "__MACOSX" or parts[-1].startswith("."):
+            continue
+        if info.file_size > BATCH_MAX_ITEM_BYTES:
+            items.append((info.filename, _too_large(info.filename)))
+            continue
+        items.append((info.filename, lambda info=info: archive.read(info)))
+    return items
+
+
+def collect_items(uploads: Iterable[tuple[str, bytes]]) -> list[tuple[str, Callable[[], bytes]]]:
+    """The batch's images: uploaded files as they are, with uploaded ZIPs expanded."""
+    items = []
+    for name, raw in uploads:
+        if name.lower().endswith(".zip"):
+            items.extend(zip_items(raw))
+        else:
+            items.append((name, lambda raw=raw: raw))
+    if not items:
+        raise BatchError("No images provided")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise BatchError(f"at most {BATCH_MAX_ITEMS} images per batch")
+    return items
+
+
+def _too_large(name: str) -> Callable[[], bytes]:
+    def read() -> bytes:
+        raise BatchError(f"{name} is larger than {BATCH_MAX_ITEM_BYTES // (1024 * 1024)} MB")
+    return read
+
+
+def _output_name(name: str, mime: str, taken: set) -> str:
+    """``name`` with the extension of ``mime``, made unique within the archive."""
+    stem = posixpath.splitext(posixpath.normpath(name.replace("\\", "/")).lstrip("./"))[0] or "image"
+    extension = _EXTENSIONS.get(mime, "bin")
+    candidate = f"{stem}.{extension}"
+    suffix = 1
+    while candidate in taken or candidate == "results.json":
+        suffix += 1
+        candidate = f"{stem}-{suffix}.{extension}"
+    taken.add(candidate)
+    return candidate
+
+
+def iter_batch_zip(items: Iterable[tuple[str, Callable[[], bytes]]], steps: list[dict],
+                   timeout: float | None = None, queue: JobQueue = JOB_QUEUE) -> Iterator[bytes]:
+    """Yield a ZIP of every item's result, in the order they finish, then ``results.json``.
+
+    At most ``BATCH_JOBS_PER_WORKER`` jobs per worker are queued at a time,
+    so reading the inputs keeps pace with the workers. Jobs still queued
+    or running when the client goes away are cancelled.
+    """
+    start = time.perf_counter()
+    window = max(1, queue.workers * BATCH_JOBS_PER_WORKER)
+    items = enumerate(items)
+    in_flight = {}  # job_id -> (index, name)
+    entries = []
+    taken = set()
+    waiting = None
+
+    sink = ChunkSink()
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+            while True:
+                while len(in_flight) < window:
+                    if waiting is None:
+                        item = next(items, None)
+                        if item is None:
+                            break
+                        index, (name, read) = item
+                        try:
+                            waiting = index, name, read()
+                        except (BatchError, OSError, zipfile.BadZipFile) as exc:
+                            entries.append({"index": index, "name": name, "status": "failed", "error": str(exc)})
+                            continue
+                    index, name, raw = waiting
+                    try:
+                        job_id = queue.submit("pipeline", raw, {"steps": steps}, timeout)
+                    except QueueFull:
+                        break  # other jobs fill the queue; retry this item once one finishes
+                    in_flight[job_id] = (index, name)
+                    waiting = None
+                if not in_flight:
+                    if waiting is None:
+                        break
+                    time.sleep(0.1)
+                    continue
+
+                for job_id in queue.wait(list(in_flight), timeout=1.0):
+                    index, name = in_flight.pop(job_id)
+                    info = queue.status(job_id)
+                    entry = {"index": index, "name": name, "status": info["status"],
+                             "queued_s": info["queued_s"], "run_s": info.get("run_s")}
+                    if info["status"] == "done":
+                        raw, mime = queue.result(job_id)
+                        entry["output"] = _output_name(name, mime, taken)
+                        entry["bytes"] = len(raw)
+                        archive.writestr(entry["output"], raw)
+                    else:
+                        entry["error"] = info.get("error")
+                    queue.forget(job_id)
+                    entries.append(entry)
+                    yield sink.take()
+
+            entries.sort(key=lambda entry: entry["index"])
+            done = sum(entry["status"] == "done" for entry in entries)
+            summary = {
+                "items": len(entries),
+                "done": done,
+                "failed": len(entries) - done,
+                "total_s": round(time.perf_counter() - start, 3),
+                "steps": steps,
+                "results": entries,
+            }
+            archive.writestr("results.json", json.dumps(summary, indent=2), zipfile.ZIP_DEFLATED)
+        yield sink.take()
+    finally:
+        for job_id in in_flight:
+            queue.cancel(job_id)
@@ -1,16 +1,42 @@
 """AI-powered background removal using rembg (lazy-loaded)."""
 from PIL import Image
 import importlib.util
-import io
 import os
+import threading
+import time
+
+import numpy as np
+
+from .result_cache import memoize
 
 HAS_REMBG = (
     importlib.util.find_spec("rembg") is not None and
     importlib.util.find_spec("onnxruntime") is not None
 )
+DEFAULT_MODEL = os.environ.get("REMBG_MODEL", "isnet-general-use")
+# Longest side the model and alpha matting run at; 0 keeps full resolution.
+PROXY_MAX_SIDE = int(os.environ.get("REMBG_PROXY_MAX_SIDE", "0"))
+_UPSAMPLE_BAND_ROWS = 512
 _remove_fn = None
 _new_session_fn = None
-_session = None
+_sessions = {}
+_session_lock = threading.Lock()
+_timings = {}
+
+
+def configured_models() -> list[str]:
+    """Models to keep sessions for: REMBG_MODELS (comma separated) plus REMBG_MODEL."""
+    models = [DEFAULT_MODEL]
+    for name in os.environ.get("REMBG_MODELS", "").split(","):
+        name = name.strip()
+        if name and name not in models:
+            models.append(name)
+    return models
+
+
+def preload_enabled() -> bool:
+    return HAS_REMBG and os.environ.get("REMBG_PRELOAD", "0").lower() in {"1", "true", "yes"}
+
 
 def _load_rembg_symbols():
     global _remove_fn, _new_session_fn
@@ -30,36 +56,224 @@ def _load_rembg_symbols():
     return _remove_fn, _new_session_fn
 
 
-def _get_session():
-    global _session
-    if _session is None:
-        _, new_session = _load_rembg_symbols()
-        model_name = os.environ.get("REMBG_MODEL", "isnet-general-use")
-        _session = new_session(model_name)
-    return _session
+def _session_class(model_name: str):
+    try:
+        from rembg.sessions import sessions_class
+    except Exception:
+        return None
+    return next((cls for cls in sessions_class if cls.name() == model_name), None)
+
+
+def _session_options():
+    """onnxruntime options with the configured thread counts, or None for rembg defaults."""
+    intra = os.environ.get("REMBG_INTRA_OP_THREADS")
+    inter = os.environ.get("REMBG_INTER_OP_THREADS")
+    if not intra and not inter:
+        return None
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    if intra:
+        opts.intra_op_num_threads = int(intra)
+    if inter:
+        opts.inter_op_num_threads = int(inter)
+    return opts
+
+
+def _create_session(model_name: str):
+    _, new_session = _load_rembg_symbols()
+    opts = _session_options()
+    cls = _session_class(model_name) if opts is not None else None
+    if cls is not None:
+        return cls(model_name, opts)
+    return new_session(model_name)
 
-def remove_bg_ai(img: Image.Image) -> Image.Image:
-    """Remove background using AI (rembg library)."""
+
+def _get_session(model_name: str | None = None):
+    """Return the warm session for ``model_name``, creating it on first use."""
+    model_name = model_name or DEFAULT_MODEL
+    session = _sessions.get(model_name)
+    if session is not None:
+        return session
+    with _session_lock:
+        session = _sessions.get(model_name)
+        if session is None:
+            start = time.perf_counter()
+            session = _create_session(model_name)
+            _timings.setdefault(model_name, {})["session_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            _sessions[model_name] = session
+    return session
+
+
+def prepare_models(models: list[str] | None = None):
+    """Import rembg and fetch model files without creating inference sessions.
+
+    Safe to call in a pre-fork master process: onnxruntime thread pools do not
+    survive ``fork``, so sessions themselves are created in each worker.
+    """
     if not HAS_REMBG:
-        raise RuntimeError("AI background removal is unavailable: install rembg and onnxruntime.")
+        return
+    _load_rembg_symbols()
+    for model_name in models or configured_models():
+        cls = _session_class(model_name)
+        if cls is not None and hasattr(cls, "download_models"):
+            cls.download_models()
+
+
+def preload_sessions(models: list[str] | None = None, background: bool = False):
+    """Create and warm a session per configured model so no request pays the cold start."""
+    if not HAS_REMBG:
+        return None
+
+    def warm():
+        probe = Image.new("RGB", (64, 64), (127, 127, 127))
+        for model_name in models or configured_models():
+            try:
+                _infer(probe, model_name, alpha_matting=False)
+                _timings[model_name]["warmed"] = True
+            except Exception:
+                pass
+
+    if background:
+        thread = threading.Thread(target=warm, name="rembg-preload", daemon=True)
+        thread.start()
+        return thread
+    warm()
+    return None
 
-    if img.mode not in ("RGB", "RGBA"):
-        img = img.convert("RGB")
 
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
+def rembg_stats() -> dict:
+    """Session load and inference timings per model, to measure cold-start cost."""
+    return {
+        "available": HAS_REMBG,
+        "default_model": DEFAULT_MODEL,
+        "models": configured_models(),
+        "loaded": sorted(_sessions),
+        "timings": {name: dict(values) for name, values in _timings.items()},
+    }
 
+
+def _infer(img: Image.Image, model_name: str, alpha_matting: bool | None = None) -> Image.Image:
     remove, _ = _load_rembg_symbols()
+    session = _get_session(model_name)
+    if alpha_matting is None:
+        alpha_matting = os.environ.get("REMBG_ALPHA_MATTING", "1") != "0"
+
+    start = time.perf_counter()
+    # rembg accepts and returns PIL images directly; no PNG round trip needed.
     output = remove(
-        buf.getvalue(),
-        session=_get_session(),
-        alpha_matting=os.environ.get("REMBG_ALPHA_MATTING", "1") != "0",
+        img,
+        session=session,
+        alpha_matting=alpha_matting,
         alpha_matting_foreground_threshold=int(os.environ.get("REMBG_FG_THRESHOLD", "240")),
         alpha_matting_background_threshold=int(os.environ.get("REMBG_BG_THRESHOLD", "10")),
         alpha_matting_erode_size=int(os.environ.get("REMBG_ERODE_SIZE", "10")),
         post_process_mask=os.environ.get("REMBG_POST_PROCESS_MASK", "1") != "0",
     )
+    elapsed = round((time.perf_counter() - start) * 1000, 1)
+
+    stats = _timings.setdefault(model_name, {})
+    stats.setdefault("first_inference_ms", elapsed)
+    stats["last_inference_ms"] = elapsed
+    stats["inferences"] = stats.get("inferences", 0) + 1
+    return output
+
+
+def _box_mean(x: np.ndarray, radius: int) -> np.ndarray:
+    """Mean over a (2r+1)^2 window, clipped at the borders, via cumulative sums."""
+    out = x.astype(np.float64)
+    for axis in (0, 1):
+        n = out.shape[axis]
+        csum = np.cumsum(out, axis=axis)
+        hi = np.minimum(np.arange(n) + radius, n - 1)
+        lo = np.arange(n) - radius - 1
+        upper = np.take(csum, hi, axis=axis)
+        lower = np.take(csum, np.maximum(lo, 0), axis=axis)
+        shape = [1, 1]
+        shape[axis] = n
+        lower = np.where((lo >= 0).reshape(shape), lower, 0.0)
+        out = (upper - lower) / (hi - np.maximum(lo, -1)).reshape(shape)
+    return out.astype(np.float32)
+
+
+def _upsample_mask(mask: Image.Image, guide: Image.Image, radius: int = 4, eps: float = 1e-3) -> Image.Image:
+    """Upsample a low-resolution mask to ``guide``'s size along the guide's edges.
+
+    Fast guided filter: the linear coefficients are solved at mask resolution
+    against a downscaled guide, bilinearly upsampled, and applied to the
+    full-resolution guide in row bands so no full-frame float arrays are held.
+    """
+    low_w, low_h = mask.size
+    full_w, full_h = guide.size
+    gray = guide.convert("L")
+    low_i = np.asarray(gray.resize((low_w, low_h), Image.Resampling.BOX), dtype=np.float32) / 255.0
+    low_p = np.asarray(mask.convert("L"), dtype=np.float32) / 255.0
+
+    mean_i = _box_mean(low_i, radius)
+    mean_p = _box_mean(low_p, radius)
+    cov_ip = _box_mean(low_i * low_p, radius) - mean_i * mean_p
+    var_i = _box_mean(low_i * low_i, radius) - mean_i * mean_i
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    coef_a = Image.fromarray(_box_mean(a, radius), "F")
+    coef_b = Image.fromarray(_box_mean(b, radius), "F")
+
+    scale_y = low_h / full_h
+    out = np.empty((full_h, full_w), dtype=np.uint8)
+    for top in range(0, full_h, _UPSAMPLE_BAND_ROWS):
+        bottom = min(full_h, top + _UPSAMPLE_BAND_ROWS)
+        box = (0, top * scale_y, low_w, bottom * scale_y)
+        size = (full_w, bottom - top)
+        band_a = np.asarray(coef_a.resize(size, Image.Resampling.BILINEAR, box=box), dtype=np.float32)
+        band_b = np.asarray(coef_b.resize(size, Image.Resampling.BILINEAR, box=box), dtype=np.float32)
+        band_i = np.asarray(gray.crop((0, top, full_w, bottom)), dtype=np.float32) / 255.0
+        band = band_a * band_i + band_b
+        out[top:bottom] = np.clip(band * 255.0 + 0.5, 0, 255).astype(np.uint8)
+    return Image.fromarray(out, "L")
+
+
+def _remove_via_proxy(img: Image.Image, model_name: str, max_side: int) -> Image.Image:
+    """Segment a downscaled copy, then refine and apply the mask at full resolution."""
+    scale = max_side / max(img.size)
+    proxy_size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    proxy = img.resize(proxy_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    proxy_alpha = _infer(proxy, model_name).getchannel("A")
 
-    result = Image.open(io.BytesIO(output))
-    result.load()
+    alpha = _upsample_mask(proxy_alpha, img)
+    result = img.convert("RGBA")
+    if img.mode == "RGBA":
+        alpha = Image.fromarray(np.minimum(np.asarray(alpha), np.asarray(img.getchannel("A"))), "L")
+    result.putalpha(alpha)
     return result
+
+
+def _rembg_settings() -> list:
+    """Environment settings that change remove_bg_ai output, for the result cache key."""
+    names = (
+        "REMBG_MODEL", "REMBG_ALPHA_MATTING", "REMBG_FG_THRESHOLD",
+        "REMBG_BG_THRESHOLD", "REMBG_ERODE_SIZE", "REMBG_POST_PROCESS_MASK",
+        "REMBG_PROXY_MAX_SIDE",
+    )
+    return [os.environ.get(name) for name in names]
+
+
+@memoize("remove_bg_ai", salt=_rembg_settings)
+def remove_bg_ai(img: Image.Image, model: str | None = None, proxy_max_side: int | None = None) -> Image.Image:
+    """Remove background using AI (rembg library).
+
+    Images whose longest side exceeds ``proxy_max_side`` (default
+    ``REMBG_PROXY_MAX_SIDE``; 0 disables) are segmented on a downscaled proxy
+    and the mask is upsampled with edge-aware refinement.
+    """
+    if not HAS_REMBG:
+        raise RuntimeError("AI background removal is unavailable: install rembg and onnxruntime.")
+    if model and model not in configured_models():
+        raise RuntimeError(f"Model '{model}' is not enabled on this server.")
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+
+    max_side = PROXY_MAX_SIDE if proxy_max_side is None else int(proxy_max_side)
+    if 0 < max_side < max(img.size):
+        return _remove_via_proxy(img, model or DEFAULT_MODEL, max_side)
+    return _infer(img, model or DEFAULT_MODEL)
@@ -1,11 +1,110 @@
+import functools
 import io
+import json
+import os
+import zipfile
+from typing import Iterator
 from PIL import Image
+from .gif_stream import frame_map
 from .io_utils import ALLOWED_EXPORT, _save_with_metadata
+from .zip_stream import ChunkSink
 
+# Largest widths x formats product one image-set export may ask for.
+IMAGE_SET_MAX_VARIANTS = int(os.environ.get("IMAGE_SET_MAX_VARIANTS", "48"))
+# Formats without their own compression are deflated inside the ZIP.
+_DEFLATED_FORMATS = {"BMP", "TIFF"}
 
-def prepare_download(img: Image.Image, fmt_key: str, quality: int, metadata: dict | None = None):
-    """Prepare an image download in the requested format."""
+
+class ImageSetError(ValueError):
+    """Raised for an unusable list of widths or formats."""
+
+
+def prepare_download(img: Image.Image, fmt_key: str, quality: int, metadata: dict | None = None,
+                     profile: str = "smallest"):
+    """Prepare an image download in the requested format (``smallest`` encoder profile by default)."""
     fmt, mime = ALLOWED_EXPORT.get((fmt_key or "png").lower(), ("PNG", "image/png"))
     buf = io.BytesIO()
-    _save_with_metadata(img, buf, fmt, quality, metadata)
+    _save_with_metadata(img, buf, fmt, quality, metadata, profile)
     return buf, mime
+
+
+def _listed(value) -> list[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, (int, float)):
+        value = [value]
+    return [str(item).strip() for item in value or [] if str(item).strip()]
+
+
+def parse_image_set(img: Image.Image, widths, formats) -> tuple[list[int], list[str]]:
+    """Validated widths (largest first, never above the image's) and format keys.
+
+    Both accept a list or a comma-separated string; formats default to PNG.
+    """
+    try:
+        sizes = {min(img.width, int(width)) for width in _listed(widths)}
+    except ValueError:
+        raise ImageSetError("widths must be whole numbers") from None
+    if not sizes or min(sizes) < 1:
+        raise ImageSetError("widths must be a non-empty list of positive numbers")
+    fmt_keys = {}
+    for key in (key.lower() for key in _listed(formats) or ["png"]):
+        if key not in ALLOWED_EXPORT:
+            raise ImageSetError(f"unknown export format '{key}'")
+        fmt_keys.setdefault(ALLOWED_EXPORT[key][0], key)
+    if len(sizes) * len(fmt_keys) > IMAGE_SET_MAX_VARIANTS:
+        raise ImageSetError(f"at most {IMAGE_SET_MAX_VARIANTS} variants per image set")
+    return sorted(sizes, reverse=True), list(fmt_keys.values())
+
+
+def _resize_chain(img: Image.Image, widths: list[int]) -> Iterator[Image.Image]:
+    """Yield ``img`` at each width, largest first, each downscaled from the one before."""
+    current = img
+    for width in widths:
+        if width != current.width:
+            height = max(1, round(img.height * width / img.width))
+            current = current.resize((width, height), Image.Resampling.LANCZOS)
+        yield current
+
+
+def _encode_variant(item: tuple[Image.Image, str], quality: int, metadata: dict | None,
+                    profile: str) -> tuple[bytes, Image.Image, str]:
+    img, fmt_key = item
+    buf, _ = prepare_download(img, fmt_key, quality, metadata, profile)
+    return buf.getvalue(), img, fmt_key
+
+
+def iter_image_set_zip(img: Image.Image, widths: list[int], fmt_keys: list[str], quality: int = 92,
+                       metadata: dict | None = None, profile: str = "smallest",
+                       stem: str = "image") -> Iterator[bytes]:
+    """Yield a ZIP of ``img`` at every width in every format, plus ``manifest.json``.
+
+    ``widths`` and ``fmt_keys`` come from ``parse_image_set``. Each size is
+    resized from the previous one on the calling thread, and its encodes run
+    on the frame pool while the next size is made. Members are written as
+    they finish, and the manifest, with a ``srcset`` per format, comes last.
+    """
+    items = ((resized, fmt_key) for resized in _resize_chain(img, widths) for fmt_key in fmt_keys)
+    encode = functools.partial(_encode_variant, quality=quality, metadata=metadata, profile=profile)
+    variants = []
+    srcset = {}
+
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for raw, variant, fmt_key in frame_map(encode, items):
+            fmt, mime = ALLOWED_EXPORT[fmt_key]
+            name = f"{stem}-{variant.width}w.{fmt_key}"
+            archive.writestr(name, raw, zipfile.ZIP_DEFLATED if fmt in _DEFLATED_FORMATS else zipfile.ZIP_STORED)
+            variants.append({"file": name, "width": variant.width, "height": variant.height,
+                             "format": fmt_key, "mime": mime, "bytes": len(raw)})
+            srcset.setdefault(fmt_key, []).append(f"{name} {variant.width}w")
+            yield sink.take()
+        manifest = {
+            "source": {"width": img.width, "height": img.height},
+            "quality": quality,
+            "profile": profile,
+            "variants": variants,
+            "srcset": {fmt_key: ", ".join(entries) for fmt_key, entries in srcset.items()},
+        }
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+    yield sink.take()
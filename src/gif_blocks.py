@@ -0,0 +1,185 @@
+"""Block-level GIF reading and writing, without decoding any pixels.
+
+A GIF is a header, an optional global color table, and a run of blocks:
+extensions (the Graphic Control Extension holds a frame's delay, disposal
+and transparent index) and image descriptors followed by their LZW data.
+``parse_gif`` splits a file into those pieces and ``GifFile.to_bytes``
+joins them again with rebuilt control extensions, so timing and frame
+order edits copy the compressed image data through untouched.
+"""
+import struct
+
+_TRAILER = 0x3B
+_EXTENSION = 0x21
+_IMAGE = 0x2C
+_GRAPHIC_CONTROL = 0xF9
+_APPLICATION = 0xFF
+
+
+class GifFormatError(ValueError):
+    """Raised for data that is not a well-formed GIF."""
+
+
+class GifFrame:
+    """One image: its control fields plus the raw descriptor and LZW data."""
+
+    def __init__(self, image: bytes, extensions: list[bytes], control: bytes | None):
+        self.image = image  # descriptor through data terminator, copied verbatim
+        self.extensions = extensions  # comment / plain text blocks before the image
+        self.left, self.top, self.width, self.height, flags = struct.unpack("<HHHHB", image[1:10])
+        self.local_table = bool(flags & 0x80)
+        self.has_control = control is not None
+        packed, delay, transparent = struct.unpack("<BHB", control) if control else (0, 0, 0)
+        self.disposal = (packed >> 2) & 0x07
+        self.user_input = bool(packed & 0x02)
+        self.transparency = transparent if packed & 0x01 else None
+        self.delay = delay  # hundredths of a second
+
+    @property
+    def duration(self) -> int:
+        """Delay in milliseconds, reading frames without a control block as 100 like the decoder."""
+        return self.delay * 10 if self.has_control else 100
+
+    @duration.setter
+    def duration(self, ms: int):
+        self.delay = max(0, min(0xFFFF, int(ms / 10)))
+        self.has_control = True
+
+    def control_block(self) -> bytes:
+        if not self.has_control:
+            return b""
+        packed = (self.disposal << 2) | (0x02 if self.user_input else 0) | (0x01 if self.transparency is not None else 0)
+        return struct.pack("<BBBBHBB", _EXTENSION, _GRAPHIC_CONTROL, 4, packed, self.delay,
+                           self.transparency or 0, 0)
+
+    @property
+    def color_table(self) -> bytes | None:
+        """The frame's local color table, if it has one."""
+        if not self.local_table:
+            return None
+        return self.image[10:10 + (3 << ((self.image[9] & 0x07) + 1))]
+
+    def covers(self, width: int, height: int) -> bool:
+        return self.left == 0 and self.top == 0 and self.width >= width and self.height >= height
+
+
+class GifFile:
+    """A parsed GIF: header and global table, application extensions, frames."""
+
+    def __init__(self, header: bytes, loop: int | None, extensions: list[bytes], frames: list[GifFrame]):
+        self.header = header
+        self.loop = loop
+        self.extensions = extensions
+        self.frames = frames
+        self.width, self.height = struct.unpack("<HH", header[6:10])
+
+    @property
+    def color_table(self) -> bytes | None:
+        """The global color table, if the file has one."""
+        return self.header[13:] if self.header[10] & 0x80 else None
+
+    def self_contained(self, index: int) -> bool:
+        """Whether frame ``index`` looks the same no matter which frames came before it.
+
+        True when it repaints the whole canvas opaquely, or when the frame
+        before it clears the whole canvas back to the background.
+        """
+        frame = self.frames[index]
+        if frame.covers(self.width, self.height) and frame.transparency is None:
+            return True
+        if index == 0:
+            return True
+        previous = self.frames[index - 1]
+        return previous.disposal == 2 and previous.covers(self.width, self.height)
+
+    def reorderable(self) -> bool:
+        """Whether the frames can be played in any order by copying them.
+
+        Every frame must cover the canvas, and either be opaque or follow a
+        frame that clears the canvas; with every frame disposed to the
+        background, any order keeps that true.
+        """
+        if not all(frame.covers(self.width, self.height) for frame in self.frames):
+            return False
+        return (all(frame.transparency is None for frame in self.frames)
+                or all(frame.disposal == 2 for frame in self.frames))
+
+    def to_bytes(self, frames: list[GifFrame] | None = None) -> bytes:
+        """Serialize with ``frames`` (default: all of them, in order)."""
+        parts = [self.header]
+        if self.loop is not None:
+            parts.append(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+        parts.extend(self.extensions)
+        for frame in self.frames if frames is None else frames:
+            parts.extend(frame.extensions)
+            parts.append(frame.control_block())
+            parts.append(frame.image)
+        parts.append(b";")
+        return b"".join(parts)
+
+
+def _skip_sub_blocks(data: bytes, pos: int) -> int:
+    """Position just past the zero-length block ending a run of data sub-blocks."""
+    size = len(data)
+    while True:
+        if pos >= size:
+            raise GifFormatError("truncated GIF data")
+        length = data[pos]
+        pos += 1
+        if length == 0:
+            return pos
+        pos += length
+
+
+def parse_gif(data: bytes) -> GifFile:
+    """Split ``data`` into header, frames and extensions without decoding images."""
+    if data[:6] not in (b"GIF87a", b"GIF89a") or len(data) < 13:
+        raise GifFormatError("not a GIF file")
+    flags = data[10]
+    pos = 13 + (3 << ((flags & 0x07) + 1) if flags & 0x80 else 0)
+    header = data[:pos]
+
+    loop = None
+    extensions = []
+    frames = []
+    pending_extensions = []
+    control = None
+    while pos < len(data):
+        introducer = data[pos]
+        if introducer == _TRAILER:
+            break
+        if introducer == _EXTENSION:
+            if pos + 2 > len(data):
+                raise GifFormatError("truncated GIF extension")
+            label = data[pos + 1]
+            end = _skip_sub_blocks(data, pos + 2)
+            block = data[pos:end]
+            if label == _GRAPHIC_CONTROL:
+                if len(block) < 8:
+                    raise GifFormatError("short graphic control extension")
+                control = block[3:7]
+            elif label == _APPLICATION and block[2:14] in (b"\x0bNETSCAPE2.0", b"\x0bANIMEXTS1.0"):
+                if len(block) >= 19 and block[15] == 1:
+                    loop = struct.unpack("<H", block[16:18])[0]
+            elif label == _APPLICATION:
+                extensions.append(block)
+            else:
+                pending_extensions.append(block)
+            pos = end
+        elif introducer == _IMAGE:
+            if pos + 10 > len(data):
+                raise GifFormatError("truncated image descriptor")
+            image_flags = data[pos + 9]
+            end = pos + 10
+            if image_flags & 0x80:
+                end += 3 << ((image_flags & 0x07) + 1)
+            end = _skip_sub_blocks(data, end + 1)  # + LZW minimum code size
+            frames.append(GifFrame(data[pos:end], pending_extensions, control))
+            pending_extensions = []
+            control = None
+            pos = end
+        else:
+            raise GifFormatError(f"unexpected GIF block 0x{introducer:02x}")
+    if not frames:
+        raise GifFormatError("GIF has no frames")
+    return GifFile(header, loop, extensions, frames)
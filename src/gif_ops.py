@@ -1,213 +1,356 @@
-"""GIF manipulation operations."""
+"""GIF manipulation operations.
+
+Every transform accepts the GIF either as a base64 data URL or as raw bytes
+and answers in the same form it was given. Frames are decoded, transformed
+and encoded one at a time (see ``gif_stream``), so memory use follows the
+frame size rather than the frame count. All frames share one palette;
+transforms that only drop, reorder or retime frames reuse the source's,
+and frames after the first only store the rectangle that changed.
+
+Timing and frame order edits skip decoding altogether when they can: the
+file is split into blocks (see ``gif_blocks``), the control extensions are
+rewritten and the compressed frames are copied through, which is lossless.
+
+The transforms can also write animated WebP (lossy or lossless) or APNG
+instead, through ``anim_stream``; ``fmt`` takes a key of
+``ANIMATION_FORMATS``.
+"""
 import base64
+import functools
 import io
+import itertools
+import os
 import zipfile
+from typing import Iterator
 from PIL import Image
 
+from .anim_stream import ANIMATION_FORMATS, animation_format, animation_settings, animation_writer, \
+    encode_animation, reduce_colors
+from .gif_blocks import GifFile, GifFormatError, parse_gif
+from .gif_stream import (
+    encoder_settings, frame_count, frame_map, iter_frames, shared_palette,
+)
+from .result_cache import memoize
+from .zip_stream import ChunkSink
+
 HAS_GIF = True
 
+# zlib level of the PNGs in a frame ZIP, and whether the archive deflates
+# them again rather than storing them.
+FRAMES_ZIP_PNG_LEVEL = int(os.environ.get("FRAMES_ZIP_PNG_LEVEL", "6"))
+FRAMES_ZIP_DEFLATE = os.environ.get("FRAMES_ZIP_DEFLATE", "1").lower() not in {"", "0", "false", "no", "off"}
 
-def _b64_to_gif(data_url: str) -> Image.Image:
-    """Convert a base64 data URL to a PIL GIF image."""
-    if "," in data_url:
-        data_url = data_url.split(",", 1)[1]
-    raw = base64.b64decode(data_url)
-    return Image.open(io.BytesIO(raw))
 
+def _gif_bytes(data: str | bytes) -> bytes:
+    """Return the raw GIF bytes from a data URL or a bytes payload."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+    if "," in data:
+        data = data.split(",", 1)[1]
+    return base64.b64decode(data)
 
-def _collect_frames(img: Image.Image):
-    frames = []
-    durations = []
+
+def _b64_to_gif(data: str | bytes) -> Image.Image:
+    """Open a GIF given as a base64 data URL or raw bytes."""
+    return Image.open(io.BytesIO(_gif_bytes(data)))
+
+
+def _parsed(raw: bytes) -> GifFile | None:
     try:
-        frame_total = getattr(img, "n_frames", 1)
-        for index in range(frame_total):
-            img.seek(index)
-            frames.append(img.copy().convert("RGBA"))
-            durations.append(img.info.get("duration", 100))
-    except EOFError:
-        pass
-    return frames, durations
+        return parse_gif(raw)
+    except GifFormatError:
+        return None
 
 
-def _gif_to_b64(frames: list, durations: list, loop: int = 0, colors: int = 256) -> str:
-    """Convert a list of RGBA frames to a GIF data URL."""
-    buf = io.BytesIO()
-    palette_frames = []
-    palette_size = max(16, min(256, int(colors)))
-
-    for frame in frames:
-        palette_frames.append(frame.convert("P", palette=Image.ADAPTIVE, colors=palette_size))
-
-    palette_frames[0].save(
-        buf,
-        format="GIF",
-        save_all=True,
-        append_images=palette_frames[1:] if len(palette_frames) > 1 else [],
-        duration=durations,
-        loop=loop,
-        optimize=True,
-        disposal=2,
-    )
-
-    return "data:image/gif;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
-
-
-def gif_info(data_url: str) -> dict:
-    """Return basic animation info for a GIF."""
-    img = _b64_to_gif(data_url)
-    frame_count = getattr(img, "n_frames", 1)
+def _blocks(raw: bytes) -> GifFile | None:
+    """The block structure of ``raw`` for copying frames through, or None to fall back to decoding."""
+    return _parsed(raw)
+
+
+def _palette_source(raw: bytes, blocks: GifFile | None = None) -> GifFile | None:
+    """The block structure ``shared_palette`` reads the source's color tables from."""
+    return blocks if blocks is not None else _parsed(raw)
+
+
+def _settings() -> list:
+    return encoder_settings() + animation_settings()
+
+
+def _reply(raw: bytes, like: str | bytes, mime: str = "image/gif") -> str | bytes:
+    """Answer with raw bytes for binary callers and a data URL otherwise."""
+    if isinstance(like, (bytes, bytearray, memoryview)):
+        return raw
+    return f"data:{mime};base64," + base64.b64encode(raw).decode("ascii")
+
+
+def gif_info(data: str | bytes) -> dict:
+    """Return basic animation info for a GIF, read from its blocks without decoding."""
+    raw = _gif_bytes(data)
+    blocks = _blocks(raw)
+    if blocks is not None:
+        return {
+            "frame_count": len(blocks.frames),
+            "loop": blocks.loop or 0,
+            "duration_ms_total": sum(frame.duration for frame in blocks.frames),
+        }
+
+    img = Image.open(io.BytesIO(raw))
+    total = frame_count(img)
     durations = []
     try:
-        for index in range(frame_count):
+        for index in range(total):
             img.seek(index)
             durations.append(img.info.get("duration", 100))
     except EOFError:
         pass
 
     return {
-        "frame_count": frame_count,
+        "frame_count": total,
         "loop": img.info.get("loop", 0),
         "duration_ms_total": sum(durations),
     }
 
 
-def extract_gif_frames(data_url: str, max_frames: int = 0) -> list:
+def extract_gif_frames(data: str | bytes, max_frames: int = 0) -> list:
     """Extract frames from a GIF as PNG data URLs."""
-    img = _b64_to_gif(data_url)
-    frames = []
-    try:
-        frame_count = getattr(img, "n_frames", 1)
-        limit = min(frame_count, max_frames) if max_frames > 0 else frame_count
-        for index in range(limit):
-            img.seek(index)
-            frame = img.copy().convert("RGBA")
-            buf = io.BytesIO()
-            frame.save(buf, format="PNG")
-            frames.append("data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii"))
-    except EOFError:
-        pass
-    return frames
+    frames = iter_frames(_b64_to_gif(data))
+    if max_frames > 0:
+        frames = itertools.islice(frames, max_frames)
+    return [
+        "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+        for png in frame_map(_png_bytes, frames)
+    ]
 
 
-def resize_gif(data_url: str, width: int, height: int, keep_aspect: bool = True) -> str:
-    """Resize a GIF while preserving animation."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if not frames:
-        return data_url
-
-    output = []
-    for frame in frames:
-        orig_w, orig_h = frame.size
-        if keep_aspect:
-            if width and not height:
-                ratio = width / orig_w
-            elif height and not width:
-                ratio = height / orig_h
-            else:
-                ratio = min(width / orig_w, height / orig_h)
-            target_w = max(1, int(orig_w * ratio))
-            target_h = max(1, int(orig_h * ratio))
-        else:
-            target_w = max(1, width)
-            target_h = max(1, height)
-        output.append(frame.resize((target_w, target_h), Image.Resampling.LANCZOS))
-
-    return _gif_to_b64(output, durations, img.info.get("loop", 0))
+def _png_bytes(item: tuple[Image.Image, int], compress_level: int = 6) -> bytes:
+    buf = io.BytesIO()
+    item[0].save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
 
 
-def trim_gif(data_url: str, start_frame: int, end_frame: int) -> str:
-    """Trim a GIF to a specific frame range."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if len(frames) <= 1:
-        return data_url
+@memoize("resize_gif", salt=_settings)
+def resize_gif(data: str | bytes, width: int, height: int, keep_aspect: bool = True,
+               fmt: str = "gif") -> str | bytes:
+    """Resize a GIF while preserving animation."""
+    img = _b64_to_gif(data)
+    orig_w, orig_h = img.size
+    if keep_aspect:
+        if width and not height:
+            ratio = width / orig_w
+        elif height and not width:
+            ratio = height / orig_h
+        else:
+            ratio = min(width / orig_w, height / orig_h)
+        target_w = max(1, int(orig_w * ratio))
+        target_h = max(1, int(orig_h * ratio))
+    else:
+        target_w = max(1, width)
+        target_h = max(1, height)
+
+    fmt = animation_format(fmt)
+    palette = shared_palette(img) if fmt == "gif" else None
+    frames = iter_frames(img)
+    transform = functools.partial(Image.Image.resize, size=(target_w, target_h), resample=Image.Resampling.LANCZOS)
+    raw = encode_animation(frames, fmt, img.info.get("loop", 0), palette=palette, transform=transform)
+    return _reply(raw, data, ANIMATION_FORMATS[fmt])
+
+
+@memoize("trim_gif", salt=_settings)
+def trim_gif(data: str | bytes, start_frame: int, end_frame: int, fmt: str = "gif") -> str | bytes:
+    """Trim a GIF to a specific frame range.
+
+    Copies the kept frames through when the first of them does not depend
+    on the frames cut before it.
+    """
+    fmt = animation_format(fmt)
+    raw = _gif_bytes(data)
+    img = Image.open(io.BytesIO(raw))
+    total = frame_count(img)
+    if total <= 1 and fmt == "gif":
+        return data
 
-    total = len(frames)
     if end_frame < 0:
         end_frame = total + end_frame + 1
     start_frame = max(0, min(start_frame, total - 1))
     end_frame = max(start_frame + 1, min(end_frame, total))
 
-    return _gif_to_b64(frames[start_frame:end_frame], durations[start_frame:end_frame], img.info.get("loop", 0))
-
-
-def change_gif_speed(data_url: str, speed_factor: float) -> str:
-    """Change GIF playback speed (2.0 = 2x faster, 0.5 = half speed)."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if len(frames) <= 1:
-        return data_url
-
-    adjusted = [max(10, int(duration / max(0.05, speed_factor))) for duration in durations]
-    return _gif_to_b64(frames, adjusted, img.info.get("loop", 0))
+    blocks = _blocks(raw) if fmt == "gif" else None
+    if blocks is not None and len(blocks.frames) == total and blocks.self_contained(start_frame):
+        return _reply(blocks.to_bytes(blocks.frames[start_frame:end_frame]), data)
+
+    palette = shared_palette(img, source=_palette_source(raw, blocks)) if fmt == "gif" else None
+    frames = itertools.islice(iter_frames(img, palette), start_frame, end_frame)
+    raw = encode_animation(frames, fmt, img.info.get("loop", 0), palette=palette)
+    return _reply(raw, data, ANIMATION_FORMATS[fmt])
+
+
+@memoize("change_gif_speed", salt=_settings)
+def change_gif_speed(data: str | bytes, speed_factor: float, fmt: str = "gif") -> str | bytes:
+    """Change GIF playback speed (2.0 = 2x faster, 0.5 = half speed).
+
+    Only the frame delays are rewritten; image data is copied through.
+    """
+    fmt = animation_format(fmt)
+    raw = _gif_bytes(data)
+    factor = max(0.05, speed_factor)
+    blocks = _blocks(raw) if fmt == "gif" else None
+    if blocks is not None:
+        if len(blocks.frames) <= 1:
+            return data
+        for frame in blocks.frames:
+            frame.duration = max(10, int(frame.duration / factor))
+        return _reply(blocks.to_bytes(), data)
+
+    img = Image.open(io.BytesIO(raw))
+    if frame_count(img) <= 1 and fmt == "gif":
+        return data
+
+    palette = shared_palette(img, source=_palette_source(raw, blocks)) if fmt == "gif" else None
+    frames = ((frame, max(10, int(duration / factor))) for frame, duration in iter_frames(img, palette))
+    raw = encode_animation(frames, fmt, img.info.get("loop", 0), palette=palette)
+    return _reply(raw, data, ANIMATION_FORMATS[fmt])
+
+
+def _packed_frames(img: Image.Image, writer) -> list:
+    """Pack every frame so they can be written in any order.
+
+    Only compressed frames are kept, never the decoded ones.
+    """
+    def pack(item):
+        frame, duration = item
+        return writer.pack(frame, duration), duration
+
+    return list(frame_map(pack, iter_frames(img, writer.palette), writer.threads))
+
+
+@memoize("reverse_gif", salt=_settings)
+def reverse_gif(data: str | bytes, fmt: str = "gif") -> str | bytes:
+    """Reverse GIF playback order.
+
+    Frames that each repaint the whole canvas are copied through in reverse;
+    otherwise they are decoded and re-encoded.
+    """
+    fmt = animation_format(fmt)
+    raw = _gif_bytes(data)
+    blocks = _blocks(raw) if fmt == "gif" else None
+    if blocks is not None and blocks.reorderable():
+        if len(blocks.frames) <= 1:
+            return data
+        return _reply(blocks.to_bytes(blocks.frames[::-1]), data)
+
+    img = Image.open(io.BytesIO(raw))
+    if frame_count(img) <= 1 and fmt == "gif":
+        return data
 
-
-def reverse_gif(data_url: str) -> str:
-    """Reverse GIF playback order."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if len(frames) <= 1:
-        return data_url
-
-    frames.reverse()
-    durations.reverse()
-    return _gif_to_b64(frames, durations, img.info.get("loop", 0))
+    buf = io.BytesIO()
+    palette = shared_palette(img, source=_palette_source(raw, blocks)) if fmt == "gif" else None
+    writer = animation_writer(buf, fmt, img.info.get("loop", 0), palette=palette)
+    packed = _packed_frames(img, writer)
+    for frame, duration in reversed(packed):
+        writer.add_packed(frame, duration)
+    writer.close()
+    return _reply(buf.getvalue(), data, ANIMATION_FORMATS[fmt])
 
 
-def pingpong_gif(data_url: str) -> str:
+@memoize("pingpong_gif", salt=_settings)
+def pingpong_gif(data: str | bytes, fmt: str = "gif") -> str | bytes:
     """Append the reverse frames to create a ping-pong animation."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if len(frames) <= 1:
-        return data_url
-
-    tail_frames = frames[-2:0:-1]
-    tail_durations = durations[-2:0:-1]
-    return _gif_to_b64(frames + tail_frames, durations + tail_durations, img.info.get("loop", 0))
-
-
-def optimize_gif(data_url: str, colors: int = 128, frame_step: int = 1) -> str:
-    """Reduce GIF size by shrinking palette and optionally skipping frames."""
-    img = _b64_to_gif(data_url)
-    frames, durations = _collect_frames(img)
-    if not frames:
-        return data_url
+    fmt = animation_format(fmt)
+    raw = _gif_bytes(data)
+    blocks = _blocks(raw) if fmt == "gif" else None
+    if blocks is not None and blocks.reorderable():
+        if len(blocks.frames) <= 1:
+            return data
+        return _reply(blocks.to_bytes(blocks.frames + blocks.frames[-2:0:-1]), data)
+
+    img = Image.open(io.BytesIO(raw))
+    if frame_count(img) <= 1 and fmt == "gif":
+        return data
 
+    buf = io.BytesIO()
+    palette = shared_palette(img, source=_palette_source(raw, blocks)) if fmt == "gif" else None
+    writer = animation_writer(buf, fmt, img.info.get("loop", 0), palette=palette)
+    packed = _packed_frames(img, writer)
+    for frame, duration in packed + packed[-2:0:-1]:
+        writer.add_packed(frame, duration)
+    writer.close()
+    return _reply(buf.getvalue(), data, ANIMATION_FORMATS[fmt])
+
+
+def _every_nth(frames, step: int):
+    """Keep every ``step``-th frame, giving it the duration of the frames it replaces."""
+    kept = None
+    for index, (frame, duration) in enumerate(frames):
+        if index % step == 0:
+            if kept is not None:
+                yield kept
+            kept = [frame, duration]
+        else:
+            kept[1] += duration
+    if kept is not None:
+        yield kept
+
+
+@memoize("optimize_gif", salt=_settings)
+def optimize_gif(data: str | bytes, colors: int = 128, frame_step: int = 1, fmt: str = "gif") -> str | bytes:
+    """Reduce GIF size by shrinking palette and optionally skipping frames.
+
+    WebP and APNG output gets the same color reduction, frame by frame.
+    """
+    fmt = animation_format(fmt)
+    raw = _gif_bytes(data)
+    img = Image.open(io.BytesIO(raw))
+    palette = shared_palette(img, colors, source=_palette_source(raw))
+    frames = iter_frames(img, palette if fmt == "gif" else None)
     step = max(1, int(frame_step))
     if step > 1:
-        reduced_frames = []
-        reduced_durations = []
-        for index in range(0, len(frames), step):
-            reduced_frames.append(frames[index])
-            reduced_durations.append(sum(durations[index:index + step]))
-        frames = reduced_frames
-        durations = reduced_durations
-
-    return _gif_to_b64(frames, durations, img.info.get("loop", 0), colors=colors)
-
-
-def poster_frame(data_url: str, frame: int = 0) -> str:
-    """Export a single frame from a GIF as a PNG data URL."""
-    img = _b64_to_gif(data_url)
+        frames = _every_nth(frames, step)
+    transform = None
+    if fmt != "gif":
+        transform = functools.partial(reduce_colors, colors=max(2, min(256, int(colors))), palette=palette)
+    raw = encode_animation(frames, fmt, img.info.get("loop", 0), colors=colors, palette=palette, transform=transform)
+    return _reply(raw, data, ANIMATION_FORMATS[fmt])
+
+
+@memoize("poster_frame")
+def poster_frame(data: str | bytes, frame: int = 0) -> str | bytes:
+    """Export a single frame from a GIF as a PNG."""
+    img = _b64_to_gif(data)
     frame_total = getattr(img, "n_frames", 1)
     frame = max(0, min(int(frame), frame_total - 1))
     img.seek(frame)
     frame_img = img.copy().convert("RGBA")
     buf = io.BytesIO()
     frame_img.save(buf, format="PNG")
-    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    return _reply(buf.getvalue(), data, "image/png")
 
 
-def gif_to_frames_zip(data_url: str) -> bytes:
-    """Export all GIF frames as a ZIP file of PNGs."""
-    img = _b64_to_gif(data_url)
-    frames, _ = _collect_frames(img)
+def iter_frames_zip(data: str | bytes, compress_level: int | None = None,
+                    deflate: bool | None = None) -> Iterator[bytes]:
+    """Yield a ZIP of every frame as a PNG, piece by piece, as frames are decoded.
 
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
-        for index, frame in enumerate(frames):
-            frame_buf = io.BytesIO()
-            frame.save(frame_buf, format="PNG")
-            archive.writestr(f"frame_{index:04d}.png", frame_buf.getvalue())
-    return buf.getvalue()
+    Only the frames in flight on the frame pool and the current member are
+    held, never the archive. ``compress_level`` (0-9) and ``deflate``
+    default to ``FRAMES_ZIP_PNG_LEVEL`` and ``FRAMES_ZIP_DEFLATE``.
+    """
+    level = FRAMES_ZIP_PNG_LEVEL if compress_level is None else max(0, min(9, int(compress_level)))
+    deflate = FRAMES_ZIP_DEFLATE if deflate is None else deflate
+    img = _b64_to_gif(data)
+    encode = functools.partial(_png_bytes, compress_level=level)
+
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED) as archive:
+        for index, png in enumerate(frame_map(encode, iter_frames(img))):
+            archive.writestr(f"frame_{index:04d}.png", png)
+            yield sink.take()
+    yield sink.take()
+
+
+def _frames_zip_settings() -> list:
+    return [FRAMES_ZIP_PNG_LEVEL, FRAMES_ZIP_DEFLATE]
+
+
+@memoize("gif_to_frames_zip", salt=_frames_zip_settings)
+def gif_to_frames_zip(data: str | bytes, compress_level: int | None = None, deflate: bool | None = None) -> bytes:
+    """Export all GIF frames as a ZIP file of PNGs (``iter_frames_zip`` joined)."""
+    return b"".join(iter_frames_zip(data, compress_level, deflate))
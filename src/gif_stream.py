@@ -0,0 +1,530 @@
+"""Frame-at-a-time GIF decoding and encoding.
+
+Pillow's ``save_all`` collects every frame of an animation before writing
+it, and the GIF transforms used to decode all frames up front as RGBA
+copies, so memory grew with the frame count. ``iter_frames`` decodes lazily
+and ``GifWriter`` quantizes and writes each frame as soon as it arrives,
+keeping only the current frame (and one pending duplicate check) alive.
+
+By default every frame is mapped onto one ``SharedPalette`` written as the
+global color table: either the source GIF's own palette, when the
+transform keeps its colors, or one octree palette built from a sample of
+frames. ``GIF_PALETTE=local`` restores a separate adaptive palette per
+frame.
+
+Per-frame work (resizing, quantizing, LZW compression) runs on a shared
+pool of ``GIF_THREADS`` threads through ``frame_map``; Pillow and numpy
+release the GIL in that code. Decoding and writing stay in order on the
+calling thread.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+import io
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+from .gif_blocks import GifFile
+
+PALETTE_MODE = os.environ.get("GIF_PALETTE", "global")
+# Frames sampled to build a shared palette, and the pixel budget of the sample.
+PALETTE_SAMPLE_FRAMES = int(os.environ.get("GIF_PALETTE_SAMPLE_FRAMES", "16"))
+# Write only the changed rectangle of each frame (shared palette only).
+DELTA_FRAMES = os.environ.get("GIF_DELTA", "1").lower() not in {"0", "false", "no", "off"}
+# Threads for per-frame work; 1 runs everything on the calling thread.
+GIF_THREADS = int(os.environ.get("GIF_THREADS") or min(4, os.cpu_count() or 1))
+_SAMPLE_PIXELS = 256 * 256
+_LUT_BITS = 5
+_pools = {}
+_pools_lock = threading.Lock()
+_strategy_lock = threading.Lock()
+_strategy_users = 0
+_strategy_saved = None
+
+
+# A forked child (JOB_START_METHOD=fork) inherits the pools but not their threads.
+os.register_at_fork(after_in_child=_pools.clear)
+
+
+def _pool(threads: int) -> ThreadPoolExecutor:
+    pool = _pools.get(threads)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(threads)
+            if pool is None:
+                pool = _pools[threads] = ThreadPoolExecutor(threads, thread_name_prefix="gif-frame")
+    return pool
+
+
+@contextmanager
+def palette_frames():
+    """Decode GIF frames that share the first frame's palette in "P" mode.
+
+    Pillow expands every frame after the first to RGB by default; keeping
+    them paletted lets them be re-encoded without re-quantizing. The
+    loading strategy is a Pillow global, so it is set only while frames
+    are being read and restored once the last concurrent reader is done.
+    """
+    global _strategy_users, _strategy_saved
+    with _strategy_lock:
+        if not _strategy_users:
+            _strategy_saved = GifImagePlugin.LOADING_STRATEGY
+            GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+        _strategy_users += 1
+    try:
+        yield
+    finally:
+        with _strategy_lock:
+            _strategy_users -= 1
+            if not _strategy_users:
+                GifImagePlugin.LOADING_STRATEGY = _strategy_saved
+
+
+def frame_map(fn: Callable, items: Iterable, threads: int | None = None) -> Iterator:
+    """Apply ``fn`` to every item on the frame pool, yielding results in order.
+
+    At most two results per thread are in flight, so frames still stream.
+    The first item runs on the calling thread before anything is submitted,
+    so per-stream state it sets up (like the canvas size) is in place.
+    """
+    threads = GIF_THREADS if threads is None else threads
+    items = iter(items)
+    for first in items:
+        yield fn(first)
+        break
+    if threads <= 1:
+        yield from map(fn, items)
+        return
+    pool = _pool(threads)
+    window = deque()
+    for item in items:
+        window.append(pool.submit(fn, item))
+        if len(window) >= 2 * threads:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
+
+
+def iter_frames(img: Image.Image, palette: "SharedPalette | None" = None) -> Iterator[tuple[Image.Image, int]]:
+    """Yield ``(rgba_frame, duration_ms)`` for every frame, decoding one at a time.
+
+    When ``palette`` is the source's own ``indexed`` palette, frames still in
+    "P" mode are yielded as such so the writer can skip re-quantizing them.
+    """
+    indexed = palette is not None and palette.indexed
+    frame_total = getattr(img, "n_frames", 1)
+    for index in range(frame_total):
+        with palette_frames():
+            try:
+                img.seek(index)
+            except EOFError:
+                return
+            frame = img.copy() if indexed and img.mode == "P" else img.convert("RGBA")
+        yield frame, img.info.get("duration", 100)
+
+
+def frame_count(img: Image.Image) -> int:
+    return getattr(img, "n_frames", 1)
+
+
+def encoder_settings() -> list:
+    """Environment settings that change encoded output, for the result cache key."""
+    return [PALETTE_MODE, PALETTE_SAMPLE_FRAMES, DELTA_FRAMES]
+
+
+class SharedPalette:
+    """One palette for every frame, with vectorized RGBA-to-index mapping.
+
+    Colors are looked up in a table over 15-bit RGB that stores the nearest
+    palette entry. A palette taken over from the source GIF is matched
+    exactly first, so reusing it loses nothing. Pixels with alpha below 128
+    map to ``transparency`` when the palette reserves an index for it.
+    ``indexed`` marks a source palette whose "P" frames can be written as
+    decoded, skipping the mapping altogether.
+    """
+
+    def __init__(self, colors: np.ndarray, transparency: int | None = None, exact: bool = False,
+                 indexed: bool = False):
+        self.colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        self.transparency = transparency
+        self.exact = exact
+        self.indexed = indexed
+        self._lut = self._nearest_table()
+        if exact:
+            self._keys_by_index = self._pack(np.pad(self.colors, ((0, 0), (0, 1))))
+            candidates = np.arange(len(self.colors))
+            if transparency is not None:
+                candidates = candidates[candidates != transparency]
+            keys = self._keys_by_index[candidates]
+            order = np.argsort(keys, kind="stable")
+            self._order = candidates[order]
+            self._keys = keys[order]
+
+    @staticmethod
+    def _pack(rgba: np.ndarray) -> np.ndarray:
+        """RGB of contiguous RGBA pixels as one uint32 per pixel, alpha masked out."""
+        mask = np.array([255, 255, 255, 0], dtype=np.uint8).view(np.uint32)[0]
+        return np.ascontiguousarray(rgba, dtype=np.uint8).view(np.uint32)[..., 0] & mask
+
+    def _nearest_table(self) -> np.ndarray:
+        """Nearest palette entry for every 15-bit color, via Pillow's palette mapping."""
+        levels = 1 << _LUT_BITS
+        step = 256 // levels
+        centers = np.arange(levels, dtype=np.uint8) * step + step // 2
+        grid = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), axis=-1)
+        grid_img = Image.fromarray(grid.reshape(levels * levels, levels, 3), "RGB")
+
+        candidates = np.arange(len(self.colors))
+        if self.transparency is not None:
+            candidates = candidates[candidates != self.transparency]
+        # Pad with the last candidate so unused entries never win as black.
+        candidates = np.concatenate([candidates, np.repeat(candidates[-1:], 256 - len(candidates))])
+        target = Image.new("P", (1, 1))
+        target.putpalette(self.colors[candidates].tobytes())
+        mapped = grid_img.quantize(palette=target, dither=Image.Dither.NONE)
+        return candidates[np.asarray(mapped).reshape(-1)].astype(np.uint8)
+
+    def indices(self, frame: Image.Image) -> np.ndarray:
+        """Palette index of every pixel of an RGBA frame."""
+        pixels = np.asarray(frame)
+        shift = 8 - _LUT_BITS
+        red = pixels[..., 0].astype(np.uint16) >> shift
+        green = pixels[..., 1].astype(np.uint16) >> shift
+        out = self._lut[(red << (2 * _LUT_BITS)) | (green << _LUT_BITS) | (pixels[..., 2] >> shift)]
+        if self.exact:
+            # Only cells holding several palette colors can miss; search just those.
+            packed = self._pack(pixels)
+            miss = self._keys_by_index[out] != packed
+            if miss.any():
+                keys = packed[miss]
+                pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+                out[miss] = np.where(self._keys[pos] == keys, self._order[pos], out[miss])
+        if self.transparency is not None:
+            out[pixels[..., 3] < 128] = self.transparency
+        return out
+
+    def table_bytes(self) -> tuple[bytes, int]:
+        """Color table padded to a power of two, and its GIF size field."""
+        size_field = max(0, int(np.ceil(np.log2(max(2, len(self.colors))))) - 1)
+        table = np.zeros((2 << size_field, 3), dtype=np.uint8)
+        table[:len(self.colors)] = self.colors
+        return table.tobytes(), size_field
+
+
+def _source_palette(img: Image.Image, source: GifFile, colors: int, reserve: bool) -> SharedPalette | None:
+    """The source's global color table, if every frame uses it and it fits in ``colors``.
+
+    Which table each frame uses and its transparent index come from the
+    parsed blocks of ``img``. With ``reserve``, an index no pixel uses is
+    set aside as transparent for delta frames when the source has no
+    transparency of its own.
+    """
+    table = source.color_table
+    if table is None or len(source.frames) != frame_count(img):
+        return None
+    rgb = np.frombuffer(table, dtype=np.uint8).reshape(-1, 3)
+    if len(rgb) > colors:
+        return None
+    if any(frame.local_table and frame.color_table != table for frame in source.frames):
+        return None
+    declared = {frame.transparency for frame in source.frames}
+    if len(declared - {None}) > 1:
+        return None
+    used = np.zeros(256, dtype=bool)
+    if reserve:
+        for index in range(len(source.frames)):
+            img.seek(index)
+            if img.mode not in ("P", "L"):  # expanded to RGB: its indices are gone
+                used[:] = True
+                break
+            used |= np.asarray(img.histogram()[:256]) > 0
+    transparency = next(iter(declared - {None}), None)
+
+    # Decoded "P" frames mean the same with our header when every frame
+    # declares the same transparent index, or none does.
+    indexed = len(declared) == 1
+    if transparency is None and reserve:
+        free = np.flatnonzero(~used[:len(rgb)])
+        if free.size:
+            transparency = int(free[0])
+        elif len(rgb) < 256:
+            rgb = np.vstack([rgb, np.zeros((1, 3), dtype=np.uint8)])
+            transparency = len(rgb) - 1
+    return SharedPalette(rgb, transparency, exact=True, indexed=indexed)
+
+
+def _sampled_palette(img: Image.Image, colors: int, reserve: bool) -> SharedPalette:
+    """Octree palette over thumbnails of evenly spaced frames."""
+    total = frame_count(img)
+    picks = sorted(set(np.linspace(0, total - 1, min(total, PALETTE_SAMPLE_FRAMES)).round().astype(int)))
+    scale = min(1.0, (_SAMPLE_PIXELS / len(picks) / max(1, img.width * img.height)) ** 0.5)
+    thumb_size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    thumbs = []
+    transparent = reserve
+    for index in picks:
+        img.seek(index)
+        thumb = img.convert("RGBA").resize(thumb_size, Image.Resampling.BOX)
+        transparent = transparent or thumb.getextrema()[3][0] < 128
+        thumbs.append(np.asarray(thumb.convert("RGB")))
+    sample = Image.fromarray(np.concatenate(thumbs, axis=0))
+
+    # Keep the last entry free for transparency when pixels or delta frames need it.
+    usable = colors - 1 if transparent else colors
+    quantized = sample.quantize(usable, method=Image.Quantize.FASTOCTREE)
+    used = sorted(index for _, index in quantized.getcolors(usable) or [])
+    rgb = np.frombuffer(bytes(quantized.getpalette()), dtype=np.uint8).reshape(-1, 3)[used]
+    if transparent:
+        rgb = np.vstack([rgb, np.zeros((1, 3), dtype=np.uint8)])
+        return SharedPalette(rgb, len(rgb) - 1)
+    return SharedPalette(rgb)
+
+
+def shared_palette(img: Image.Image, colors: int = 256, source: GifFile | None = None) -> SharedPalette | None:
+    """The palette to encode ``img``'s frames with, or None for per-frame palettes.
+
+    ``source`` is ``img``'s parsed blocks, passed when the transform only
+    reorders or retimes frames, so the source's global color table is
+    still exact for them.
+    """
+    if PALETTE_MODE == "local":
+        return None
+    colors = max(16, min(256, int(colors)))
+    with palette_frames():
+        try:
+            palette = _source_palette(img, source, colors, DELTA_FRAMES) if source is not None else None
+            return palette or _sampled_palette(img, colors, DELTA_FRAMES)
+        finally:
+            img.seek(0)
+
+
+class GifWriter:
+    """Write an animated GIF to ``fp`` one frame at a time.
+
+    Without a ``palette`` every frame gets its own adaptive palette as a
+    local color table and is drawn full size with ``disposal`` 2. With one,
+    frames are mapped onto it, it becomes the global color table, and (with
+    ``GIF_DELTA``) each frame is written as the rectangle that changed since
+    the previous one, unchanged pixels inside it set to the transparent
+    index. Consecutive identical frames are merged into one with the summed
+    duration, like Pillow does.
+
+    Frames are compressed on the frame pool (``threads``, default
+    ``GIF_THREADS``) and written in order; ``prepare`` is safe to call from
+    worker threads once the first frame has been added.
+    """
+
+    def __init__(self, fp, loop: int = 0, colors: int = 256, disposal: int = 2,
+                 palette: SharedPalette | None = None, delta: bool | None = None,
+                 threads: int | None = None):
+        self.fp = fp
+        self.loop = loop
+        self.colors = max(16, min(256, int(colors)))
+        self.disposal = disposal
+        self.palette = palette
+        self.delta = palette is not None and (DELTA_FRAMES if delta is None else delta)
+        self.threads = GIF_THREADS if threads is None else threads
+        self.size = None
+        self.frames_written = 0
+        self._started = False
+        self._canvas = None  # palette indices on screen after the last written frame
+        self._pending = None  # (frame or indices, duration) waiting for a possible duplicate
+        self._encoding = deque()  # blocks being compressed, oldest first
+
+    def _write_header(self):
+        self._started = True
+        width, height = self.size
+        if self.palette is None:
+            # No global color table: every frame carries its own.
+            self.fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        else:
+            table, size_field = self.palette.table_bytes()
+            self.fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0x80 | size_field, 0, 0) + table)
+        if self.loop is not None:
+            self.fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", int(self.loop)) + b"\x00")
+
+    def _fit(self, frame: Image.Image) -> Image.Image:
+        """``frame`` as RGBA at the canvas size; the first frame fixes that size."""
+        if frame.mode != "RGBA":
+            frame = frame.convert("RGBA")
+        if self.size is None:
+            self.size = frame.size
+        elif frame.size != self.size:
+            frame = frame.resize(self.size, Image.Resampling.LANCZOS)
+        return frame
+
+    def quantize(self, frame: Image.Image) -> np.ndarray:
+        """Palette indices of ``frame`` against the shared palette."""
+        if frame.mode == "P" and self.palette.indexed:
+            self.size = self.size or frame.size
+            if frame.size == self.size:
+                return np.asarray(frame)
+        return self.palette.indices(self._fit(frame))
+
+    def prepare(self, frame: Image.Image) -> Image.Image | np.ndarray:
+        """The per-frame work before ordering: quantizing, or fitting to the canvas."""
+        return self._fit(frame) if self.palette is None else self.quantize(frame)
+
+    def encode_frame(self, frame: Image.Image, duration: int) -> bytes:
+        """Quantize ``frame`` on its own palette and return its graphic control and image blocks."""
+        frame = self._fit(frame)
+        paletted = frame.convert("P", palette=Image.Palette.ADAPTIVE, colors=self.colors)
+        params = {"duration": duration, "disposal": self.disposal, "include_color_table": True, "optimize": True}
+        # Drop unused entries, as Pillow's own writer does, so the local color
+        # table is as small as possible.
+        used = sorted(index for _, index in paletted.getcolors(256))
+        paletted = paletted.remap_palette(used, bytes(paletted.getpalette("RGB")))
+        return b"".join(GifImagePlugin.getdata(paletted, **params))
+
+    @staticmethod
+    def _compress(region: np.ndarray, offset: tuple[int, int], params: dict) -> bytes:
+        height, width = region.shape
+        paletted = Image.frombytes("P", (width, height), np.ascontiguousarray(region).tobytes())
+        return b"".join(GifImagePlugin.getdata(paletted, offset=offset, **params))
+
+    def _plan_indices(self, indices: np.ndarray, duration: int, following: np.ndarray | None) -> tuple:
+        """Region, offset and parameters for a quantized frame, relative to what is on screen.
+
+        If ``following`` turns pixels transparent that this frame shows, the
+        frame is written full size with disposal 2 so the canvas is cleared
+        before it; a delta frame can only paint over the previous one.
+        """
+        height, width = indices.shape
+        transparency = self.palette.transparency
+        canvas = self._canvas if self.delta else None
+        clears = (
+            self.delta and transparency is not None and following is not None
+            and bool(np.any((following == transparency) & (indices != transparency)))
+        )
+
+        box = (0, 0, width, height)
+        region = indices
+        if canvas is not None:
+            changed = indices != canvas
+            if not clears:
+                rows = np.flatnonzero(changed.any(axis=1))
+                cols = np.flatnonzero(changed.any(axis=0))
+                if rows.size:
+                    box = (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+                else:
+                    box = (0, 0, 1, 1)
+            left, top, right, bottom = box
+            region = indices[top:bottom, left:right]
+            if transparency is not None:
+                region = np.where(changed[top:bottom, left:right], region, np.uint8(transparency))
+
+        params = {"duration": duration, "disposal": 2 if clears or not self.delta else 1}
+        if transparency is not None:
+            params["transparency"] = transparency
+        if clears:
+            self._canvas = np.full_like(indices, transparency)
+        else:
+            self._canvas = indices
+        return region, box[:2], params
+
+    def _submit(self, fn: Callable, *args):
+        """Compress on the frame pool; blocks are written in submission order."""
+        if self.threads <= 1:
+            self.write_encoded(fn(*args))
+            return
+        self._encoding.append(_pool(self.threads).submit(fn, *args))
+        while len(self._encoding) > 2 * self.threads:
+            self.write_encoded(self._encoding.popleft().result())
+
+    def _drain(self):
+        while self._encoding:
+            self.write_encoded(self._encoding.popleft().result())
+
+    def write_encoded(self, block: bytes):
+        """Append a finished frame block, e.g. one from ``encode_frame``, after those queued."""
+        if not self._started:
+            self._write_header()
+        self.fp.write(block)
+        self.frames_written += 1
+
+    def _flush_pending(self, following: np.ndarray | None = None):
+        if self._pending is not None:
+            item, duration = self._pending
+            self._pending = None
+            if self.palette is None:
+                self._submit(self.encode_frame, item, duration)
+            else:
+                self._submit(self._compress, *self._plan_indices(item, duration, following))
+
+    def add(self, frame: Image.Image, duration: int):
+        self.add_prepared(self.prepare(frame), duration)
+
+    def add_prepared(self, item: Image.Image | np.ndarray, duration: int):
+        """Add a frame that already went through ``prepare``."""
+        if self.palette is not None:
+            self.add_indices(item, duration)
+            return
+        if self._pending is not None:
+            previous, previous_duration = self._pending
+            if previous.size == item.size and previous.tobytes() == item.tobytes():
+                self._pending = (previous, previous_duration + duration)
+                return
+        self._flush_pending()
+        self._pending = (item, duration)
+
+    def add_indices(self, indices: np.ndarray, duration: int):
+        """Add a frame already quantized against the shared palette."""
+        if self._pending is not None:
+            previous, previous_duration = self._pending
+            if np.array_equal(previous, indices):
+                self._pending = (previous, previous_duration + duration)
+                return
+        self._flush_pending(indices)
+        self._pending = (indices, duration)
+
+    def pack(self, frame: Image.Image, duration: int) -> bytes | tuple:
+        """A compact form of ``frame`` for writing later, possibly out of order.
+
+        Per-frame palettes give the finished blocks; a shared palette gives the
+        zlib-compressed indices, since delta frames depend on their neighbours.
+        """
+        if self.palette is None:
+            return self.encode_frame(frame, duration)
+        indices = self.quantize(frame)
+        return indices.shape, zlib.compress(indices.tobytes(), 1)
+
+    def add_packed(self, packed: bytes | tuple, duration: int):
+        """Add a frame produced by ``pack``."""
+        if isinstance(packed, bytes):
+            self._flush_pending()
+            self._drain()
+            self.write_encoded(packed)
+            return
+        shape, data = packed
+        self.add_indices(np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape), duration)
+
+    def close(self):
+        self._flush_pending()
+        self._drain()
+        self.fp.write(b";")
+
+
+def encode_gif(frames: Iterable[tuple[Image.Image, int]], loop: int = 0, colors: int = 256,
+               palette: SharedPalette | None = None,
+               transform: Callable[[Image.Image], Image.Image] | None = None) -> bytes:
+    """Encode ``(frame, duration)`` pairs as an animated GIF, streaming frame by frame.
+
+    ``transform`` is applied to each frame on the frame pool, together with
+    quantizing.
+    """
+    buf = io.BytesIO()
+    writer = GifWriter(buf, loop, colors, palette=palette)
+
+    def prepare(item):
+        frame, duration = item
+        return writer.prepare(transform(frame) if transform else frame), duration
+
+    for prepared, duration in frame_map(prepare, frames, writer.threads):
+        writer.add_prepared(prepared, duration)
+    writer.close()
+    return buf.getvalue()
@@ -0,0 +1,208 @@
+"""Content-addressed store for uploaded images.
+
+Clients upload an image once and refer to it by handle afterwards. Handles
+are SHA-256 digests of the encoded bytes, so re-uploading the same file gives
+the same handle. Recently used images stay in memory (encoded bytes plus the
+decoded PIL image) under a byte cap; evicted entries spill to a local
+directory and are decoded again on their next use.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+from PIL import Image
+
+from .io_utils import bytes_to_image
+
+DEFAULT_MEMORY_BYTES = int(os.environ.get("IMAGE_STORE_MEMORY_MB", "256")) * 1024 * 1024
+DEFAULT_DISK_BYTES = int(os.environ.get("IMAGE_STORE_DISK_MB", "1024")) * 1024 * 1024
+DEFAULT_DIR = os.environ.get("IMAGE_STORE_DIR") or os.path.join(tempfile.gettempdir(), "image-lab-store")
+
+
+class ImageNotStored(KeyError):
+    """Raised when a handle is unknown or has expired from the store."""
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def trim_directory(directory: str, max_bytes: int, suffix: str) -> int:
+    """Delete the oldest ``*suffix`` files until the directory fits ``max_bytes``; return the bytes left."""
+    files = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def _decoded_size(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class _Entry:
+    __slots__ = ("raw", "image", "decoding")
+
+    def __init__(self, raw: bytes, image: Image.Image | None = None):
+        self.raw = raw
+        self.image = image
+        # Held while decoding, so concurrent readers of one handle decode it once.
+        self.decoding = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self.raw) + (_decoded_size(self.image) if self.image is not None else 0)
+
+
+class ImageStore:
+    """LRU of uploaded images keyed by content hash, spilling to disk."""
+
+    def __init__(self, memory_bytes: int = DEFAULT_MEMORY_BYTES, disk_bytes: int = DEFAULT_DISK_BYTES,
+                 directory: str | None = DEFAULT_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._used = 0
+        # Estimated bytes in ``directory``; None until the first trim has measured it.
+        self._spilled = None
+        self._lock = threading.Lock()
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.bin")
+
+    def put(self, raw: bytes, image: Image.Image | None = None) -> str:
+        """Store encoded image bytes and return their handle.
+
+        Pass the decoded image as well when the caller already has it, so the
+        first ``get_image`` does not decode again.
+        """
+        handle = content_hash(raw)
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                entry = _Entry(bytes(raw))
+                self._entries[handle] = entry
+                self._used += entry.size
+            self._entries.move_to_end(handle)
+            if image is not None and entry.image is None:
+                entry.image = image.copy()
+                self._used += _decoded_size(entry.image)
+            self._evict()
+        return handle
+
+    def __contains__(self, handle: str) -> bool:
+        with self._lock:
+            if handle in self._entries:
+                return True
+        return self._valid(handle) and self.directory is not None and os.path.exists(self._path(handle))
+
+    @staticmethod
+    def _valid(handle: str) -> bool:
+        return len(handle) == 64 and all(char in "0123456789abcdef" for char in handle)
+
+    def _load(self, handle: str) -> _Entry:
+        """Return the entry for ``handle``, reading it back from disk if needed. Lock held."""
+        entry = self._entries.get(handle)
+        if entry is not None:
+            self._entries.move_to_end(handle)
+            return entry
+        if not self._valid(handle) or self.directory is None:
+            raise ImageNotStored(handle)
+        try:
+            with open(self._path(handle), "rb") as fh:
+                raw = fh.read()
+        except OSError:
+            raise ImageNotStored(handle) from None
+        entry = _Entry(raw)
+        self._entries[handle] = entry
+        self._used += entry.size
+        return entry
+
+    def get_bytes(self, handle: str) -> bytes:
+        """Return the encoded bytes originally uploaded for ``handle``."""
+        with self._lock:
+            raw = self._load(handle).raw
+            self._evict()
+        return raw
+
+    def get_image(self, handle: str) -> Image.Image:
+        """Return a private copy of the decoded image for ``handle``.
+
+        Decoding happens outside the store lock, so a large upload does not
+        stall requests for other handles.
+        """
+        with self._lock:
+            entry = self._load(handle)
+            self._evict()
+        decoded = entry.image
+        if decoded is None:
+            with entry.decoding:
+                decoded = entry.image
+                if decoded is None:
+                    decoded = bytes_to_image(entry.raw)
+                    with self._lock:
+                        if entry.image is None:
+                            entry.image = decoded
+                            if self._entries.get(handle) is entry:
+                                self._used += _decoded_size(decoded)
+                                self._evict()
+                        decoded = entry.image
+        image = decoded.copy()
+        # copy() keeps info but drops the source format the routes report back.
+        image.format = decoded.format
+        return image
+
+    def _evict(self):
+        """Drop least recently used entries until memory use fits the cap. Lock held."""
+        while self._used > self.memory_bytes and len(self._entries) > 1:
+            handle, entry = self._entries.popitem(last=False)
+            self._used -= entry.size
+            self._spill(handle, entry.raw)
+
+    def _spill(self, handle: str, raw: bytes):
+        """Write an evicted entry to disk, trimming the directory only once it is over budget. Lock held."""
+        if self.directory is None:
+            return
+        path = self._path(handle)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(path):
+                return
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(raw)
+            os.replace(tmp, path)
+            if self._spilled is not None:
+                self._spilled += len(raw)
+            if self._spilled is None or self._spilled > self.disk_bytes:
+                self._spilled = trim_directory(self.directory, self.disk_bytes, ".bin")
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._used,
+                "memory_cap": self.memory_bytes,
+            }
+
+
+IMAGE_STORE = ImageStore()
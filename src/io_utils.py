@@ -1,6 +1,8 @@
 import base64
 import io
 import json
+import math
+import os
 from PIL import Image, ImageStat, ExifTags, PngImagePlugin
 from PIL.ExifTags import TAGS, GPSTAGS
 
@@ -26,6 +28,29 @@ ALLOWED_EXPORT = {
     "gif":  ("GIF",  "image/gif"),
 }
 
+# Encoder settings per profile. "fast" is for intermediate results that go
+# straight back to the editor, "smallest" for final downloads.
+ENCODER_PROFILES = {
+    "fast": {
+        "JPEG": {},
+        "WEBP": {"method": 0},
+        "PNG": {"compress_level": 1},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True},
+        "WEBP": {"method": 4},
+        "PNG": {"compress_level": 6},
+    },
+    "smallest": {
+        "JPEG": {"optimize": True, "progressive": True},
+        "WEBP": {"method": 6},
+        "PNG": {"optimize": True},
+    },
+}
+
+# Longest side decoded when only statistics or a preview are needed.
+PREVIEW_MAX_SIDE = int(os.environ.get("PREVIEW_MAX_SIDE", "1024"))
+
 EXIF_TEXT_TAGS = {
     "title": 270,
     "description": 270,
@@ -39,14 +64,57 @@ EXIF_TEXT_TAGS = {
 }
 
 
+def bytes_to_image(raw: bytes) -> Image.Image:
+    """Decode raw encoded image bytes to a PIL Image."""
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    return img
+
+
+def encoder_profile(value: str | None, default: str) -> str:
+    """A requested profile name, or ``default`` when it is missing or unknown."""
+    key = (value or "").strip().lower()
+    return key if key in ENCODER_PROFILES else default
+
+
+def open_image(raw: bytes) -> Image.Image:
+    """Open encoded image bytes reading only the header; pixels decode on first use."""
+    return Image.open(io.BytesIO(raw))
+
+
+def reduced_decode(img: Image.Image, max_side: int = PREVIEW_MAX_SIDE) -> Image.Image:
+    """Decode ``img`` at roughly ``max_side`` pixels on its longest side.
+
+    A lazily opened JPEG decodes through ``draft`` DCT scaling (by 1/2 to
+    1/8) and JPEG 2000 through its resolution levels, so the full-size
+    bitmap never exists. Other formats decode in full and are then box
+    reduced by a whole factor. ``img`` may be changed in place, so read
+    its size and mode first.
+    """
+    scale = max(img.size) / max(1, max_side)
+    if scale >= 1.5 and img.tile:  # not decoded yet
+        # The nearest power of two, so a 50 MP photo gets 1/8 rather than 1/4.
+        shift = max(1, round(math.log2(scale)))
+        if img.format == "JPEG":
+            step = 1 << min(3, shift)
+            img.draft(img.mode, (max(1, img.width // step), max(1, img.height // step)))
+        elif img.format == "JPEG2000":
+            img.reduce = min(5, shift)
+    img.load()
+    factor = int(max(img.size) / max(1, max_side))
+    if factor < 2:
+        return img
+    try:
+        return img.reduce(factor)
+    except ValueError:  # modes like "P" and "1" cannot be reduced directly
+        return img.convert("RGBA" if img.has_transparency_data else "RGB").reduce(factor)
+
+
 def b64_to_image(data_url: str) -> Image.Image:
     """Convert a base64 data URL to a PIL Image."""
     if "," in data_url:
         data_url = data_url.split(",", 1)[1]
-    raw = base64.b64decode(data_url)
-    img = Image.open(io.BytesIO(raw))
-    img.load()
-    return img
+    return bytes_to_image(base64.b64decode(data_url))
 
 
 def normalize_metadata(metadata: dict | None) -> dict:
@@ -211,9 +279,10 @@ def _prepare_pnginfo(metadata: dict) -> PngImagePlugin.PngInfo | None:
     return pnginfo
 
 
-def _save_with_metadata(img: Image.Image, buf: io.BytesIO, fmt: str, quality: int, metadata: dict | None = None):
-    save_kwargs = {}
+def _save_with_metadata(img: Image.Image, buf: io.BytesIO, fmt: str, quality: int, metadata: dict | None = None,
+                        profile: str = "smallest"):
     fmt_upper = fmt.upper()
+    save_kwargs = dict(ENCODER_PROFILES[profile].get(fmt_upper, {}))
     metadata = normalize_metadata(metadata)
 
     if fmt_upper == "JPEG":
@@ -229,16 +298,13 @@ def _save_with_metadata(img: Image.Image, buf: io.BytesIO, fmt: str, quality: in
         elif img.mode != "RGB":
             img = img.convert("RGB")
         save_kwargs["quality"] = int(quality)
-        save_kwargs["optimize"] = True
 
     elif fmt_upper == "WEBP":
         if img.mode not in ("RGB", "RGBA"):
             img = img.convert("RGBA" if "A" in img.mode else "RGB")
         save_kwargs["quality"] = int(quality)
-        save_kwargs["method"] = 6
 
     elif fmt_upper == "PNG":
-        save_kwargs["optimize"] = True
         pnginfo = _prepare_pnginfo(metadata)
         if pnginfo:
             save_kwargs["pnginfo"] = pnginfo
@@ -257,12 +323,21 @@ def _save_with_metadata(img: Image.Image, buf: io.BytesIO, fmt: str, quality: in
     img.save(buf, format=fmt, **save_kwargs)
 
 
-def image_to_dataurl(img: Image.Image, fmt="PNG", quality=92) -> str:
-    """Convert a PIL Image to a base64 data URL."""
+def image_to_bytes(img: Image.Image, fmt="PNG", quality=92, profile="fast") -> tuple[bytes, str]:
+    """Encode a PIL Image and return the bytes with their MIME type.
+
+    Defaults to the ``fast`` profile: these are intermediate results.
+    """
     buf = io.BytesIO()
-    _save_with_metadata(img, buf, fmt, quality)
+    _save_with_metadata(img, buf, fmt, quality, profile=profile)
     mime = next((m for _, (f, m) in ALLOWED_EXPORT.items() if f == fmt.upper()), "image/png")
-    return f"data:{mime};base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    return buf.getvalue(), mime
+
+
+def image_to_dataurl(img: Image.Image, fmt="PNG", quality=92, profile="fast") -> str:
+    """Convert a PIL Image to a base64 data URL."""
+    raw, mime = image_to_bytes(img, fmt, quality, profile)
+    return f"data:{mime};base64," + base64.b64encode(raw).decode("ascii")
 
 
 def exif_to_dict(img: Image.Image) -> dict:
@@ -307,13 +382,18 @@ def exif_to_dict(img: Image.Image) -> dict:
 
 
 def stats_for(img: Image.Image) -> dict:
-    """Get statistics for an image."""
+    """Get statistics for an image.
+
+    Header fields are read before any decoding and the mean color comes
+    from ``reduced_decode``, so a lazily opened upload is never decoded at
+    full size just to be inspected.
+    """
     fmt = (img.format or "").upper()
     mode = img.mode
     width, height = img.size
 
     try:
-        stat_img = img.convert("RGB")
+        stat_img = reduced_decode(img).convert("RGB")
         stat = ImageStat.Stat(stat_img)
         mean = tuple(int(x) for x in stat.mean)
     except Exception:
@@ -0,0 +1,357 @@
+"""Background jobs for slow operations.
+
+Seam carving, AI background removal and the GIF transforms can take far
+longer than an interactive request should. ``JOB_QUEUE`` runs them in a small
+pool of long-lived worker processes so the web worker only queues the job and
+answers at once; clients poll for status and fetch the result later. Each
+worker handles one job at a time. Cancelling a running job, or letting it
+exceed its timeout, terminates that worker and starts a fresh one.
+"""
+from collections import OrderedDict
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+import traceback
+import uuid
+
+DEFAULT_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+DEFAULT_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", "240"))
+DEFAULT_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", "32"))
+DEFAULT_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "600"))
+START_METHOD = os.environ.get("JOB_START_METHOD", "spawn")
+
+GIF_JOB_OPS = {"gif_resize", "gif_trim", "gif_speed", "gif_reverse", "gif_pingpong", "gif_optimize", "gif_frames_zip"}
+IMAGE_JOB_OPS = {"seam_carve", "background_remove", "background_remove_ai", "pipeline"}
+JOB_OPS = IMAGE_JOB_OPS | GIF_JOB_OPS
+
+
+class JobError(Exception):
+    """Raised for unknown jobs or jobs whose result is not available."""
+
+
+class QueueFull(JobError):
+    """Raised when too many jobs are already waiting."""
+
+
+def run_job(op: str, raw: bytes, params: dict) -> tuple[bytes, str]:
+    """Run one operation on encoded input bytes and return ``(bytes, mime)``.
+
+    This is what the worker processes execute; it can also be called inline.
+    """
+    from . import gif_ops
+    from .anim_stream import ANIMATION_FORMATS, animation_format
+    from .io_utils import bytes_to_image, image_to_bytes
+    from .pipeline import STEPS, run_pipeline
+
+    if op in GIF_JOB_OPS:
+        fmt = animation_format(params.get("format"))
+        if op == "gif_resize":
+            keep_aspect = str(params.get("keep_aspect", True)).strip().lower() not in {"", "0", "false", "no", "off"}
+            out = gif_ops.resize_gif(raw, int(params.get("width", 0)), int(params.get("height", 0)), keep_aspect,
+                                     fmt)
+        elif op == "gif_trim":
+            out = gif_ops.trim_gif(raw, int(params.get("start_frame", 0)), int(params.get("end_frame", -1)), fmt)
+        elif op == "gif_speed":
+            out = gif_ops.change_gif_speed(raw, float(params.get("speed_factor", 1.0)), fmt)
+        elif op == "gif_reverse":
+            out = gif_ops.reverse_gif(raw, fmt)
+        elif op == "gif_pingpong":
+            out = gif_ops.pingpong_gif(raw, fmt)
+        elif op == "gif_optimize":
+            out = gif_ops.optimize_gif(raw, int(params.get("colors", 128)), int(params.get("frame_step", 1)), fmt)
+        else:
+            level = params.get("compress_level")
+            deflate = params.get("deflate")
+            if deflate is not None:
+                deflate = str(deflate).strip().lower() not in {"", "0", "false", "no", "off"}
+            out = gif_ops.gif_to_frames_zip(raw, int(level) if level not in (None, "") else None, deflate)
+            return out, "application/zip"
+        return out, ANIMATION_FORMATS[fmt]
+
+    img = bytes_to_image(raw)
+    if op == "pipeline":
+        out, mime, _, _ = run_pipeline(img, params.get("steps") or [])
+        return out, mime
+    return image_to_bytes(STEPS[op](img, params), "PNG")
+
+
+def _worker_main(conn):
+    from .bg_remove import preload_enabled, preload_sessions
+
+    if preload_enabled():
+        # Warm the rembg sessions before taking jobs so none pays the cold start.
+        preload_sessions()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        job_id, op, raw, params = message
+        try:
+            conn.send((job_id, True, run_job(op, raw, params)))
+        except Exception as exc:
+            traceback.print_exc()
+            conn.send((job_id, False, str(exc) or exc.__class__.__name__))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                self.process.terminate()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class _Job:
+    def __init__(self, op: str, raw: bytes, params: dict, timeout: float):
+        self.id = uuid.uuid4().hex
+        self.op = op
+        self.raw = raw
+        self.params = params
+        self.timeout = timeout
+        self.state = "queued"
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self) -> dict:
+        now = time.time()
+        info = {
+            "job_id": self.id,
+            "op": self.op,
+            "status": self.state,
+            "created": self.created,
+            "queued_s": round((self.started or now) - self.created, 3),
+        }
+        if self.started is not None:
+            info["run_s"] = round((self.finished or now) - self.started, 3)
+        if self.error:
+            info["error"] = self.error
+        if self.result is not None:
+            info["result_bytes"] = len(self.result[0])
+            info["mime"] = self.result[1]
+        return info
+
+
+class JobQueue:
+    """Bounded pool of worker processes with polling, cancellation and timeouts."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT,
+                 max_pending: int = DEFAULT_MAX_PENDING, result_ttl: float = DEFAULT_RESULT_TTL,
+                 start_method: str = START_METHOD):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.start_method = start_method
+        self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+        self._pending: list[_Job] = []
+        self._pool: list[_Worker] = []
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        ctx = multiprocessing.get_context(self.start_method)
+        self._pool = [_Worker(ctx) for _ in range(self.workers)]
+        self._ctx = ctx
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: str, raw: bytes, params: dict | None = None, timeout: float | None = None) -> str:
+        if op not in JOB_OPS:
+            raise JobError(f"unknown job op '{op}'")
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise QueueFull("Too many queued jobs; try again shortly.")
+            limit = self.timeout if timeout is None else min(float(timeout), self.timeout)
+            job = _Job(op, raw, dict(params or {}), limit)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._ensure_started()
+        self._wake.set()
+        return job.id
+
+    def _get(self, job_id: str) -> _Job:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobError(f"unknown job '{job_id}'")
+        return job
+
+    def status(self, job_id: str) -> dict:
+        with self._lock:
+            info = self._get(job_id).to_dict()
+            if info["status"] == "queued":
+                info["position"] = next(i for i, job in enumerate(self._pending) if job.id == job_id)
+            return info
+
+    def result(self, job_id: str) -> tuple[bytes, str]:
+        with self._lock:
+            job = self._get(job_id)
+            if job.state != "done":
+                raise JobError(f"job is {job.state}")
+            return job.result
+
+    def cancel(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._get(job_id)
+            if job.state == "queued":
+                self._pending.remove(job)
+                self._finish(job, "cancelled")
+            elif job.state == "running":
+                job.state = "cancelling"
+        self._wake.set()
+        return self.status(job_id)
+
+    def wait(self, job_ids, timeout: float | None = None) -> list[str]:
+        """Block until at least one of ``job_ids`` has finished; return the finished ones.
+
+        Returns an empty list if none finished within ``timeout`` seconds.
+        """
+        def finished():
+            return [job_id for job_id in job_ids if self._get(job_id).finished is not None]
+
+        with self._finished:
+            return self._finished.wait_for(finished, timeout)
+
+    def forget(self, job_id: str):
+        """Drop a finished job and its result now instead of after the result TTL."""
+        with self._lock:
+            if self._get(job_id).finished is None:
+                raise JobError("job has not finished")
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {"workers": self.workers, "queued": len(self._pending), "jobs": states}
+
+    def _finish(self, job: _Job, state: str, error: str | None = None, result=None):
+        job.state = state
+        job.error = error
+        job.result = result
+        job.raw = None
+        job.finished = time.time()
+        self._finished.notify_all()
+
+    def _retire(self, worker: _Worker, retired: list):
+        """Take a dead or runaway worker out of the pool. Lock held; ``_replace`` stops it later."""
+        worker.job = None
+        self._pool.remove(worker)
+        retired.append(worker)
+
+    def _replace(self, retired: list):
+        """Kill retired workers and start fresh ones, without holding the lock."""
+        fresh = []
+        for worker in retired:
+            worker.stop(kill=True)
+            if not self._stopping.is_set():
+                fresh.append(_Worker(self._ctx))
+        with self._lock:
+            self._pool.extend(fresh)
+        self._wake.set()
+
+    def _dispatch(self):
+        while not self._stopping.is_set():
+            busy = [worker for worker in self._pool if worker.job is not None]
+            if busy:
+                ready = wait([worker.conn for worker in busy], timeout=0.1)
+            else:
+                self._wake.wait(timeout=1.0)
+                ready = []
+            self._wake.clear()
+
+            retired = []
+            with self._lock:
+                for worker in busy:
+                    if worker.conn not in ready:
+                        continue
+                    try:
+                        job_id, ok, payload = worker.conn.recv()
+                    except (EOFError, OSError):
+                        self._finish(worker.job, "failed", "Worker process exited unexpectedly.")
+                        self._retire(worker, retired)
+                        continue
+                    job = worker.job
+                    worker.job = None
+                    if job.id != job_id:
+                        continue
+                    if ok:
+                        self._finish(job, "done", result=payload)
+                    else:
+                        self._finish(job, "failed", payload)
+
+                now = time.time()
+                for worker in list(self._pool):
+                    job = worker.job
+                    if job is None:
+                        continue
+                    if job.state == "cancelling":
+                        self._finish(job, "cancelled")
+                    elif now - job.started > job.timeout:
+                        self._finish(job, "timeout", f"Job exceeded its {job.timeout:g}s limit.")
+                    else:
+                        continue
+                    self._retire(worker, retired)
+
+                for worker in list(self._pool):
+                    if worker.job is None and self._pending:
+                        job = self._pending.pop(0)
+                        job.state = "running"
+                        job.started = time.time()
+                        worker.job = job
+                        try:
+                            worker.conn.send((job.id, job.op, job.raw, job.params))
+                        except OSError:
+                            self._finish(job, "failed", "Could not hand the job to a worker.")
+                            self._retire(worker, retired)
+
+                self._expire(now)
+            if retired:
+                self._replace(retired)
+
+    def _expire(self, now: float):
+        """Forget finished jobs older than the result TTL. Lock held."""
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job.finished is not None and now - job.finished > self.result_ttl:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            for worker in self._pool:
+                worker.stop(kill=worker.job is not None)
+            self._pool = []
+
+
+JOB_QUEUE = JobQueue()
@@ -1,72 +1,187 @@
-from collections import deque
+import os
 from PIL import Image, ImageFilter
 import numpy as np
 from .io_utils import image_to_dataurl, ALLOWED_EXPORT
+from .result_cache import memoize
 
+# remove_background works in row bands of about this many pixels; 0 takes
+# the whole image as one band.
+BACKGROUND_BAND_PIXELS = int(os.environ.get("BG_BAND_PIXELS", str(1 << 20)))
 
-def convert_img(img: Image.Image, to_key: str, quality: int):
+
+@memoize("convert_img")
+def convert_img(img: Image.Image, to_key: str, quality: int, profile: str = "fast"):
     """Convert image to a different format."""
     fmt, _ = ALLOWED_EXPORT.get((to_key or "png").lower(), ("PNG", "image/png"))
-    return image_to_dataurl(img, fmt, quality)
+    return image_to_dataurl(img, fmt, quality, profile)
 
 
-def _flood_background(similar: np.ndarray) -> np.ndarray:
-    """Mark only similar pixels that are connected to the image border."""
-    height, width = similar.shape
-    visited = np.zeros_like(similar, dtype=bool)
-    queue = deque()
+def _run_starts(mask: np.ndarray) -> np.ndarray:
+    """True at the first pixel of every horizontal run of True pixels."""
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    return starts
 
-    def enqueue(x: int, y: int):
-        if 0 <= x < width and 0 <= y < height and similar[y, x] and not visited[y, x]:
-            visited[y, x] = True
-            queue.append((x, y))
 
-    for x in range(width):
-        enqueue(x, 0)
-        enqueue(x, height - 1)
-    for y in range(height):
-        enqueue(0, y)
-        enqueue(width - 1, y)
+def _run_labels(mask: np.ndarray, first: int = 1, dtype=np.int32) -> np.ndarray:
+    """Number every horizontal run of True pixels from ``first`` (0 = outside)."""
+    labels = np.cumsum(_run_starts(mask), dtype=dtype).reshape(mask.shape)
+    labels += first - 1
+    labels[~mask] = 0
+    return labels
 
-    while queue:
-        x, y = queue.popleft()
-        enqueue(x + 1, y)
-        enqueue(x - 1, y)
-        enqueue(x, y + 1)
-        enqueue(x, y - 1)
 
-    return visited
+def _roots(parent: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Union-find roots of ``nodes``, halving their paths in ``parent`` on the way."""
+    while True:
+        up = parent[nodes]
+        above = parent[up]
+        if np.array_equal(up, above):
+            return up
+        parent[nodes] = above
 
 
-def remove_background(img: Image.Image, tol: float):
-    """Remove a likely studio/background color with soft edge matting."""
-    arr = np.array(img.convert("RGBA"), dtype=np.uint8)
-    rgb = arr[:, :, :3].astype(np.float32)
+def _union(parent: np.ndarray, a: np.ndarray, b: np.ndarray):
+    """Join the sets of every pair ``a[i]``, ``b[i]``; each root points to the smallest one."""
+    nodes = np.unique(np.concatenate([a, b]))
+    while a.size:
+        root_a, root_b = _roots(parent, a), _roots(parent, b)
+        differ = root_a != root_b
+        a, b, root_a, root_b = a[differ], b[differ], root_a[differ], root_b[differ]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        _roots(parent, nodes)
+
+
+def _touching_runs(upper: np.ndarray, lower: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Label pairs of runs that touch between two stacked label arrays, one pair per overlap."""
+    both = (upper > 0) & (lower > 0)
+    # Pixels continuing the same pair of runs from their left neighbour add nothing.
+    both[..., 1:] &= ~(both[..., :-1] & (upper[..., 1:] == upper[..., :-1]) & (lower[..., 1:] == lower[..., :-1]))
+    return upper[both], lower[both]
+
+
+def _flood_background(similar: np.ndarray) -> np.ndarray:
+    """Mark only similar pixels that are connected to the image border.
+
+    Equivalent to a 4-connected flood fill seeded from the border.
+    """
+    return _flood_background_banded(similar, similar.shape[0])
 
-    top = rgb[0, :, :]
-    bottom = rgb[-1, :, :]
-    left = rgb[:, 0, :]
-    right = rgb[:, -1, :]
-    border = np.concatenate([top, bottom, left, right], axis=0)
 
+def _flood_background_banded(similar: np.ndarray, rows: int) -> np.ndarray:
+    """``_flood_background`` with run labels for only ``rows`` rows at a time.
+
+    Horizontal runs are labelled once, band by band, and runs touching
+    vertically are merged with union-find, so the cost is linear in the
+    pixels however winding the region is. A second pass labels each band
+    again and keeps the runs whose set reaches the border.
+    """
+    height, width = similar.shape
+    rows = max(1, rows)
+    bands = [(top, min(height, top + rows)) for top in range(0, height, rows)]
+    counts = [int(np.count_nonzero(_run_starts(similar[top:bottom]))) for top, bottom in bands]
+    total = sum(counts)
+    dtype = np.int32 if total < np.iinfo(np.int32).max else np.int64
+    parent = np.arange(total + 1, dtype=dtype)
+    seeded = []
+
+    first = 1
+    previous = None  # labels of the row above the band
+    for (top, bottom), count in zip(bands, counts):
+        labels = _run_labels(similar[top:bottom], first, dtype)
+        # Copies, so the seeds do not keep every band's labels alive.
+        seeded.extend([labels[:, 0].copy(), labels[:, -1].copy()])
+        if top == 0:
+            seeded.append(labels[0].copy())
+        if bottom == height:
+            seeded.append(labels[-1].copy())
+        upper, lower = _touching_runs(labels[:-1], labels[1:])
+        if previous is not None:
+            across = _touching_runs(previous, labels[:1])
+            upper, lower = np.concatenate([upper, across[0]]), np.concatenate([lower, across[1]])
+        _union(parent, upper, lower)
+        previous = labels[-1:].copy()
+        first += count
+
+    roots = _roots(parent, np.arange(total + 1, dtype=dtype))
+    reached = np.zeros(total + 1, dtype=bool)
+    reached[roots[np.concatenate(seeded)]] = True
+    reached[0] = False
+
+    connected = np.empty((height, width), dtype=bool)
+    first = 1
+    for (top, bottom), count in zip(bands, counts):
+        connected[top:bottom] = reached[roots[_run_labels(similar[top:bottom], first, dtype)]]
+        first += count
+    return connected
+
+
+def _row_bands(height: int, width: int):
+    """Row ranges of about ``BACKGROUND_BAND_PIXELS`` pixels, and their row count."""
+    rows = height if BACKGROUND_BAND_PIXELS <= 0 else max(1, BACKGROUND_BAND_PIXELS // max(1, width))
+    return [(top, min(height, top + rows)) for top in range(0, height, rows)], rows
+
+
+def _color_distance(pixels: np.ndarray, background_color: np.ndarray) -> np.ndarray:
+    """Float32 RGB distance of every pixel to ``background_color``.
+
+    Squares the difference in place instead of going through
+    ``np.linalg.norm``'s temporaries; the sums run in the same order, so
+    the result is bit-for-bit the same.
+    """
+    diff = pixels[:, :, :3].astype(np.float32)
+    diff -= background_color
+    diff *= diff
+    distance = diff[:, :, 0] + diff[:, :, 1]
+    distance += diff[:, :, 2]
+    return np.sqrt(distance, out=distance)
+
+
+@memoize("remove_background")
+def remove_background(img: Image.Image, tol: float):
+    """Remove a likely studio/background color with soft edge matting.
+
+    Pixels are processed in row bands of about ``BG_BAND_PIXELS`` (two
+    passes: the similarity mask, then alpha), so apart from the output only
+    one-byte-per-pixel masks are full size.
+    """
+    rgba = img.convert("RGBA")
+    width, height = rgba.size
+    bands, rows = _row_bands(height, width)
+
+    def pixels(box):
+        return np.asarray(rgba.crop(box))
+
+    border = np.concatenate([
+        pixels((0, 0, width, 1))[0],
+        pixels((0, height - 1, width, height))[0],
+        pixels((0, 0, 1, height))[:, 0],
+        pixels((width - 1, 0, width, height))[:, 0],
+    ])[:, :3].astype(np.float32)
     background_color = np.median(border, axis=0)
-    distance = np.linalg.norm(rgb - background_color, axis=2)
 
     threshold = max(8.0, 12.0 + (tol / 100.0) * 120.0)
-    similar = distance <= threshold
-    connected_bg = _flood_background(similar)
+    similar = np.empty((height, width), dtype=bool)
+    for top, bottom in bands:
+        similar[top:bottom] = _color_distance(pixels((0, top, width, bottom)), background_color) <= threshold
+    connected_bg = _flood_background_banded(similar, rows)
+    del similar
 
     soft_lo = threshold * 0.62
     soft_hi = threshold * 1.55
-    soft_alpha = np.clip((distance - soft_lo) / max(1.0, soft_hi - soft_lo), 0.0, 1.0) * 255.0
-
-    alpha = arr[:, :, 3].astype(np.float32)
-    alpha[connected_bg] = np.minimum(alpha[connected_bg], soft_alpha[connected_bg])
-
-    alpha_img = Image.fromarray(alpha.astype(np.uint8), "L")
+    alpha = np.empty((height, width), dtype=np.uint8)
+    for top, bottom in bands:
+        band = pixels((0, top, width, bottom))
+        distance = _color_distance(band, background_color)
+        soft_alpha = np.clip((distance - soft_lo) / max(1.0, soft_hi - soft_lo), 0.0, 1.0) * 255.0
+        band_alpha = band[:, :, 3].astype(np.float32)
+        band_bg = connected_bg[top:bottom]
+        band_alpha[band_bg] = np.minimum(band_alpha[band_bg], soft_alpha[band_bg])
+        alpha[top:bottom] = band_alpha.astype(np.uint8)
+    del connected_bg
+
+    alpha_img = Image.fromarray(alpha, "L")
+    del alpha
     feather = max(0.8, tol / 24.0)
-    alpha_img = alpha_img.filter(ImageFilter.GaussianBlur(radius=feather))
-    alpha = np.array(alpha_img, dtype=np.uint8)
-
-    out = np.dstack([rgb.astype(np.uint8), alpha])
-    return Image.fromarray(out, "RGBA")
+    rgba.putalpha(alpha_img.filter(ImageFilter.GaussianBlur(radius=feather)))
+    return rgba
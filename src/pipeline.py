@@ -0,0 +1,131 @@
+"""Run several server-side operations on one image in a single request.
+
+The image is decoded once, handed from step to step as a PIL image and only
+encoded after the last step, instead of a PNG/base64 round trip per step.
+"""
+import time
+from PIL import Image
+
+from .bg_remove import HAS_REMBG, remove_bg_ai
+from .exporter import prepare_download
+from .io_utils import encoder_profile
+from .ops import remove_background
+from .seam import HAS_SEAM, parse_pyramid, seam_carve
+from .seam_engine import ENERGY_MODES, ORDERS
+
+
+class PipelineError(ValueError):
+    """Raised for a malformed or unsupported pipeline description."""
+
+
+def _step_remove_background(img: Image.Image, params: dict) -> Image.Image:
+    return remove_background(img, float(params.get("tolerance", 18.0)))
+
+
+def _step_remove_bg_ai(img: Image.Image, params: dict) -> Image.Image:
+    if not HAS_REMBG:
+        raise PipelineError("Local AI background removal is not available.")
+    proxy = params.get("proxy_max_side")
+    return remove_bg_ai(img, params.get("model") or None, int(proxy) if proxy not in (None, "") else None)
+
+
+def _step_seam_carve(img: Image.Image, params: dict) -> Image.Image:
+    if not HAS_SEAM:
+        raise PipelineError("Seam carving is not available.")
+    return seam_carve(
+        img,
+        int(params.get("target_width", img.width)),
+        int(params.get("target_height", img.height)),
+        params.get("order", "width-first"),
+        params.get("energy_mode", "backward"),
+        parse_pyramid(params.get("pyramid")),
+    )
+
+
+STEPS = {
+    "remove_background": _step_remove_background,
+    "background_remove": _step_remove_background,
+    "remove_bg_ai": _step_remove_bg_ai,
+    "background_remove_ai": _step_remove_bg_ai,
+    "seam_carve": _step_seam_carve,
+}
+
+# Encoding steps; only allowed last because they turn the image into bytes.
+OUTPUT_STEPS = {"export", "convert"}
+
+# Parameters converted up front, so a bad value fails the request instead of a step.
+_NUMBERS = {
+    "remove_background": {"tolerance": float},
+    "background_remove": {"tolerance": float},
+    "remove_bg_ai": {"proxy_max_side": int},
+    "background_remove_ai": {"proxy_max_side": int},
+    "seam_carve": {"target_width": int, "target_height": int},
+    "export": {"quality": int},
+    "convert": {"quality": int},
+}
+_CHOICES = {
+    "seam_carve": {"order": ORDERS, "energy_mode": ENERGY_MODES},
+}
+
+
+def _checked_step(index: int, step: dict) -> dict:
+    """``step`` with its numeric parameters converted; raises PipelineError for bad values."""
+    op = step["op"]
+    step = dict(step)
+    for name, kind in _NUMBERS.get(op, {}).items():
+        value = step.get(name)
+        if value is None or value == "":
+            continue
+        try:
+            step[name] = kind(float(value)) if kind is int else kind(value)
+        except (TypeError, ValueError, OverflowError):
+            raise PipelineError(f"step {index} ({op}): '{name}' must be a number") from None
+    for name, allowed in _CHOICES.get(op, {}).items():
+        if name in step and step[name] not in allowed:
+            raise PipelineError(f"step {index} ({op}): '{name}' must be one of: {', '.join(allowed)}")
+    return step
+
+
+def validate_steps(steps) -> list[dict]:
+    """Check the steps and return them with numeric parameters converted."""
+    if not isinstance(steps, list) or not steps:
+        raise PipelineError("steps must be a non-empty list")
+    checked = []
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or "op" not in step:
+            raise PipelineError(f"step {index} must be an object with an 'op'")
+        op = step["op"]
+        if op in OUTPUT_STEPS:
+            if index != len(steps) - 1:
+                raise PipelineError(f"'{op}' must be the last step")
+        elif op not in STEPS:
+            raise PipelineError(f"unknown pipeline op '{op}'")
+        checked.append(_checked_step(index, step))
+    return checked
+
+
+def run_pipeline(img: Image.Image, steps: list[dict]) -> tuple[bytes, str, str, list[dict]]:
+    """Apply ``steps`` in order and encode the result once.
+
+    Returns ``(raw, mime, fmt_key, timings)``. The output format comes from a
+    final ``export``/``convert`` step (``format``, ``quality``, ``metadata``,
+    ``profile``) and defaults to PNG with the ``smallest`` encoder profile.
+    """
+    steps = validate_steps(steps)
+    timings = []
+    output = {"op": "export", "format": "png"}
+    if steps[-1]["op"] in OUTPUT_STEPS:
+        output = steps[-1]
+        steps = steps[:-1]
+
+    for step in steps:
+        start = time.perf_counter()
+        img = STEPS[step["op"]](img, step)
+        timings.append({"op": step["op"], "ms": round((time.perf_counter() - start) * 1000, 2)})
+
+    start = time.perf_counter()
+    fmt_key = (output.get("format") or output.get("to") or "png").lower()
+    profile = encoder_profile(output.get("profile"), "smallest")
+    buf, mime = prepare_download(img, fmt_key, int(output.get("quality", 92)), output.get("metadata"), profile)
+    timings.append({"op": output["op"], "ms": round((time.perf_counter() - start) * 1000, 2)})
+    return buf.getvalue(), mime, fmt_key, timings
@@ -0,0 +1,344 @@
+"""Memoized results for deterministic image operations.
+
+Operations such as background removal, seam carving, format conversion and
+the GIF transforms are pure functions of their input image and parameters,
+and the editor re-runs them constantly through undo/redo and option toggles.
+``memoize`` wraps such a function so repeated calls are served from a
+byte-bounded LRU, optionally persisted to ``RESULT_CACHE_DIR`` so results
+survive restarts.
+
+Persisted results are plain data, never pickles: a one-line JSON header
+naming the type, then the payload (PNG for images, ``.npy`` for arrays,
+raw bytes or UTF-8 text). Loading one cannot run code, and the directory
+is created private to the server's user.
+"""
+from collections import OrderedDict
+import contextlib
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import threading
+import numpy as np
+from PIL import Image
+
+from .image_store import trim_directory
+
+DEFAULT_MEMORY_BYTES = int(os.environ.get("RESULT_CACHE_MB", "128")) * 1024 * 1024
+DEFAULT_DISK_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MB", "1024")) * 1024 * 1024
+DEFAULT_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+
+_HASH_STRIP_ROWS = 256
+# ``img.info`` entries that change results: transparency changes conversions
+# and alpha, the ICC profile and EXIF are carried into encoded output.
+_DIGEST_INFO_KEYS = ("transparency", "icc_profile", "exif")
+# Image modes PNG stores losslessly; results in other modes stay in memory only.
+_PNG_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"}
+_HEADER_MAX = 4096
+
+
+def input_digest(value) -> str:
+    """Hash an operation input: a PIL image, raw bytes or a data URL string."""
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(value, Image.Image):
+        digest.update(f"image:{value.mode}:{value.width}x{value.height}".encode("ascii"))
+        palette = value.getpalette() if value.mode == "P" else None
+        if palette:
+            digest.update(bytes(palette))
+        for key in _DIGEST_INFO_KEYS:
+            info = value.info.get(key)
+            if info is not None:
+                digest.update(f"info:{key}:".encode("ascii"))
+                digest.update(bytes(info) if isinstance(info, (bytes, bytearray)) else repr(info).encode("utf-8"))
+        # Hash in strips so a large photo is never copied out in one piece.
+        for top in range(0, value.height, _HASH_STRIP_ROWS):
+            strip = value.crop((0, top, value.width, min(value.height, top + _HASH_STRIP_ROWS)))
+            digest.update(strip.tobytes())
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(b"bytes:")
+        digest.update(value)
+    elif isinstance(value, str):
+        digest.update(b"str:")
+        digest.update(value.encode("utf-8"))
+    else:
+        digest.update(repr(value).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _normalize(value):
+    """Make equivalent parameter spellings hash the same (18 == 18.0, tuples == lists)."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    return repr(value)
+
+
+def _result_size(value) -> int:
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_result_size(item) for item in value)
+    return 64
+
+
+def _encode_result(value) -> tuple[dict, bytes] | None:
+    """``(header, payload)`` for a result that can be persisted, else None."""
+    if isinstance(value, Image.Image):
+        if value.mode not in _PNG_MODES:
+            return None
+        buf = io.BytesIO()
+        value.save(buf, format="PNG", compress_level=1)
+        return {"type": "image", "format": value.format}, buf.getvalue()
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return None
+        buf = io.BytesIO()
+        np.save(buf, value, allow_pickle=False)
+        return {"type": "array"}, buf.getvalue()
+    if isinstance(value, (bytes, bytearray)):
+        return {"type": "bytes"}, bytes(value)
+    if isinstance(value, str):
+        return {"type": "str"}, value.encode("utf-8")
+    return None
+
+
+def _decode_result(header: dict, payload: bytes):
+    kind = header.get("type")
+    if kind == "image":
+        img = Image.open(io.BytesIO(payload))
+        img.load()
+        img.format = header.get("format")
+        return img
+    if kind == "array":
+        return np.load(io.BytesIO(payload), allow_pickle=False)
+    if kind == "bytes":
+        return payload
+    if kind == "str":
+        return payload.decode("utf-8")
+    raise ValueError(f"unknown cached result type {kind!r}")
+
+
+def _copy_result(value):
+    """Hand out copies of mutable results so callers cannot alter cached ones."""
+    if isinstance(value, Image.Image):
+        copy = value.copy()
+        copy.format = value.format
+        return copy
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class ResultCache:
+    """Byte-bounded LRU of operation results with hit/miss counters."""
+
+    def __init__(self, memory_bytes: int = DEFAULT_MEMORY_BYTES, disk_bytes: int = DEFAULT_DISK_BYTES,
+                 directory: str | None = DEFAULT_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._entries: "OrderedDict[str, tuple[object, int]]" = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_bytes > 0 or self.directory is not None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.res")
+
+    def get(self, key: str):
+        """Return ``(True, result)`` on a hit and ``(False, None)`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, _copy_result(entry[0])
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return False, None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return True, _copy_result(value)
+
+    def put(self, key: str, value):
+        value = _copy_result(value)
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def _remember(self, key: str, value):
+        """Insert into the memory LRU and evict down to the cap. Lock held."""
+        size = _result_size(value)
+        if size > self.memory_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._used -= old[1]
+        self._entries[key] = (value, size)
+        self._used += size
+        while self._used > self.memory_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._used -= evicted
+            self.evictions += 1
+
+    def _read_disk(self, key: str):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as fh:
+                header = json.loads(fh.readline(_HEADER_MAX))
+                return _decode_result(header, fh.read())
+        except (OSError, ValueError, AttributeError):  # unreadable, truncated or foreign file
+            return None
+
+    def _write_disk(self, key: str, value):
+        if self.directory is None:
+            return
+        encoded = _encode_result(value)
+        if encoded is None:
+            return
+        header, payload = encoded
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(json.dumps(header).encode("utf-8") + b"\n")
+                fh.write(payload)
+            os.replace(tmp, path)
+            trim_directory(self.directory, self.disk_bytes, ".res")
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used = 0
+
+    def resize(self, memory_bytes: int):
+        """Change the memory cap, evicting down to it; 0 keeps nothing in memory."""
+        with self._lock:
+            self.memory_bytes = max(0, int(memory_bytes))
+            while self._used > self.memory_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._used -= evicted
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._used,
+                "memory_cap": self.memory_bytes,
+                "persistent": self.directory is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+RESULT_CACHE = ResultCache()
+
+_flights: dict[str, list] = {}  # key -> [lock, threads using it]
+_flights_lock = threading.Lock()
+
+
+def cache_key(op_name: str, digest: str, params: dict, salt=None) -> str:
+    """Result cache key for ``op_name`` on the input with ``input_digest`` ``digest``."""
+    key_material = json.dumps(
+        [op_name, digest, {name: _normalize(value) for name, value in params.items()},
+         _normalize(salt()) if salt else None],
+        sort_keys=True,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def single_flight(key: str):
+    """Let one thread at a time in this process run the block for ``key``.
+
+    Yields True when the thread had to wait for another one, which has
+    usually just cached the result the waiter is after.
+    """
+    with _flights_lock:
+        flight = _flights.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    waited = not flight[0].acquire(blocking=False)
+    if waited:
+        flight[0].acquire()
+    try:
+        yield waited
+    finally:
+        flight[0].release()
+        with _flights_lock:
+            flight[1] -= 1
+            if not flight[1]:
+                del _flights[key]
+
+
+def memoize(op_name: str, salt=None, cache: ResultCache | None = None):
+    """Cache a deterministic operation on (input hash, op name, parameters).
+
+    The first positional argument is the image input; the rest are bound to
+    the function signature with defaults applied, so ``f(img, 18)`` and
+    ``f(img, tol=18.0)`` share an entry. ``salt`` is an optional callable
+    returning extra key material for settings that live outside the
+    arguments, such as environment-configured models. Concurrent misses on
+    one key compute it once; the other callers wait for that result.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            store = cache or RESULT_CACHE
+            if not store.enabled:
+                return fn(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            items = list(bound.arguments.items())
+            key = cache_key(op_name, input_digest(items[0][1]), dict(items[1:]), salt)
+
+            hit, value = store.get(key)
+            if hit:
+                return value
+            with single_flight(key) as waited:
+                if waited:
+                    hit, value = store.get(key)
+                    if hit:
+                        return value
+                value = fn(*args, **kwargs)
+                store.put(key, value)
+            return value
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
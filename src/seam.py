@@ -1,19 +1,65 @@
 import importlib.util
+import os
 from PIL import Image
 import numpy as np
 
-HAS_SEAM = False
-SEAM_BACKEND = "none"
+from . import seam_engine
+from .result_cache import RESULT_CACHE, cache_key, input_digest, memoize, single_flight
 
-if importlib.util.find_spec("seam_carving") is not None:
-    HAS_SEAM = True
-    SEAM_BACKEND = "seam-carving"
-elif importlib.util.find_spec("skimage") is not None:
-    HAS_SEAM = True
-    SEAM_BACKEND = "scikit-image"
+# The built-in numpy engine is always available; the seam-carving package is
+# used when installed unless SEAM_BACKEND=numpy asks for the built-in one.
+HAS_SEAM = True
+SEAM_BACKEND = os.environ.get("SEAM_BACKEND") or (
+    "seam-carving" if importlib.util.find_spec("seam_carving") is not None else "numpy"
+)
+if SEAM_BACKEND == "seam-carving" and importlib.util.find_spec("seam_carving") is None:
+    SEAM_BACKEND = "numpy"
+
+# The approximate pyramid search is opt-in: requests ask for it with
+# ``pyramid``, and a positive SEAM_PYRAMID_MIN_MP makes it the default for
+# inputs of that many megapixels and up. 0 (the default) keeps carving exact.
+PYRAMID_MIN_MEGAPIXELS = float(os.environ.get("SEAM_PYRAMID_MIN_MP", "0"))
+PYRAMID_LEVELS = int(os.environ.get("SEAM_PYRAMID_LEVELS", "2"))
+
+
+def parse_pyramid(value) -> bool | None:
+    """Request value for ``pyramid``: True/False, or None for automatic."""
+    if value is None or (isinstance(value, str) and value.strip().lower() in {"", "auto"}):
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() not in {"0", "false", "no", "off"}
+    return bool(value)
+
+
+def use_pyramid(img: Image.Image, pyramid: bool | None = None) -> bool:
+    if pyramid is None:
+        return 0 < PYRAMID_MIN_MEGAPIXELS * 1_000_000 <= img.width * img.height
+    return pyramid
+
+
+def _seam_settings() -> list:
+    return [SEAM_BACKEND, PYRAMID_MIN_MEGAPIXELS, PYRAMID_LEVELS]
+
+
+def _pixels(img: Image.Image) -> np.ndarray:
+    """RGB pixels, or RGBA when the image carries transparency worth keeping."""
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    return np.asarray(img.convert("RGBA" if has_alpha else "RGB"))
+
+
+@memoize("seam_carve", salt=_seam_settings)
+def seam_carve(img: Image.Image, target_w: int, target_h: int, order: str, energy_mode: str,
+               pyramid: bool | None = None) -> Image.Image:
+    """Content-aware resize using seam carving.
+
+    ``pyramid`` selects the multi-scale search (see
+    ``seam_engine.pyramid_seam_order``); None uses it only when
+    ``SEAM_PYRAMID_MIN_MP`` is set and the input is at least that large.
+    """
+    if use_pyramid(img, pyramid):
+        dst = seam_engine.carve(_pixels(img), target_w, target_h, order, energy_mode, PYRAMID_LEVELS)
+        return Image.fromarray(dst)
 
-def seam_carve(img: Image.Image, target_w: int, target_h: int, order: str, energy_mode: str) -> Image.Image:
-    """Content-aware resize using seam carving."""
     if SEAM_BACKEND == "seam-carving":
         import seam_carving
         dst = seam_carving.resize(
@@ -24,17 +70,58 @@ def seam_carve(img: Image.Image, target_w: int, target_h: int, order: str, energ
         )
         return Image.fromarray(dst)
 
-    # scikit-image fallback (only seam-removal; enlarge via normal resize)
-    if SEAM_BACKEND == "scikit-image":
-        from skimage import transform, filters, color, img_as_ubyte
-        arr = np.array(img.convert("RGB")) / 255.0
-        gray = color.rgb2gray(arr)
-        energy = filters.sobel(gray)
+    dst = seam_engine.carve(_pixels(img), target_w, target_h, order, energy_mode)
+    return Image.fromarray(dst)
+
+
+def seam_order_map(img: Image.Image, axis: str = "width", energy_mode: str = "backward",
+                   seams: int = 0) -> np.ndarray:
+    """Removal rank of every pixel along ``axis``, holding at least ``seams`` seams.
+
+    The map is cached per image and built lazily: it only holds the seams
+    asked for so far, and a request for more carries it on from where it
+    stopped. Concurrent requests for the same map wait for one build.
+    """
+    store = RESULT_CACHE
+    key = cache_key("seam_order_map", input_digest(img), {"axis": axis, "energy_mode": energy_mode},
+                    _seam_settings)
+    with single_flight(key):
+        hit, ranks = store.get(key) if store.enabled else (False, None)
+        if hit and int(ranks.max()) >= seams:
+            return ranks
+        pixels = _pixels(img)
+        if axis == "height":
+            pixels = seam_engine.transpose(pixels)
+        levels = PYRAMID_LEVELS if use_pyramid(img) else 0
+        ranks = seam_engine.extend_ranks(pixels, ranks if hit else None, seams, energy_mode, levels)
+        if store.enabled:
+            store.put(key, ranks)
+    return ranks
+
+
+def seam_carve_precomputed(img: Image.Image, target_w: int, target_h: int, order: str = "width-first",
+                           energy_mode: str = "backward") -> Image.Image:
+    """Seam carve from the cached seam-order map, for interactive slider updates.
+
+    The map is extended only as far as the target needs, so the first call
+    costs about as much as a plain carve; targets within what it already
+    holds are a single mask-and-compact pass. Changing both axes, or a
+    target no map can reach, falls back to ``seam_carve``.
+    """
+    target_w, target_h = max(1, int(target_w)), max(1, int(target_h))
+    if target_w != img.width and target_h != img.height:
+        return seam_carve(img, target_w, target_h, order, energy_mode)
+    if target_w == img.width and target_h == img.height:
+        return img.copy()
 
-        if target_w < img.width:
-            num = img.width - target_w
-            carved = transform.seam_carve(arr, energy, "vertical", num)
-            return Image.fromarray(img_as_ubyte(carved))
-        return img.resize((target_w, target_h), Image.Resampling.LANCZOS)
+    axis, size, target = ("width", img.width, target_w) if target_w != img.width else ("height", img.height, target_h)
+    if abs(size - target) > size - 1:
+        return seam_carve(img, target_w, target_h, order, energy_mode)
+    ranks = seam_order_map(img, axis, energy_mode, abs(size - target))
 
-    return img.resize((target_w, target_h), Image.Resampling.LANCZOS)
+    pixels = _pixels(img)
+    if axis == "height":
+        carved = seam_engine.transpose(seam_engine.apply_ranks(seam_engine.transpose(pixels), ranks, target))
+    else:
+        carved = seam_engine.apply_ranks(pixels, ranks, target)
+    return Image.fromarray(carved)
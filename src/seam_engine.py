@@ -0,0 +1,511 @@
+"""Built-in numpy seam carving.
+
+Pixels are handled as ``(height, width, channels)`` uint8 arrays. Width
+changes remove or insert vertical seams; height changes run the same code on
+the transposed array. The cumulative-energy pass goes row by row with a
+vectorized min-of-three over the previous row. The backward energy map (or
+the forward-energy cost maps) is updated only around each removed seam, not
+recomputed for the whole frame.
+"""
+import numpy as np
+
+ENERGY_MODES = ("backward", "forward")
+ORDERS = ("width-first", "height-first")
+# Pyramid levels stop once a side would drop below this many pixels.
+PYRAMID_MIN_SIDE = 32
+# At most width // PYRAMID_BATCH_DIVISOR seams are taken per pyramid batch.
+PYRAMID_BATCH_DIVISOR = 16
+
+
+def luminance(pixels: np.ndarray) -> np.ndarray:
+    """Float32 luma of an RGB(A) or grayscale pixel array."""
+    if pixels.ndim == 2:
+        return pixels.astype(np.float32)
+    rgb = pixels[..., :3].astype(np.float32)
+    if rgb.shape[-1] < 3:
+        return rgb[..., 0]
+    return rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+
+
+def _energy_at(gray: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Gradient magnitude |dx| + |dy| at the given positions, edges clamped."""
+    height, width = gray.shape
+    left = np.clip(cols - 1, 0, width - 1)
+    right = np.clip(cols + 1, 0, width - 1)
+    up = np.clip(rows - 1, 0, height - 1)
+    down = np.clip(rows + 1, 0, height - 1)
+    return np.abs(gray[rows, right] - gray[rows, left]) + np.abs(gray[down, cols] - gray[up, cols])
+
+
+def backward_energy(gray: np.ndarray) -> np.ndarray:
+    """Full backward energy map, identical to ``_energy_at`` evaluated everywhere."""
+    height, width = gray.shape
+    cols = np.arange(width)
+    rows = np.arange(height)
+    left = np.clip(cols - 1, 0, width - 1)
+    right = np.clip(cols + 1, 0, width - 1)
+    up = np.clip(rows - 1, 0, height - 1)
+    down = np.clip(rows + 1, 0, height - 1)
+    return np.abs(gray[:, right] - gray[:, left]) + np.abs(gray[down, :] - gray[up, :])
+
+
+def _refresh_energy(energy: np.ndarray, gray: np.ndarray, seam: np.ndarray):
+    """Recompute energy in place for the pixels whose neighbours changed when ``seam`` went."""
+    height, width = gray.shape
+    rows = np.arange(height)[:, None]
+    cols = np.clip(seam[:, None] + np.arange(-2, 2), 0, width - 1)
+    energy[rows, cols] = _energy_at(gray, rows, cols)
+
+
+def _forward_costs_at(gray: np.ndarray, rows: np.ndarray, cols: np.ndarray):
+    """Forward-energy edge costs at the given positions (see ``forward_costs``)."""
+    height, width = gray.shape
+    left = gray[rows, np.clip(cols - 1, 0, width - 1)]
+    right = gray[rows, np.clip(cols + 1, 0, width - 1)]
+    above = gray[np.maximum(rows - 1, 0), cols]
+    first_row = rows == 0
+    cost_up = np.abs(right - left)
+    cost_left = cost_up + np.where(first_row, 0, np.abs(above - left))
+    cost_right = cost_up + np.where(first_row, 0, np.abs(above - right))
+    return cost_left, cost_up, cost_right
+
+
+def forward_costs(gray: np.ndarray):
+    """Costs of the edges created by joining neighbours when a seam steps left, down or right."""
+    height, width = gray.shape
+    return _forward_costs_at(gray, np.arange(height)[:, None], np.arange(width)[None, :])
+
+
+def _refresh_forward_costs(costs: tuple, gray: np.ndarray, seam: np.ndarray):
+    """``_refresh_energy`` for the three forward cost maps."""
+    height, width = gray.shape
+    rows = np.arange(height)[:, None]
+    cols = np.clip(seam[:, None] + np.arange(-2, 2), 0, width - 1)
+    for target, fresh in zip(costs, _forward_costs_at(gray, rows, cols)):
+        target[rows, cols] = fresh
+
+
+def _seam_state(gray: np.ndarray, energy_mode: str):
+    """What ``find_seam`` needs: the energy map, or the three forward cost maps."""
+    if energy_mode == "forward":
+        return forward_costs(gray)
+    return backward_energy(gray)
+
+
+def _advance(state, gray: np.ndarray, seam: np.ndarray, energy_mode: str):
+    """Drop ``seam`` from the energy state and refresh the pixels around it."""
+    if energy_mode == "forward":
+        state = tuple(_drop(cost, seam) for cost in state)
+        _refresh_forward_costs(state, gray, seam)
+        return state
+    state = _drop(state, seam)
+    _refresh_energy(state, gray, seam)
+    return state
+
+
+def _cumulate(state, energy_mode: str = "backward"):
+    """Row-by-row cumulative cost; returns the last row and the left/right choice maps.
+
+    The cumulative row lives in a buffer padded with +inf on both sides so the
+    three predecessors of every column are plain shifted views.
+    """
+    forward = energy_mode == "forward"
+    if forward:
+        cost_left, cost_up, cost_right = state
+        first = cost_up[0]
+    else:
+        energy = state
+        first = energy[0]
+    height, width = (cost_up if forward else energy).shape
+
+    padded = np.full(width + 2, np.inf, dtype=np.float32)
+    padded[1:-1] = first
+    from_left, up, from_right = padded[:-2], padded[1:-1], padded[2:]
+    went_left = np.zeros((height, width), dtype=bool)
+    went_right = np.zeros((height, width), dtype=bool)
+    best_lu = np.empty(width, dtype=np.float32)
+    best = np.empty(width, dtype=np.float32)
+    if forward:
+        cand_left = np.empty(width, dtype=np.float32)
+        cand_up = np.empty(width, dtype=np.float32)
+        cand_right = np.empty(width, dtype=np.float32)
+
+    for row in range(1, height):
+        if forward:
+            np.add(from_left, cost_left[row], out=cand_left)
+            np.add(up, cost_up[row], out=cand_up)
+            np.add(from_right, cost_right[row], out=cand_right)
+            lft, mid, rgt = cand_left, cand_up, cand_right
+        else:
+            lft, mid, rgt = from_left, up, from_right
+        np.less(lft, mid, out=went_left[row])
+        np.minimum(lft, mid, out=best_lu)
+        np.less(rgt, best_lu, out=went_right[row])
+        np.minimum(best_lu, rgt, out=best)
+        if forward:
+            up[:] = best
+        else:
+            np.add(best, energy[row], out=up)
+    return up, went_left, went_right
+
+
+def find_seam(gray: np.ndarray, state, energy_mode: str = "backward") -> np.ndarray:
+    """Column index of the cheapest 8-connected vertical seam in every row.
+
+    ``state`` is the backward energy map, or the ``forward_costs`` triple in
+    forward mode.
+    """
+    height, width = gray.shape
+    if width == 1:
+        return np.zeros(height, dtype=np.intp)
+
+    last, went_left, went_right = _cumulate(state, energy_mode)
+    return _trace(went_left, went_right, int(np.argmin(last)))
+
+
+def _trace(went_left: np.ndarray, went_right: np.ndarray, col: int) -> np.ndarray:
+    """Backtrack one seam from column ``col`` of the last row."""
+    height = went_left.shape[0]
+    seam = np.empty(height, dtype=np.intp)
+    for row in range(height - 1, -1, -1):
+        seam[row] = col
+        if went_right[row, col]:
+            col += 1
+        elif went_left[row, col]:
+            col -= 1
+    return seam
+
+
+def _drop(array: np.ndarray, seam: np.ndarray) -> np.ndarray:
+    """Remove one element per row; ``array`` is 2-D (use ``_packed`` for pixels)."""
+    height, width = array.shape
+    keep = np.ones((height, width), dtype=bool)
+    keep[np.arange(height), seam] = False
+    return array[keep].reshape(height, width - 1)
+
+
+def _packed(pixels: np.ndarray) -> np.ndarray:
+    """View each pixel as one opaque item so seams are dropped with a single copy."""
+    if pixels.ndim == 2:
+        return pixels
+    pixels = np.ascontiguousarray(pixels)
+    return pixels.view(f"V{pixels.shape[2] * pixels.itemsize}").reshape(pixels.shape[:2])
+
+
+def _unpacked(packed: np.ndarray, like: np.ndarray) -> np.ndarray:
+    if like.ndim == 2:
+        return packed
+    return packed.view(like.dtype).reshape(packed.shape + like.shape[2:])
+
+
+def remove_vertical_seams(pixels: np.ndarray, count: int, energy_mode: str = "backward",
+                          levels: int = 0) -> np.ndarray:
+    """Narrow ``pixels`` by ``count`` columns, one lowest-energy seam at a time.
+
+    With ``levels`` > 0 the seams come from ``pyramid_seam_order`` and are
+    all dropped in one pass.
+    """
+    if levels > 0:
+        height, width = pixels.shape[:2]
+        keep = ~_removed_mask(height, width, pyramid_seam_order(pixels, count, energy_mode, levels))
+        return _unpacked(_packed(pixels)[keep].reshape(height, width - count), pixels)
+
+    gray = luminance(pixels)
+    state = _seam_state(gray, energy_mode)
+    packed = _packed(pixels)
+    for _ in range(count):
+        seam = find_seam(gray, state, energy_mode)
+        packed = _drop(packed, seam)
+        gray = _drop(gray, seam)
+        state = _advance(state, gray, seam, energy_mode)
+    return _unpacked(packed, pixels)
+
+
+def seam_order(pixels: np.ndarray, count: int, energy_mode: str = "backward") -> list[np.ndarray]:
+    """The first ``count`` seams removal would take, in original column coordinates."""
+    gray = luminance(pixels)
+    state = _seam_state(gray, energy_mode)
+    height, width = gray.shape
+    index = np.broadcast_to(np.arange(width, dtype=np.int32), (height, width)).copy()
+    rows = np.arange(height)
+    seams = []
+    for _ in range(count):
+        seam = find_seam(gray, state, energy_mode)
+        seams.append(index[rows, seam].copy())
+        index = _drop(index, seam)
+        gray = _drop(gray, seam)
+        state = _advance(state, gray, seam, energy_mode)
+    return seams
+
+
+def _drop_many(array: np.ndarray, seams: np.ndarray) -> np.ndarray:
+    """Remove several non-overlapping seams at once; ``seams`` is ``(height, n)``."""
+    height, width = array.shape
+    keep = np.ones((height, width), dtype=bool)
+    keep[np.arange(height)[:, None], seams] = False
+    return array[keep].reshape(height, width - seams.shape[1])
+
+
+def _downscale(gray: np.ndarray) -> np.ndarray:
+    """Half-size luma by 2x2 box averaging; an odd last row or column is dropped."""
+    height, width = gray.shape[0] // 2 * 2, gray.shape[1] // 2 * 2
+    gray = gray[:height, :width]
+    return (gray[0::2, 0::2] + gray[1::2, 0::2] + gray[0::2, 1::2] + gray[1::2, 1::2]) * 0.25
+
+
+def _backtrack(went_left: np.ndarray, went_right: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Follow the choice maps up from several end columns at once; returns ``(height, n)``."""
+    height = went_left.shape[0]
+    seams = np.empty((height, cols.size), dtype=np.intp)
+    for row in range(height - 1, -1, -1):
+        seams[row] = cols
+        right = went_right[row, cols]
+        cols = cols + right - (went_left[row, cols] & ~right)
+    return seams
+
+
+def _block(state, energy_mode: str, rows: np.ndarray, cols: np.ndarray):
+    """Make the given pixels impassable in a seam state, in place."""
+    for cost in (state if energy_mode == "forward" else (state,)):
+        cost[rows, cols] = np.inf
+
+
+def _band_seams(gray: np.ndarray, labels: np.ndarray, energy_mode: str) -> np.ndarray:
+    """The cheapest seam inside every labelled band, found with a single DP pass.
+
+    ``labels`` holds a band id per pixel and -1 elsewhere. Bands must not
+    touch: the +inf gap between them keeps each backtracked seam in its band.
+    Returns a ``(height, n)`` array with one column per feasible band.
+    """
+    state = _seam_state(gray, energy_mode)
+    outside = labels < 0
+    for cost in (state if energy_mode == "forward" else (state,)):
+        cost[outside] = np.inf
+    last, went_left, went_right = _cumulate(state, energy_mode)
+
+    # Cheapest end column per band: sort the last row by (band, cost).
+    ends = np.nonzero(np.isfinite(last))[0]
+    if ends.size == 0:
+        return np.empty((gray.shape[0], 0), dtype=np.intp)
+    ends = ends[np.lexsort((last[ends], labels[-1, ends]))]
+    band = labels[-1, ends]
+    ends = ends[np.r_[True, band[1:] != band[:-1]]]
+    return _backtrack(went_left, went_right, ends)
+
+
+def _independent_seams(gray: np.ndarray, count: int, energy_mode: str, levels: int) -> np.ndarray:
+    """Up to ``count`` cheap seams that are pairwise at least four pixels apart.
+
+    Such seams never cross, so removing them together equals removing them
+    one after another. On the coarsest level they are picked greedily, each
+    DP pass blocking a seven-pixel strip around the seams found so far; on
+    every finer level each coarse seam is refined inside the four-pixel band
+    it covers when upsampled.
+    """
+    height, width = gray.shape
+    rows = np.arange(height)
+    if levels > 0 and min(height, width) >= 2 * PYRAMID_MIN_SIDE:
+        coarse_seams = _independent_seams(_downscale(gray), count, energy_mode, levels - 1)
+        coarse_rows = np.minimum(rows // 2, coarse_seams.shape[0] - 1)
+        cols = 2 * coarse_seams[coarse_rows]
+        labels = np.full((height, width), -1, dtype=np.int32)
+        for offset in (-1, 0, 1, 2):
+            labels[rows[:, None], np.clip(cols + offset, 0, width - 1)] = np.arange(cols.shape[1])
+        return _band_seams(gray, labels, energy_mode)
+
+    state = _seam_state(gray, energy_mode)
+    found = []
+    for _ in range(count):
+        last, went_left, went_right = _cumulate(state, energy_mode)
+        end = int(np.argmin(last))
+        if not np.isfinite(last[end]):
+            break
+        seam = _trace(went_left, went_right, end)
+        found.append(seam)
+        _block(state, energy_mode, rows[:, None], np.clip(seam[:, None] + np.arange(-3, 4), 0, width - 1))
+    if not found:
+        return np.empty((height, 0), dtype=np.intp)
+    return np.stack(found, axis=1)
+
+
+def _pyramid_order(gray: np.ndarray, count: int, energy_mode: str, levels: int) -> list[np.ndarray]:
+    height, width = gray.shape
+    index = np.broadcast_to(np.arange(width, dtype=np.int32), (height, width)).copy()
+    rows = np.arange(height)
+    seams = []
+    while len(seams) < count:
+        batch = min(count - len(seams), max(1, gray.shape[1] // PYRAMID_BATCH_DIVISOR))
+        found = _independent_seams(gray, batch, energy_mode, levels)
+        if found.shape[1] == 0:
+            found = find_seam(gray, _seam_state(gray, energy_mode), energy_mode)[:, None]
+        seams.extend(index[rows, found[:, n]] for n in range(found.shape[1]))
+        gray = _drop_many(gray, found)
+        index = _drop_many(index, found)
+    return seams
+
+
+def pyramid_seam_order(pixels: np.ndarray, count: int, energy_mode: str = "backward",
+                       levels: int = 2) -> list[np.ndarray]:
+    """Approximate ``seam_order`` for large images via a luma pyramid.
+
+    Works in batches of non-crossing seams (``_independent_seams``): they are
+    chosen ``levels`` halvings down and refined level by level, each fine seam
+    staying within two pixels of its upsampled coarse seam. A whole batch
+    costs one DP pass per level and one drop, instead of a full-resolution
+    pass per seam.
+    """
+    return _pyramid_order(luminance(pixels), count, energy_mode, levels)
+
+
+def _removed_mask(height: int, width: int, seams: list[np.ndarray]) -> np.ndarray:
+    mask = np.zeros((height, width), dtype=bool)
+    rows = np.arange(height)
+    for seam in seams:
+        mask[rows, seam] = True
+    return mask
+
+
+def _duplicate_marked(pixels: np.ndarray, duplicate: np.ndarray) -> np.ndarray:
+    """Double every marked pixel, the copy being the average with its right neighbour.
+
+    Every row must have the same number of marked pixels.
+    """
+    height, width = duplicate.shape
+    added = int(np.count_nonzero(duplicate[0]))
+    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+    flat = pixels.reshape(height * width, channels)
+    repeats = 1 + duplicate.ravel()
+    widened = np.repeat(flat, repeats, axis=0)
+
+    right = np.minimum(np.arange(width) + 1, width - 1)
+    blended = (pixels.astype(np.uint16) + pixels[:, right].astype(np.uint16) + 1) // 2
+    blended = blended.reshape(height * width, channels)[duplicate.ravel()]
+    inserted_at = (np.cumsum(repeats) - 1)[duplicate.ravel()]
+    widened[inserted_at] = blended.astype(np.uint8)
+    return widened.reshape((height, width + added) + pixels.shape[2:])
+
+
+def insert_vertical_seams(pixels: np.ndarray, count: int, energy_mode: str = "backward",
+                          levels: int = 0) -> np.ndarray:
+    """Widen ``pixels`` by ``count`` columns by duplicating the cheapest seams.
+
+    The seams are chosen as if removing them, then each is doubled in place
+    with the average of the seam pixel and its right neighbour. Growth beyond
+    half the current width happens in several rounds so the same seam is not
+    picked twice.
+    """
+    while count > 0:
+        height, width = pixels.shape[:2]
+        step = min(count, max(1, width // 2))
+        if levels > 0:
+            seams = pyramid_seam_order(pixels, step, energy_mode, levels)
+        else:
+            seams = seam_order(pixels, step, energy_mode)
+        pixels = _duplicate_marked(pixels, _removed_mask(height, width, seams))
+        count -= step
+    return pixels
+
+
+def removal_ranks(pixels: np.ndarray, min_width: int, energy_mode: str = "backward",
+                  levels: int = 0) -> np.ndarray:
+    """Seam-order map: for every pixel, the index of the seam that removes it.
+
+    Carves down to ``min_width`` once. Pixels that survive get the seam count,
+    which is also the map's maximum. ``apply_ranks`` then produces any width
+    between ``min_width`` and ``2 * width - min_width`` without searching again.
+    """
+    width = pixels.shape[1]
+    return extend_ranks(pixels, None, width - max(1, int(min_width)), energy_mode, levels)
+
+
+def extend_ranks(pixels: np.ndarray, ranks: np.ndarray | None, count: int, energy_mode: str = "backward",
+                 levels: int = 0) -> np.ndarray:
+    """``ranks`` carried on until it holds ``count`` seams (None starts an empty map).
+
+    The surviving pixels are those ranked with the map's maximum; carving
+    resumes from them, so the seams already found are not searched again
+    and the result equals one ``removal_ranks`` call for ``count`` seams.
+    """
+    if energy_mode not in ENERGY_MODES:
+        raise ValueError(f"energy_mode must be one of {ENERGY_MODES}")
+    height, width = pixels.shape[:2]
+    count = min(max(0, int(count)), width - 1)
+    if ranks is None:
+        ranks = np.zeros((height, width), dtype=np.uint16 if width <= 65535 else np.int32)
+    removed = int(ranks.max())
+    if count <= removed:
+        return ranks
+
+    survivors = ranks == removed
+    index = np.broadcast_to(np.arange(width, dtype=np.int32), (height, width))[survivors].reshape(height, -1)
+    remaining = _unpacked(_packed(pixels)[survivors].reshape(height, -1), pixels)
+    if levels > 0:
+        seams = pyramid_seam_order(remaining, count - removed, energy_mode, levels)
+    else:
+        seams = seam_order(remaining, count - removed, energy_mode)
+    ranks = ranks.copy()
+    ranks[survivors] = count
+    rows = np.arange(height)
+    for rank, seam in enumerate(seams, removed):
+        ranks[rows, index[rows, seam]] = rank
+    return ranks
+
+
+def ranks_cover(ranks: np.ndarray, target_width: int) -> bool:
+    """Whether ``apply_ranks`` can reach ``target_width`` from this map."""
+    return abs(ranks.shape[1] - int(target_width)) <= int(ranks.max())
+
+
+def apply_ranks(pixels: np.ndarray, ranks: np.ndarray, target_width: int) -> np.ndarray:
+    """Resize ``pixels`` to ``target_width`` with one mask-and-compact pass over a ``removal_ranks`` map."""
+    height, width = ranks.shape
+    if not ranks_cover(ranks, target_width):
+        raise ValueError(f"target width {target_width} is outside the precomputed range")
+    if target_width < width:
+        keep = ranks >= width - target_width
+        return _unpacked(_packed(pixels)[keep].reshape(height, target_width), pixels)
+    if target_width > width:
+        return _duplicate_marked(pixels, ranks < target_width - width)
+    return pixels
+
+
+def resize_width(pixels: np.ndarray, target_width: int, energy_mode: str = "backward",
+                 levels: int = 0) -> np.ndarray:
+    width = pixels.shape[1]
+    if target_width < width:
+        return remove_vertical_seams(pixels, width - target_width, energy_mode, levels)
+    if target_width > width:
+        return insert_vertical_seams(pixels, target_width - width, energy_mode, levels)
+    return pixels
+
+
+def transpose(pixels: np.ndarray) -> np.ndarray:
+    """Swap the axes so height changes can reuse the vertical-seam code."""
+    return np.ascontiguousarray(np.swapaxes(pixels, 0, 1))
+
+
+def resize_height(pixels: np.ndarray, target_height: int, energy_mode: str = "backward",
+                  levels: int = 0) -> np.ndarray:
+    if target_height == pixels.shape[0]:
+        return pixels
+    return transpose(resize_width(transpose(pixels), target_height, energy_mode, levels))
+
+
+def carve(pixels: np.ndarray, target_width: int, target_height: int,
+          order: str = "width-first", energy_mode: str = "backward", levels: int = 0) -> np.ndarray:
+    """Content-aware resize of a pixel array to ``target_width`` x ``target_height``.
+
+    ``levels`` > 0 switches to the approximate pyramid search.
+    """
+    if energy_mode not in ENERGY_MODES:
+        raise ValueError(f"energy_mode must be one of {ENERGY_MODES}")
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of {ORDERS}")
+    target_width = max(1, int(target_width))
+    target_height = max(1, int(target_height))
+
+    if order == "width-first":
+        pixels = resize_width(pixels, target_width, energy_mode, levels)
+        return resize_height(pixels, target_height, energy_mode, levels)
+    pixels = resize_height(pixels, target_height, energy_mode, levels)
+    return resize_width(pixels, target_width, energy_mode, levels)
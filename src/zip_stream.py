@@ -0,0 +1,30 @@
+"""Streaming ZIP output for chunked HTTP responses.
+
+``zipfile`` writing to a ``ChunkSink`` cannot seek back to patch member
+headers, so it puts sizes and CRCs in data descriptors after each member
+and the archive can be sent while it is being built: write a member, then
+yield ``sink.take()``.
+"""
+
+
+class ChunkSink:
+    """Write-only file for ``zipfile`` that hands over what was written so far.
+
+    It has no ``tell``/``seek``, so ``zipfile`` streams: sizes and CRCs go
+    into data descriptors after each member instead of being patched in.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
@@ -1,5 +1,4 @@
-import { postJSON } from './api.js';
-import { blobToDataURL, dataURLToBlob } from './blob_utils.js';
+import { postImageJSON, resultBlob } from './api.js';
 import {
   addBorderBlob,
   addWatermarkBlob,
@@ -48,11 +47,8 @@ export function wireAdvanced() {
     const tolerance = parseInt(document.getElementById('bgTol')?.value || '18', 10);
     const loading = showLoadingToast('Removing background...');
     try {
-      const j = await postJSON('/api/background_remove', {
-        image: await blobToDataURL(getCurrentBlob()),
-        tolerance,
-      });
-      const blob = await dataURLToBlob(j.img);
+      const j = await postImageJSON('/api/background_remove', getCurrentBlob(), { tolerance });
+      const blob = await resultBlob(j);
       await replaceCurrentBlob(blob, { recordHistory: true, label: `Background remove (${tolerance})` });
       loading.dismiss();
       showToast('Background removed', 'success');
@@ -83,10 +79,8 @@ export function wireAdvanced() {
     }
 
     try {
-      const j = await postJSON('/api/background_remove_ai', {
-        image: await blobToDataURL(getCurrentBlob()),
-      });
-      const blob = await dataURLToBlob(j.img);
+      const j = await postImageJSON('/api/background_remove_ai', getCurrentBlob());
+      const blob = await resultBlob(j);
       await replaceCurrentBlob(blob, { recordHistory: true, label: 'AI background removal' });
       progress.complete('AI cutout ready');
       showToast('Background removed', 'success');
@@ -193,14 +187,14 @@ export function wireAdvanced() {
       setBusy(true);
 
       try {
-        const j = await postJSON('/api/seam_carve', {
-          image: await blobToDataURL(seamBaseBlob),
+        const j = await postImageJSON('/api/seam_carve', seamBaseBlob, {
           target_width: target,
           order: 'width-first',
           energy_mode: 'backward',
+          precomputed: true,
         });
         if (token !== seamToken) return;
-        const blob = await dataURLToBlob(j.img);
+        const blob = await resultBlob(j);
         await replaceCurrentBlob(blob, { recordHistory: false, resetRedo: false });
       } catch (_) {
         showToast('Seam carve failed', 'error');
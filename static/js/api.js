@@ -1,3 +1,8 @@
+import { blobToDataURL, dataURLToBlob } from './blob_utils.js';
+
+// Handle (or pending upload) of every blob the server already holds in /api/store.
+const HANDLES = new WeakMap();
+
 async function parseError(response) {
   const text = await response.text();
   try {
@@ -8,6 +13,12 @@ async function parseError(response) {
   }
 }
 
+async function requestError(response) {
+  const error = new Error(await parseError(response));
+  error.status = response.status;
+  return error;
+}
+
 export async function postJSON(url, payload) {
   const response = await fetch(url, {
     method: 'POST',
@@ -16,7 +27,7 @@ export async function postJSON(url, payload) {
   });
 
   if (!response.ok) {
-    throw new Error(await parseError(response));
+    throw await requestError(response);
   }
 
   return response.json();
@@ -29,7 +40,7 @@ export async function postFormData(url, formData) {
   });
 
   if (!response.ok) {
-    throw new Error(await parseError(response));
+    throw await requestError(response);
   }
 
   const contentType = response.headers.get('content-type') || '';
@@ -47,8 +58,80 @@ export async function fetchBlob(url, payload) {
   });
 
   if (!response.ok) {
-    throw new Error(await parseError(response));
+    throw await requestError(response);
   }
 
   return response.blob();
 }
+
+export function rememberHandle(blob, handle) {
+  if (blob && handle) {
+    HANDLES.set(blob, Promise.resolve(handle));
+  }
+}
+
+function forgetHandle(blob, pending) {
+  if (HANDLES.get(blob) === pending) {
+    HANDLES.delete(blob);
+  }
+}
+
+export function storeBlob(blob) {
+  let pending = HANDLES.get(blob);
+  if (!pending) {
+    const form = new FormData();
+    form.append('image', blob, 'image');
+    pending = postFormData('/api/store', form).then((j) => j.handle);
+    HANDLES.set(blob, pending);
+    pending.catch(() => forgetHandle(blob, pending));
+  }
+  return pending;
+}
+
+// Run request(handle) against the stored copy of blob. When the server has
+// evicted it (404), upload it again and retry once; when storing fails,
+// fall back to request(null), which sends the pixels inline.
+async function withHandle(blob, request) {
+  for (let attempt = 0; ; attempt += 1) {
+    const pending = storeBlob(blob);
+    let handle;
+    try {
+      handle = await pending;
+    } catch (_) {
+      return request(null);
+    }
+    try {
+      return await request(handle);
+    } catch (error) {
+      if (error.status !== 404 || attempt) throw error;
+      forgetHandle(blob, pending);
+    }
+  }
+}
+
+export async function postImageJSON(url, blob, params = {}) {
+  return withHandle(blob, async (handle) => postJSON(url, handle
+    ? { ...params, handle }
+    : { ...params, image: await blobToDataURL(blob) }));
+}
+
+export async function postImageForm(url, blob, form, fileName = 'image') {
+  return withHandle(blob, (handle) => {
+    form.delete('image');
+    form.delete('handle');
+    if (handle) {
+      form.append('handle', handle);
+    } else {
+      form.append('image', blob, fileName);
+    }
+    return postFormData(url, form);
+  });
+}
+
+// The blob of an {img, handle} reply, remembered under its handle so the
+// next operation on it does not upload it again.
+export async function resultBlob(json) {
+  const blob = await dataURLToBlob(json.img);
+  rememberHandle(blob, json.handle);
+  return blob;
+}
@@ -1,11 +1,10 @@
-import { postJSON } from './api.js';
-import { canEncodeClientSide, dataURLToBlob } from './blob_utils.js';
+import { postImageJSON, resultBlob } from './api.js';
+import { canEncodeClientSide } from './blob_utils.js';
 import { convertBlob, flipBlob, resizeBlob, rotateBlob } from './client_ops.js';
 import {
   CURRENT,
   IS_GIF,
   getCurrentBlob,
-  getCurrentDataURL,
   replaceCurrentBlob,
   showToast,
 } from './state.js';
@@ -108,12 +107,8 @@ export function wireBasic() {
           isGif: false,
         });
       } else {
-        const j = await postJSON('/api/convert', {
-          image: await getCurrentDataURL(),
-          to,
-          quality,
-        });
-        const blob = await dataURLToBlob(j.img);
+        const j = await postImageJSON('/api/convert', getCurrentBlob(), { to, quality });
+        const blob = await resultBlob(j);
         await replaceCurrentBlob(blob, {
           recordHistory: true,
           label: `Convert to ${to.toUpperCase()}`,
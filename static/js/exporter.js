@@ -1,4 +1,4 @@
-import { postFormData } from './api.js';
+import { postImageForm } from './api.js';
 import { canEncodeClientSide } from './blob_utils.js';
 import { convertBlob } from './client_ops.js';
 import { CURRENT, getCurrentBlob, getFileName, getMetadata, showToast } from './state.js';
@@ -33,11 +33,10 @@ export function wireExporter() {
         triggerDownload(blob, `${getFileName()}.${format}`);
       } else {
         const form = new FormData();
-        form.append('image', getCurrentBlob(), `${getFileName()}.png`);
         form.append('format', format);
         form.append('quality', String(quality));
         form.append('metadata', JSON.stringify(metadata));
-        const blob = await postFormData('/api/export', form);
+        const blob = await postImageForm('/api/export', getCurrentBlob(), form, `${getFileName()}.png`);
         triggerDownload(blob, `${getFileName()}.${format}`);
       }
       showToast('Download started', 'success');
@@ -1,5 +1,5 @@
-import { postJSON } from './api.js';
-import { blobToDataURL, dataURLToBlob } from './blob_utils.js';
+import { postImageForm, postImageJSON, resultBlob } from './api.js';
+import { dataURLToBlob } from './blob_utils.js';
 import {
   CURRENT,
   IS_GIF,
@@ -20,9 +20,7 @@ function requireGif() {
 }
 
 async function fetchGifInfo(blob) {
-  const info = await postJSON('/api/gif/info', {
-    image: await blobToDataURL(blob),
-  });
+  const info = await postImageJSON('/api/gif/info', blob);
   return {
     is_animated: true,
     frame_count: info.frame_count || 1,
@@ -30,8 +28,8 @@ async function fetchGifInfo(blob) {
   };
 }
 
-async function applyGifDataUrl(dataUrl, label) {
-  const blob = await dataURLToBlob(dataUrl);
+async function applyGifResult(j, label) {
+  const blob = await resultBlob(j);
   const info = await fetchGifInfo(blob);
   await replaceCurrentBlob(blob, {
     recordHistory: true,
@@ -54,9 +52,9 @@ function downloadBlob(blob, fileName) {
 async function runGifOp({ loadingMessage, successMessage, failMessage, request, postLabel }) {
   const loading = loadingMessage ? showLoadingToast(loadingMessage) : null;
   try {
-    const j = await postJSON(request.url, request.body);
+    const j = await postImageJSON(request.url, getCurrentBlob(), request.body);
     if (postLabel) {
-      await applyGifDataUrl(j.img, postLabel);
+      await applyGifResult(j, postLabel);
     }
     loading?.dismiss();
     if (successMessage) showToast(successMessage, 'success');
@@ -93,7 +91,6 @@ export function wireGif() {
       request: {
         url: '/api/gif/resize',
         body: {
-          image: await blobToDataURL(getCurrentBlob()),
           width,
           height,
           keep_aspect: keepAspect,
@@ -114,7 +111,6 @@ export function wireGif() {
       request: {
         url: '/api/gif/trim',
         body: {
-          image: await blobToDataURL(getCurrentBlob()),
           start_frame: start,
           end_frame: end,
         },
@@ -133,7 +129,6 @@ export function wireGif() {
       request: {
         url: '/api/gif/speed',
         body: {
-          image: await blobToDataURL(getCurrentBlob()),
           speed_factor: factor,
         },
       },
@@ -149,7 +144,7 @@ export function wireGif() {
       failMessage: 'GIF reverse failed',
       request: {
         url: '/api/gif/reverse',
-        body: { image: await blobToDataURL(getCurrentBlob()) },
+        body: {},
       },
       postLabel: 'GIF reversed',
     });
@@ -163,7 +158,7 @@ export function wireGif() {
       failMessage: 'GIF ping-pong failed',
       request: {
         url: '/api/gif/pingpong',
-        body: { image: await blobToDataURL(getCurrentBlob()) },
+        body: {},
       },
       postLabel: 'GIF ping-pong',
     });
@@ -180,7 +175,6 @@ export function wireGif() {
       request: {
         url: '/api/gif/optimize',
         body: {
-          image: await blobToDataURL(getCurrentBlob()),
           colors,
           frame_step: frameStep,
         },
@@ -193,10 +187,7 @@ export function wireGif() {
     if (!requireGif()) return;
     const frame = parseInt(document.getElementById('gifPosterFrame')?.value || '0', 10);
     try {
-      const j = await postJSON('/api/gif/poster', {
-        image: await blobToDataURL(getCurrentBlob()),
-        frame,
-      });
+      const j = await postImageJSON('/api/gif/poster', getCurrentBlob(), { frame });
       const blob = await dataURLToBlob(j.img);
       downloadBlob(blob, `gif-frame-${String(frame).padStart(3, '0')}.png`);
       showToast('Poster frame downloaded', 'success');
@@ -209,10 +200,8 @@ export function wireGif() {
     if (!requireGif()) return;
     const loading = showLoadingToast('Packing GIF frames...');
     try {
-      const j = await postJSON('/api/gif/frames_zip', {
-        image: await blobToDataURL(getCurrentBlob()),
-      });
-      const blob = await dataURLToBlob(j.zip);
+      // Multipart in, streamed ZIP out: no base64 copies on either side.
+      const blob = await postImageForm('/api/gif/frames_zip', getCurrentBlob(), new FormData(), 'animation.gif');
       downloadBlob(blob, 'gif-frames.zip');
       loading.dismiss();
       showToast('Frame ZIP downloaded', 'success');
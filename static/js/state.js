@@ -1,3 +1,4 @@
+import { storeBlob } from './api.js';
 import {
   blobToDataURL,
   cloneMetadata,
@@ -680,6 +681,8 @@ export async function openEditorBlob(blob, options = {}) {
   ORIGINAL_BLOB = blob;
   originalUrl = URL.createObjectURL(ORIGINAL_BLOB);
   ORIGINAL = originalUrl;
+  // Upload once now; server operations then send its handle instead of the pixels.
+  storeBlob(blob).catch(() => {});
 
   await setCurrentBlobInternal(blob, {
     isGif: IS_GIF,
@@ -0,0 +1,43 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.gif_stream import GifWriter, SharedPalette  # noqa: E402
+
+
+def make_frames(frames: int = 6, size: tuple[int, int] = (48, 32)) -> list[Image.Image]:
+    """A gradient with a block that moves one step per frame, as RGBA frames."""
+    width, height = size
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, np.full_like(xx, 96)], axis=-1).astype(np.uint8)
+    images = []
+    for index in range(frames):
+        frame = base.copy()
+        left = index * (width // frames)
+        frame[height // 4:height * 3 // 4, left:left + width // frames] = (240, 220, 40)
+        images.append(Image.fromarray(frame).convert("RGBA"))
+    return images
+
+
+def make_gif(frames: int = 6, size: tuple[int, int] = (48, 32), duration: int = 40, delta: bool = False) -> bytes:
+    """``make_frames`` as a GIF with one global color table; ``delta`` writes changed rectangles only."""
+    images = make_frames(frames, size)
+    colors = images[0].convert("RGB").quantize(255).getpalette()[:255 * 3]
+    buf = io.BytesIO()
+    writer = GifWriter(buf, palette=SharedPalette(np.array(colors + [0, 0, 0]), 255 if delta else None),
+                       delta=delta, threads=1)
+    for image in images:
+        writer.add(image, duration)
+    writer.close()
+    return buf.getvalue()
+
+
+@pytest.fixture
+def gif_bytes() -> bytes:
+    return make_gif()
@@ -0,0 +1,42 @@
+import io
+
+import pytest
+from PIL import Image, ImageSequence
+
+from src.anim_stream import ANIMATION_FORMATS, WebPWriter
+from src.gif_ops import reverse_gif
+
+
+def _frames(raw: bytes) -> list[tuple[bytes, int]]:
+    img = Image.open(io.BytesIO(raw))
+    frames = []
+    for frame in ImageSequence.Iterator(img):
+        frames.append((frame.convert("RGBA").tobytes(), frame.info.get("duration")))
+    return frames
+
+
+@pytest.mark.parametrize("fmt", [fmt for fmt in ANIMATION_FORMATS if fmt != "gif"])
+def test_reverse_writes_every_frame(gif_bytes, fmt):
+    source = _frames(gif_bytes)
+    result = _frames(reverse_gif.uncached(gif_bytes, fmt=fmt))
+    assert len(result) == len(source)
+    assert [duration for _, duration in result] == [duration for _, duration in reversed(source)]
+    if fmt != "webp":  # lossy
+        assert [pixels for pixels, _ in result] == [pixels for pixels, _ in reversed(source)]
+
+
+@pytest.mark.skipif("webp" not in ANIMATION_FORMATS, reason="Pillow built without WebP")
+@pytest.mark.parametrize("spool_bytes", [64 << 20, 1])
+def test_webp_writer_merges_duplicates_and_spools(monkeypatch, spool_bytes):
+    monkeypatch.setattr("src.anim_stream.WEBP_SPOOL_BYTES", spool_bytes)
+    colors = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 255, 0, 255), (0, 0, 255, 128)]
+    buf = io.BytesIO()
+    writer = WebPWriter(buf, lossless=True)
+    for color in colors:
+        writer.add(Image.new("RGBA", (20, 10), color), 70)
+    writer.close()
+    assert writer.frames_written == 3
+    frames = _frames(buf.getvalue())
+    assert [duration for _, duration in frames] == [70, 140, 70]
+    assert [Image.frombytes("RGBA", (20, 10), pixels).getpixel((5, 5)) for pixels, _ in frames] == \
+        [colors[0], colors[1], colors[3]]
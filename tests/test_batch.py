@@ -0,0 +1,65 @@
+import io
+import json
+import zipfile
+
+import pytest
+from PIL import Image
+
+from src.batch import BatchError, batch_steps, collect_items, iter_batch_zip
+from src.jobs import JobQueue
+
+
+def _png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (24, 16), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_batch_steps_wraps_single_ops():
+    assert batch_steps("background_remove", {"tolerance": "20"})[-1]["op"] == "export"
+    with pytest.raises(BatchError):
+        batch_steps("not_an_op", {})
+
+
+def test_collect_items_expands_zips():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("a.png", _png("red"))
+        archive.writestr("__MACOSX/._a.png", b"")
+        archive.writestr("nested/", b"")
+    items = collect_items([("photos.zip", buf.getvalue()), ("b.png", _png("blue"))])
+    assert [name for name, _ in items] == ["a.png", "b.png"]
+    assert items[0][1]() == _png("red")
+    with pytest.raises(BatchError):
+        collect_items([])
+
+
+def test_iter_batch_zip_streams_results_and_summary():
+    queue = JobQueue(workers=1)
+    items = [("a.png", lambda: _png("red")), ("broken.png", lambda: b"not an image"), ("b.jpg", lambda: _png("blue"))]
+    steps = batch_steps("convert", {"to": "webp"})
+    try:
+        raw = b"".join(iter_batch_zip(items, steps, queue=queue))
+    finally:
+        queue.shutdown()
+    archive = zipfile.ZipFile(io.BytesIO(raw))
+    summary = json.loads(archive.read("results.json"))
+    assert [entry["status"] for entry in summary["results"]] == ["done", "failed", "done"]
+    assert sorted(archive.namelist()) == ["a.webp", "b.webp", "results.json"]
+    assert Image.open(io.BytesIO(archive.read("b.webp"))).size == (24, 16)
+
+
+def test_batch_route_rejects_bad_timeouts_and_oversized_bodies(monkeypatch):
+    import app as app_module
+
+    client = app_module.app.test_client()
+    for timeout in ("x", "-1", "nan"):
+        resp = client.post("/api/batch", data={"op": "convert", "timeout": timeout,
+                                               "images": (io.BytesIO(_png("red")), "a.png")})
+        assert resp.status_code == 400 and "timeout" in resp.get_json()["error"]
+    resp = client.post("/api/jobs", data={"op": "background_remove", "timeout": "x", "image": (io.BytesIO(_png("red")), "a.png")})
+    assert resp.status_code == 400 and "timeout" in resp.get_json()["error"]
+
+    monkeypatch.setattr(app_module, "BATCH_MAX_MB", 0)
+    resp = client.post("/api/batch", data=b"x" * 64, content_type="application/zip")
+    assert resp.status_code == 413
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "helper_pyton_scripts"))
+
+import batch_process  # noqa: E402
+
+
+def test_skip_needs_matching_params(tmp_path):
+    src, dst = tmp_path / "in", tmp_path / "out"
+    src.mkdir()
+    dst.mkdir()
+    (src / "a.png").write_bytes(b"x")
+    (dst / "a.png").write_bytes(b"y")
+    os.utime(src / "a.png", (1, 1))
+
+    job_op, job_params, ext = batch_process.plan("convert", {"to": "png"})
+    fingerprint = batch_process.params_fingerprint(job_op, job_params)
+    batch_process.save_manifest(str(dst), {"a.png": fingerprint})
+    manifest = batch_process.load_manifest(str(dst))
+
+    args = (str(src), str(dst), ext, batch_process.IMAGE_INPUTS)
+    assert batch_process.find_work(*args, fingerprint=fingerprint, manifest=manifest) == ([], 1)
+    other = batch_process.params_fingerprint(*batch_process.plan("convert", {"to": "png", "quality": "50"})[:2])
+    todo, skipped = batch_process.find_work(*args, fingerprint=other, manifest=manifest)
+    assert skipped == 0 and [os.path.basename(out) for _, out in todo] == ["a.png"]
+    assert batch_process.find_work(*args, force=True, fingerprint=fingerprint, manifest=manifest)[1] == 0
+
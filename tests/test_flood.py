@@ -0,0 +1,85 @@
+from collections import deque
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src import ops
+from src.ops import _flood_background, _flood_background_banded, remove_background
+
+
+def _reference_flood(similar: np.ndarray) -> np.ndarray:
+    """The original per-pixel BFS from the border."""
+    height, width = similar.shape
+    visited = np.zeros_like(similar, dtype=bool)
+    queue = deque()
+
+    def enqueue(x, y):
+        if 0 <= x < width and 0 <= y < height and similar[y, x] and not visited[y, x]:
+            visited[y, x] = True
+            queue.append((x, y))
+
+    for x in range(width):
+        enqueue(x, 0)
+        enqueue(x, height - 1)
+    for y in range(height):
+        enqueue(0, y)
+        enqueue(width - 1, y)
+    while queue:
+        x, y = queue.popleft()
+        enqueue(x + 1, y)
+        enqueue(x - 1, y)
+        enqueue(x, y + 1)
+        enqueue(x, y - 1)
+    return visited
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (1, 9), (9, 1), (40, 60), (73, 31)])
+@pytest.mark.parametrize("density", [0.45, 0.6, 0.8])
+def test_vectorized_flood_matches_the_bfs(shape, density):
+    similar = np.random.default_rng(hash((shape, density)) % 2**32).random(shape) < density
+    reference = _reference_flood(similar)
+    assert np.array_equal(_flood_background(similar), reference)
+    for rows in (1, 2, 7, shape[0]):
+        assert np.array_equal(_flood_background_banded(similar, rows), reference)
+
+
+def test_flood_through_nested_rings():
+    # Rings one pixel apart make the run fills turn many corners.
+    size = 31
+    similar = np.zeros((size, size), dtype=bool)
+    draw = Image.fromarray(similar)
+    canvas = ImageDraw.Draw(draw)
+    for step in range(0, size // 2, 2):
+        canvas.rectangle((step, step, size - 1 - step, size - 1 - step), outline=1)
+    similar = np.asarray(draw).copy()
+    similar[1:size // 2, 0] = False  # break the outer ring
+    reference = _reference_flood(similar)
+    assert np.array_equal(_flood_background(similar), reference)
+    assert np.array_equal(_flood_background_banded(similar, 3), reference)
+
+
+def test_flood_through_a_walled_serpentine():
+    # One corridor entered from a single border pixel, turning at every other row.
+    size = 61
+    similar = np.zeros((size + 2, size + 2), dtype=bool)
+    similar[1:-1:2, 1:-1] = True
+    for row in range(2, size + 1, 2):
+        similar[row, size if row % 4 == 2 else 1] = True
+    similar[1, 0] = True
+    reference = _reference_flood(similar)
+    assert reference.sum() == similar.sum()
+    assert np.array_equal(_flood_background(similar), reference)
+    for rows in (1, 5, 16):
+        assert np.array_equal(_flood_background_banded(similar, rows), reference)
+
+
+def test_remove_background_does_not_depend_on_band_size(monkeypatch):
+    img = Image.new("RGB", (64, 48), (236, 236, 236))
+    ImageDraw.Draw(img).ellipse((12, 8, 44, 40), fill=(180, 40, 40))
+    whole = remove_background.uncached(img, 18.0)
+    monkeypatch.setattr(ops, "BACKGROUND_BAND_PIXELS", 64 * 5)
+    banded = remove_background.uncached(img, 18.0)
+    assert whole.tobytes() == banded.tobytes()
+    alpha = np.asarray(whole)[..., 3]
+    assert alpha[0, 0] == 0 and alpha[24, 28] == 255
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from PIL import Image, ImageSequence
+
+from src import gif_ops
+from src.gif_blocks import GifFormatError, parse_gif
+
+from conftest import make_gif
+
+
+def _frames(raw: bytes) -> list[tuple[bytes, int]]:
+    """Every decoded frame as RGBA bytes, with its duration."""
+    return [(frame.convert("RGBA").tobytes(), frame.info.get("duration"))
+            for frame in ImageSequence.Iterator(Image.open(io.BytesIO(raw)))]
+
+
+def test_round_trip_keeps_every_frame(gif_bytes):
+    blocks = parse_gif(gif_bytes)
+    assert len(blocks.frames) == 6 and (blocks.width, blocks.height) == (48, 32)
+    assert blocks.reorderable() and all(blocks.self_contained(index) for index in range(6))
+    again = blocks.to_bytes()
+    assert [frame.image for frame in parse_gif(again).frames] == [frame.image for frame in blocks.frames]
+    assert _frames(again) == _frames(gif_bytes)
+
+
+def test_malformed_data_falls_back(gif_bytes):
+    with pytest.raises(GifFormatError):
+        parse_gif(b"PNG" + gif_bytes[3:])
+    with pytest.raises(GifFormatError):
+        parse_gif(gif_bytes[:len(gif_bytes) // 2])
+    assert gif_ops._blocks(gif_bytes[:len(gif_bytes) // 2]) is None
+
+
+def test_info_matches_the_decoder(gif_bytes, monkeypatch):
+    from_blocks = gif_ops.gif_info(gif_bytes)
+    monkeypatch.setattr(gif_ops, "_blocks", lambda raw: None)
+    assert from_blocks == gif_ops.gif_info(gif_bytes) == {"frame_count": 6, "loop": 0, "duration_ms_total": 240}
+
+
+def test_speed_rewrites_only_the_delays(gif_bytes):
+    out = gif_ops.change_gif_speed.uncached(gif_bytes, 2.0)
+    assert [frame.image for frame in parse_gif(out).frames] == [frame.image for frame in parse_gif(gif_bytes).frames]
+    assert _frames(out) == [(pixels, 20) for pixels, _ in _frames(gif_bytes)]
+
+
+@pytest.mark.parametrize("op, args, order", [
+    ("trim_gif", (2, 5), [2, 3, 4]),
+    ("reverse_gif", (), [5, 4, 3, 2, 1, 0]),
+    ("pingpong_gif", (), [0, 1, 2, 3, 4, 5, 4, 3, 2, 1]),
+])
+def test_order_edits_copy_frames(gif_bytes, op, args, order):
+    source = _frames(gif_bytes)
+    out = getattr(gif_ops, op).uncached(gif_bytes, *args)
+    images = {frame.image for frame in parse_gif(gif_bytes).frames}
+    assert all(frame.image in images for frame in parse_gif(out).frames)
+    assert _frames(out) == [source[index] for index in order]
+
+
+@pytest.mark.parametrize("op, args, order", [
+    ("trim_gif", (2, 5), [2, 3, 4]),
+    ("reverse_gif", (), [5, 4, 3, 2, 1, 0]),
+])
+def test_fast_paths_match_the_decode_path(gif_bytes, op, args, order, monkeypatch):
+    fast = _frames(getattr(gif_ops, op).uncached(gif_bytes, *args))
+    monkeypatch.setattr(gif_ops, "_blocks", lambda raw: None)
+    assert _frames(getattr(gif_ops, op).uncached(gif_bytes, *args)) == fast
+
+
+def test_delta_frames_are_not_copied_out_of_order():
+    raw = make_gif(delta=True)
+    blocks = parse_gif(raw)
+    assert not blocks.reorderable() and not blocks.self_contained(3)
+    source = _frames(raw)
+    out = gif_ops.reverse_gif.uncached(raw)
+    assert _frames(out) == source[::-1]
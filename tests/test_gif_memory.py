@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.gif_stream import GifWriter
+
+SIZE = (240, 180)
+FRAME_COUNTS = (40, 160)
+FRAME_BYTES = SIZE[0] * SIZE[1] * 4
+
+OPS = {
+    "hold_all": lambda ops, raw: [frame.copy() for frame, _ in ops.iter_frames(ops._b64_to_gif(raw))],
+    "resize": lambda ops, raw: ops.resize_gif.uncached(raw, 160, 0, True),
+    "speed": lambda ops, raw: ops.change_gif_speed.uncached(raw, 2.0),
+    "pingpong": lambda ops, raw: ops.pingpong_gif.uncached(raw),
+    "optimize": lambda ops, raw: ops.optimize_gif.uncached(raw, 64, 2),
+    "frames_zip": lambda ops, raw: sum(len(chunk) for chunk in ops.iter_frames_zip(raw)),
+}
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc peak RSS")
+
+
+def _write_gif(path: str, frames: int):
+    """A moving disc over a gradient, written one frame at a time."""
+    width, height = SIZE
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack([xx * 255 // width, yy * 255 // height, np.full_like(xx, 96)], axis=-1).astype(np.uint8)
+    with open(path, "wb") as fh:
+        writer = GifWriter(fh, threads=1)
+        for index in range(frames):
+            disc = (xx - width * (0.2 + 0.6 * (index % 30) / 30)) ** 2 + (yy - height / 2) ** 2 < (height / 6) ** 2
+            frame = base.copy()
+            frame[disc] = (240, 220, 40)
+            writer.add(Image.fromarray(frame).convert("RGBA"), 40)
+        writer.close()
+
+
+def _peak_rss() -> int:
+    """This process's peak RSS in bytes (``VmHWM``, which, unlike ``ru_maxrss``, starts afresh at exec)."""
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("no VmHWM in /proc/self/status")
+
+
+def _peak_growth(op: str, path: str) -> int:
+    """Run one op on the decode path in a fresh process; return how much its peak RSS grew."""
+    from src import gif_ops
+
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    gif_ops._blocks = lambda data: None  # this process exits after the op
+    before = _peak_rss()
+    OPS[op](gif_ops, raw)
+    return _peak_rss() - before
+
+
+@pytest.fixture(scope="module")
+def per_frame(tmp_path_factory):
+    """Peak RSS each op adds per extra input frame, between the two frame counts."""
+    folder = tmp_path_factory.mktemp("gif")
+    paths = {}
+    for frames in FRAME_COUNTS:
+        paths[frames] = str(folder / f"anim_{frames}.gif")
+        _write_gif(paths[frames], frames)
+    ctx = multiprocessing.get_context("spawn")
+    few, many = FRAME_COUNTS
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return {op: (pool.apply(_peak_growth, (op, paths[many])) - pool.apply(_peak_growth, (op, paths[few])))
+                / (many - few) for op in OPS}
+
+
+def test_holding_every_frame_is_measurable(per_frame):
+    assert per_frame["hold_all"] > FRAME_BYTES / 2
+
+
+@pytest.mark.parametrize("op", [op for op in OPS if op != "hold_all"])
+def test_transforms_stream_frames(per_frame, op):
+    # Same bound as benchmarks.py gif_memory: a quarter of an RGBA frame per extra frame.
+    assert per_frame[op] < FRAME_BYTES / 4, f"{op} grew {per_frame[op] / 1e3:.0f} KB per frame"
@@ -0,0 +1,61 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import GifImagePlugin, Image, ImageSequence
+
+from src.gif_blocks import parse_gif
+from src.gif_ops import optimize_gif
+from src.gif_stream import GifWriter, iter_frames, shared_palette
+
+from conftest import make_frames, make_gif
+
+
+def _rgba_frames(raw: bytes) -> list[bytes]:
+    return [frame.convert("RGBA").tobytes() for frame in ImageSequence.Iterator(Image.open(io.BytesIO(raw)))]
+
+
+def test_loading_strategy_is_restored(gif_bytes):
+    before = GifImagePlugin.LOADING_STRATEGY
+    img = Image.open(io.BytesIO(gif_bytes))
+    palette = shared_palette(img, source=parse_gif(gif_bytes))
+    frames = iter_frames(img, palette)
+    next(frames)
+    assert GifImagePlugin.LOADING_STRATEGY == before
+    modes = [frame.mode for frame, _ in frames]
+    assert GifImagePlugin.LOADING_STRATEGY == before
+    # Frames on the source palette still decode as "P" inside the reader.
+    assert set(modes) == {"P"}
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_source_palette_is_reused_exactly(delta):
+    raw = make_gif(delta=delta)
+    source = parse_gif(raw)
+    palette = shared_palette(Image.open(io.BytesIO(raw)), source=source)
+    assert palette is not None and palette.indexed
+    assert palette.colors.tobytes() == source.color_table
+    if delta:
+        assert palette.transparency == 255
+    else:  # an index no pixel uses is reserved for delta frames
+        used = np.unique(np.concatenate([np.asarray(frame).ravel() for frame in ImageSequence.Iterator(
+            Image.open(io.BytesIO(raw)))]))
+        assert palette.transparency not in used
+
+    # Every color survives: optimize with a full palette reproduces the frames.
+    assert _rgba_frames(optimize_gif.uncached(raw, colors=256)) == _rgba_frames(raw)
+
+
+def test_local_color_tables_fall_back_to_a_sampled_palette():
+    buf = io.BytesIO()
+    writer = GifWriter(buf, threads=1)  # no shared palette: a local table per frame
+    for frame in make_frames():
+        writer.add(frame, 40)
+    writer.close()
+    raw = buf.getvalue()
+    source = parse_gif(raw)
+    assert all(frame.local_table for frame in source.frames)
+
+    palette = shared_palette(Image.open(io.BytesIO(raw)), source=source)
+    assert palette is not None and not palette.indexed
+    assert len(_rgba_frames(optimize_gif.uncached(raw, colors=256))) == len(source.frames)
@@ -0,0 +1,105 @@
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from src import image_store
+from src.image_store import ImageNotStored, ImageStore
+
+
+def _png(color, size=(32, 32)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_put_is_content_addressed():
+    store = ImageStore(directory=None)
+    handle = store.put(_png("red"))
+    assert store.put(_png("red")) == handle and len(handle) == 64
+    assert store.get_bytes(handle) == _png("red")
+    img = store.get_image(handle)
+    assert (img.format, img.size, img.getpixel((0, 0))) == ("PNG", (32, 32), (255, 0, 0))
+    img.putpixel((0, 0), (0, 0, 0))
+    assert store.get_image(handle).getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    raws = [_png(color) for color in ("red", "green", "blue")]
+    store = ImageStore(memory_bytes=2 * max(map(len, raws)), directory=None)
+    red, green = store.put(raws[0]), store.put(raws[1])
+    store.get_bytes(red)
+    blue = store.put(raws[2])
+    assert store.stats()["entries"] == 2
+    assert red in store and blue in store and green not in store
+    with pytest.raises(ImageNotStored):
+        store.get_bytes(green)
+
+
+def test_evicted_entries_spill_to_disk_and_reload(tmp_path):
+    store = ImageStore(memory_bytes=1, directory=str(tmp_path))
+    red = store.put(_png("red"))
+    store.put(_png("blue"))
+    assert os.listdir(tmp_path) == [f"{red}.bin"]
+    assert red in store
+    assert store.get_image(red).getpixel((0, 0)) == (255, 0, 0)
+    assert store.get_bytes(red) == _png("red")
+
+
+def test_spill_directory_is_trimmed_only_when_over_budget(tmp_path, monkeypatch):
+    raws = [_png((i, 0, 0)) for i in range(6)]
+    store = ImageStore(memory_bytes=1, disk_bytes=3 * max(map(len, raws)), directory=str(tmp_path))
+    trims = []
+    trim = image_store.trim_directory
+    monkeypatch.setattr(image_store, "trim_directory", lambda *args: trims.append(args) or trim(*args))
+    for raw in raws:
+        store.put(raw)
+    # The first spill measures the directory; later ones trim only once it overflows.
+    assert 1 < len(trims) < len(raws) - 1
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= store.disk_bytes
+
+
+@pytest.mark.parametrize("handle", ["missing", "0" * 64, "../" + "a" * 61, "A" * 64])
+def test_unknown_handles_are_not_stored(tmp_path, handle):
+    store = ImageStore(directory=str(tmp_path))
+    assert handle not in store
+    with pytest.raises(ImageNotStored):
+        store.get_image(handle)
+    with pytest.raises(ImageNotStored):
+        store.get_bytes(handle)
+
+
+def test_concurrent_readers_decode_once_outside_the_store_lock(monkeypatch):
+    store = ImageStore(directory=None)
+    slow, fast = store.put(_png("red", (64, 64))), store.put(_png("blue"))
+    decoding, release = threading.Event(), threading.Event()
+    decoded = []
+    decode = image_store.bytes_to_image
+
+    def blocking_decode(raw):
+        decoded.append(raw)
+        if raw == _png("red", (64, 64)):
+            decoding.set()
+            release.wait(5)
+        return decode(raw)
+
+    monkeypatch.setattr(image_store, "bytes_to_image", blocking_decode)
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(store.get_image(slow))) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    assert decoding.wait(5)
+    # Another handle is still served while the first decode is in progress.
+    other = threading.Thread(target=lambda: results.append(store.get_image(fast)))
+    other.start()
+    other.join(1)
+    assert not other.is_alive() and results[0].getpixel((0, 0)) == (0, 0, 255)
+    release.set()
+    for reader in readers:
+        reader.join(5)
+    assert len(results) == 4 and len({id(img) for img in results}) == 4
+    assert decoded.count(_png("red", (64, 64))) == 1
+    assert store.stats()["memory_bytes"] == sum(len(_png(c, s)) for c, s in (("red", (64, 64)), ("blue", (32, 32)))) \
+        + 64 * 64 * 3 + 32 * 32 * 3
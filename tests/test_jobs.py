@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+import pytest
+
+from src import jobs
+from src.jobs import JobError, JobQueue, _Worker
+
+
+def _fake_run_job(op, raw, params):
+    if params.get("exit"):
+        os._exit(1)
+    time.sleep(float(params.get("sleep", 0)))
+    return b"done:" + raw, "text/plain"
+
+
+@pytest.fixture
+def make_queue(monkeypatch):
+    # Forked workers inherit the patched run_job, so jobs can sleep or crash on demand.
+    monkeypatch.setattr(jobs, "run_job", _fake_run_job)
+    queues = []
+
+    def make(**kwargs):
+        queue = JobQueue(start_method="fork", **{"workers": 1, **kwargs})
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def _settle(queue, job_id, timeout=10.0):
+    assert queue.wait([job_id], timeout) == [job_id]
+    return queue.status(job_id)
+
+
+def test_submit_then_fetch_result(make_queue):
+    queue = make_queue()
+    job_id = queue.submit("pipeline", b"abc")
+    assert _settle(queue, job_id)["status"] == "done"
+    assert queue.result(job_id) == (b"done:abc", "text/plain")
+    queue.forget(job_id)
+    with pytest.raises(JobError):
+        queue.status(job_id)
+
+
+def test_cancel_queued_and_running_jobs(make_queue):
+    queue = make_queue()
+    running = queue.submit("pipeline", b"a", {"sleep": 30})
+    deadline = time.time() + 5
+    while queue.status(running)["status"] != "running" and time.time() < deadline:
+        time.sleep(0.02)
+    queued = queue.submit("pipeline", b"b")
+    info = queue.status(queued)
+    assert (info["status"], info["position"]) == ("queued", 0)
+
+    assert queue.cancel(queued)["status"] == "cancelled"
+    queue.cancel(running)
+    assert _settle(queue, running)["status"] == "cancelled"
+    with pytest.raises(JobError):
+        queue.result(running)
+
+    # The killed worker was replaced, so the queue still runs jobs.
+    assert _settle(queue, queue.submit("pipeline", b"c"))["status"] == "done"
+
+
+def test_jobs_over_their_timeout_are_stopped(make_queue):
+    queue = make_queue()
+    job_id = queue.submit("pipeline", b"a", {"sleep": 30}, timeout=0.3)
+    info = _settle(queue, job_id)
+    assert info["status"] == "timeout" and "0.3s" in info["error"]
+    assert _settle(queue, queue.submit("pipeline", b"b"))["status"] == "done"
+
+
+def test_crashed_worker_is_replaced(make_queue):
+    queue = make_queue()
+    crashed = queue.submit("pipeline", b"a", {"exit": True})
+    info = _settle(queue, crashed)
+    assert info["status"] == "failed" and "exited unexpectedly" in info["error"]
+    assert _settle(queue, queue.submit("pipeline", b"b"))["status"] == "done"
+    assert len(queue._pool) == 1
+
+
+def test_replacing_a_worker_does_not_hold_the_lock(make_queue, monkeypatch):
+    stop = _Worker.stop
+    stopping = threading.Event()
+
+    def slow_stop(self, kill=False):
+        stopping.set()
+        time.sleep(1.0)
+        stop(self, kill)
+
+    monkeypatch.setattr(_Worker, "stop", slow_stop)
+    queue = make_queue()
+    crashed = queue.submit("pipeline", b"a", {"exit": True})
+    assert stopping.wait(5)
+    started = time.perf_counter()
+    assert queue.status(crashed)["status"] == "failed"
+    queued = queue.submit("pipeline", b"b")
+    assert time.perf_counter() - started < 0.5
+    assert _settle(queue, queued)["status"] == "done"
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app import app
+from src.pipeline import PipelineError, run_pipeline, validate_steps
+
+
+@pytest.fixture
+def img() -> Image.Image:
+    img = Image.new("RGB", (64, 48), (236, 236, 236))
+    ImageDraw.Draw(img).ellipse((12, 8, 44, 40), fill=(180, 40, 40))
+    return img
+
+
+def _png(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_steps_chain_and_encode_once(img):
+    steps = [
+        {"op": "remove_background", "tolerance": "18"},
+        {"op": "seam_carve", "target_width": "56"},
+        {"op": "export", "format": "webp", "quality": "80"},
+    ]
+    raw, mime, fmt_key, timings = run_pipeline(img, steps)
+    out = Image.open(io.BytesIO(raw))
+    assert (mime, fmt_key, out.format, out.size) == ("image/webp", "webp", "WEBP", (56, 48))
+    assert out.convert("RGBA").getpixel((0, 0))[3] == 0  # background removed before carving
+    assert [timing["op"] for timing in timings] == ["remove_background", "seam_carve", "export"]
+
+
+def test_default_output_is_png(img):
+    raw, mime, fmt_key, timings = run_pipeline(img, [{"op": "remove_background"}])
+    assert (mime, fmt_key) == ("image/png", "png") and Image.open(io.BytesIO(raw)).mode == "RGBA"
+    assert [timing["op"] for timing in timings] == ["remove_background", "export"]
+
+
+@pytest.mark.parametrize("steps, message", [
+    ([], "non-empty list"),
+    ([{"tolerance": 5}], "must be an object with an 'op'"),
+    ([{"op": "export"}, {"op": "remove_background"}], "must be the last step"),
+    ([{"op": "sharpen"}], "unknown pipeline op"),
+    ([{"op": "remove_background", "tolerance": "abc"}], "'tolerance' must be a number"),
+    ([{"op": "seam_carve", "target_width": [3]}], "'target_width' must be a number"),
+    ([{"op": "seam_carve", "order": "sideways"}], "'order' must be one of"),
+    ([{"op": "export", "quality": "high"}], "'quality' must be a number"),
+])
+def test_bad_steps_are_rejected(steps, message):
+    with pytest.raises(PipelineError, match=message):
+        validate_steps(steps)
+
+
+def test_validation_converts_numbers_without_touching_the_input():
+    steps = [{"op": "seam_carve", "target_width": "40.0"}, {"op": "convert", "quality": 70}]
+    assert validate_steps(steps) == [{"op": "seam_carve", "target_width": 40}, {"op": "convert", "quality": 70}]
+    assert steps[0]["target_width"] == "40.0"
+
+
+def test_route_answers_bad_params_with_json_400(img):
+    client = app.test_client()
+    steps = [{"op": "remove_background", "tolerance": "abc"}]
+    resp = client.post("/api/pipeline", data={"image": (io.BytesIO(_png(img)), "a.png"), "steps": json.dumps(steps)})
+    assert resp.status_code == 400 and "tolerance" in resp.get_json()["error"]
+    resp = client.post("/api/pipeline", data={"image": (io.BytesIO(_png(img)), "a.png"), "steps": "[{"})
+    assert resp.status_code == 400 and resp.is_json
+
+
+def test_route_runs_the_steps(img):
+    client = app.test_client()
+    steps = [{"op": "seam_carve", "target_width": 50}, {"op": "export", "format": "png"}]
+    resp = client.post("/api/pipeline", data={"image": (io.BytesIO(_png(img)), "a.png"), "steps": json.dumps(steps)})
+    assert resp.status_code == 200 and resp.mimetype == "image/png"
+    assert Image.open(io.BytesIO(resp.data)).size == (50, 48)
+    assert [timing["op"] for timing in json.loads(resp.headers["X-Pipeline-Timings"])] == ["decode", "seam_carve", "export"]
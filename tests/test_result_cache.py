@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from src.result_cache import ResultCache, input_digest
+
+
+def test_digest_covers_pixels_and_mode():
+    img = Image.new("RGB", (8, 8), (10, 20, 30))
+    assert input_digest(img) == input_digest(img.copy())
+    assert input_digest(img) != input_digest(img.convert("RGBA"))
+    changed = img.copy()
+    changed.putpixel((7, 7), (10, 20, 31))
+    assert input_digest(img) != input_digest(changed)
+
+
+def test_digest_covers_info_that_changes_results():
+    img = Image.new("P", (8, 8), 3)
+    transparent = img.copy()
+    transparent.info["transparency"] = 3
+    assert input_digest(img) != input_digest(transparent)
+
+    rgb = Image.new("RGB", (8, 8))
+    tagged = rgb.copy()
+    tagged.info["icc_profile"] = b"profile bytes"
+    assert input_digest(rgb) != input_digest(tagged)
+
+    # Unrelated info such as a comment does not split the cache.
+    commented = rgb.copy()
+    commented.info["comment"] = b"hello"
+    assert input_digest(rgb) == input_digest(commented)
+
+
+def test_disk_cache_round_trips_results_without_pickle(tmp_path):
+    cache = ResultCache(memory_bytes=1 << 20, disk_bytes=1 << 20, directory=str(tmp_path / "cache"))
+    img = Image.new("RGBA", (6, 4), (1, 2, 3, 4))
+    img.format = "PNG"
+    results = {
+        "image": img,
+        "array": np.arange(12, dtype=np.int32).reshape(3, 4),
+        "bytes": b"\x00GIF89a",
+        "str": "data:image/png;base64,AAAA",
+    }
+    for key, value in results.items():
+        cache.put(key, value)
+
+    fresh = ResultCache(memory_bytes=1 << 20, disk_bytes=1 << 20, directory=cache.directory)
+    for key, value in results.items():
+        hit, loaded = fresh.get(key)
+        assert hit
+        if isinstance(value, Image.Image):
+            assert (loaded.mode, loaded.size, loaded.format, loaded.tobytes()) == \
+                (value.mode, value.size, value.format, value.tobytes())
+        elif isinstance(value, np.ndarray):
+            assert loaded.dtype == value.dtype and np.array_equal(loaded, value)
+        else:
+            assert loaded == value
+    assert fresh.stats()["disk_hits"] == len(results)
+    assert os.stat(cache.directory).st_mode & 0o077 == 0
+
+
+def test_disk_cache_ignores_foreign_files(tmp_path):
+    cache = ResultCache(memory_bytes=0, disk_bytes=1 << 20, directory=str(tmp_path))
+    (tmp_path / "bad.res").write_bytes(b"\x80\x04\x95 not a header")
+    (tmp_path / "odd.res").write_bytes(b'{"type": "pickle"}\n...')
+    assert cache.get("bad") == (False, None)
+    assert cache.get("odd") == (False, None)
+
+
+def test_resize_evicts_down_to_the_new_cap():
+    cache = ResultCache(memory_bytes=1 << 20, directory=None)
+    cache.put("k", b"x" * 1000)
+    assert cache.get("k") == (True, b"x" * 1000)
+    cache.resize(0)
+    assert cache.stats()["entries"] == 0 and not cache.enabled
@@ -0,0 +1,130 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src import seam_engine
+from src.seam_engine import ENERGY_MODES
+
+
+def _pixels(shape=(18, 26), seed=2) -> np.ndarray:
+    """Noise over a few hard-edged blocks, so seams have something to avoid."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 40, size=shape + (3,), dtype=np.uint8)
+    pixels[4:12, 6:11] = (220, 60, 60)
+    pixels[9:16, 15:22] = (40, 200, 90)
+    return pixels
+
+
+@pytest.mark.parametrize("mode", ENERGY_MODES)
+def test_incremental_refresh_matches_a_full_recompute(mode):
+    gray = seam_engine.luminance(_pixels())
+    state = seam_engine._seam_state(gray, mode)
+    for _ in range(12):
+        seam = seam_engine.find_seam(gray, state, mode)
+        gray = seam_engine._drop(gray, seam)
+        state = seam_engine._advance(state, gray, seam, mode)
+        full = seam_engine._seam_state(gray, mode)
+        pairs = zip(state, full) if mode == "forward" else [(state, full)]
+        assert all(np.array_equal(refreshed, fresh) for refreshed, fresh in pairs)
+
+
+@pytest.mark.parametrize("mode", ENERGY_MODES)
+@pytest.mark.parametrize("count", [1, 5, 13])
+def test_ranks_match_sequential_carving(mode, count):
+    pixels = _pixels()
+    height, width = pixels.shape[:2]
+    ranks = seam_engine.removal_ranks(pixels, width - 13, mode)
+    assert np.array_equal(seam_engine.apply_ranks(pixels, ranks, width - count),
+                          seam_engine.carve(pixels, width - count, height, energy_mode=mode))
+
+    tall = seam_engine.transpose(pixels)
+    ranks = seam_engine.removal_ranks(tall, height - 13, mode)
+    narrowed = seam_engine.transpose(seam_engine.apply_ranks(tall, ranks, height - count))
+    assert np.array_equal(narrowed, seam_engine.carve(pixels, width, height - count, energy_mode=mode))
+
+
+@pytest.mark.parametrize("mode", ENERGY_MODES)
+def test_ranks_enlarge_like_seam_insertion(mode):
+    pixels = _pixels()
+    width = pixels.shape[1]
+    ranks = seam_engine.removal_ranks(pixels, width - 10, mode)
+    for count in (1, 6, 10):
+        assert np.array_equal(seam_engine.apply_ranks(pixels, ranks, width + count),
+                              seam_engine.insert_vertical_seams(pixels, count, mode))
+    with pytest.raises(ValueError):
+        seam_engine.apply_ranks(pixels, ranks, width + 11)
+
+
+@pytest.mark.parametrize("mode", ENERGY_MODES)
+def test_flat_column_is_the_seam(mode):
+    # Columns 3-5 share one value, so removing column 4 costs nothing in either mode.
+    rng = np.random.default_rng(5)
+    gray = rng.uniform(0, 255, size=(6, 9)).astype(np.float32)
+    gray[:, 3:6] = 128.0
+    assert list(seam_engine.find_seam(gray, seam_engine._seam_state(gray, mode), mode)) == [4] * 6
+
+
+def _seam_cost(gray: np.ndarray, seam: tuple, mode: str) -> float:
+    """What ``_cumulate`` minimises, summed along one seam."""
+    if mode == "backward":
+        energy = seam_engine.backward_energy(gray)
+        return float(sum(energy[row, col] for row, col in enumerate(seam)))
+    cost_left, cost_up, cost_right = seam_engine.forward_costs(gray)
+    total = float(cost_up[0, seam[0]])
+    for row in range(1, len(seam)):
+        step = seam[row] - seam[row - 1]
+        total += float({1: cost_left, 0: cost_up, -1: cost_right}[step][row, seam[row]])
+    return total
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_each_mode_finds_its_cheapest_seam(seed):
+    gray = np.random.default_rng(seed).uniform(0, 255, size=(5, 6)).astype(np.float32)
+    height, width = gray.shape
+    seams = [seam for seam in itertools.product(range(width), repeat=height)
+             if all(abs(a - b) <= 1 for a, b in zip(seam, seam[1:]))]
+    found = {}
+    for mode in ENERGY_MODES:
+        found[mode] = tuple(seam_engine.find_seam(gray, seam_engine._seam_state(gray, mode), mode))
+        best = min(_seam_cost(gray, seam, mode) for seam in seams)
+        assert _seam_cost(gray, found[mode], mode) == pytest.approx(best, rel=1e-5)
+    # Forward energy also counts the edges a removal creates, so it picks another seam here.
+    assert found["backward"] != found["forward"]
+
+
+def _product_shot(shape=(192, 256), seed=3) -> np.ndarray:
+    """A flat, slightly noisy background with two solid shapes: the pyramid's hardest case."""
+    rng = np.random.default_rng(seed)
+    pixels = (236 + rng.integers(-6, 7, size=shape + (3,))).astype(np.uint8)
+    pixels[40:150, 50:130] = (180, 40, 40)
+    pixels[70:170, 140:220] = (30, 60, 160)
+    return pixels
+
+
+def _photo(shape=(192, 256)) -> np.ndarray:
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]].astype(np.float32)
+    light = 0.6 + 0.4 * np.sin(xx / shape[1] * 3.1) * np.cos(yy / shape[0] * 2.3)
+    texture = np.sin(xx / 7.0) * np.sin(yy / 11.0) * 18
+    pixels = np.stack([light * 200 + texture, light * 170 + texture * 0.5, light * 120 + 20], axis=-1)
+    return pixels.clip(0, 255).astype(np.uint8)
+
+
+# Same bound as benchmarks.py seam_pyramid.
+PYRAMID_ENERGY_BOUND = 2.0
+
+
+@pytest.mark.parametrize("make", [_product_shot, _photo])
+@pytest.mark.parametrize("mode", ENERGY_MODES)
+def test_pyramid_energy_stays_near_exact(make, mode):
+    pixels = make()
+    height, width = pixels.shape[:2]
+    count = width // 10
+    energy = seam_engine.backward_energy(seam_engine.luminance(pixels))
+    exact = seam_engine.seam_order(pixels, count, mode)
+    approx = seam_engine.pyramid_seam_order(pixels, count, mode, 2)
+    assert len(approx) == count
+    removed = seam_engine._removed_mask(height, width, approx)
+    assert np.count_nonzero(removed) == count * height  # seams never share a pixel
+    ratio = energy[removed].sum() / energy[seam_engine._removed_mask(height, width, exact)].sum()
+    assert ratio <= PYRAMID_ENERGY_BOUND
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src import seam
+from src.result_cache import ResultCache, memoize
+from src.seam import seam_carve, seam_carve_precomputed, seam_order_map
+
+
+@pytest.fixture
+def img() -> Image.Image:
+    rng = np.random.default_rng(4)
+    return Image.fromarray(rng.integers(0, 256, size=(24, 40, 3), dtype=np.uint8))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    store = ResultCache(directory=None)
+    monkeypatch.setattr(seam, "RESULT_CACHE", store)
+    return store
+
+
+@pytest.mark.parametrize("size", [(34, 24), (28, 24), (46, 24), (40, 19), (40, 30)])
+def test_precomputed_matches_a_plain_carve(img, cache, size):
+    expected = seam_carve.uncached(img, *size, "width-first", "backward")
+    assert seam_carve_precomputed(img, *size).tobytes() == expected.tobytes()
+
+
+def test_map_grows_only_as_far_as_asked(img, cache):
+    assert seam_order_map(img, "width", "backward", 3).max() == 3
+    assert seam_order_map(img, "width", "backward", 2).max() == 3  # served from the cached map
+    grown = seam_order_map(img, "width", "backward", 9)
+    assert grown.max() == 9
+    fresh = seam.seam_engine.removal_ranks(np.asarray(img), img.width - 9)
+    assert np.array_equal(grown, fresh)
+
+
+def test_concurrent_misses_compute_once(img):
+    calls = []
+
+    @memoize("slow_op", cache=ResultCache(directory=None))
+    def slow_op(image):
+        calls.append(1)
+        time.sleep(0.05)
+        return image.size
+
+    threads = [threading.Thread(target=slow_op, args=(img,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_pyramid_is_opt_in(monkeypatch):
+    large = Image.new("RGB", (4000, 3000))
+    assert not seam.use_pyramid(large)
+    assert seam.use_pyramid(large, True)
+    monkeypatch.setattr(seam, "PYRAMID_MIN_MEGAPIXELS", 8.0)
+    assert seam.use_pyramid(large) and not seam.use_pyramid(large, False)
+    assert not seam.use_pyramid(Image.new("RGB", (100, 100)))
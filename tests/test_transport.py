@@ -0,0 +1,69 @@
+import base64
+import io
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import app
+from src.result_cache import RESULT_CACHE
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Every request must do the work, not read an earlier result.
+    monkeypatch.setattr(RESULT_CACHE, "memory_bytes", 0)
+    monkeypatch.setattr(RESULT_CACHE, "directory", None)
+    return app.test_client()
+
+
+@pytest.fixture
+def png_bytes() -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 256, size=(160, 240, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _peak(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def _data_url(raw: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(raw).decode("ascii")
+
+
+def test_every_flavour_returns_the_same_pixels(client, png_bytes):
+    json_resp = client.post("/api/background_remove", json={"image": _data_url(png_bytes), "tolerance": 18})
+    raw_resp = client.post("/api/background_remove?tolerance=18", data=png_bytes, content_type="image/png")
+    form_resp = client.post("/api/background_remove", data={"image": (io.BytesIO(png_bytes), "a.png"),
+                                                             "tolerance": "18"})
+    assert json_resp.status_code == raw_resp.status_code == form_resp.status_code == 200
+    assert raw_resp.mimetype == form_resp.mimetype == "image/png"
+    assert raw_resp.headers["X-Image-Width"] == "240" and raw_resp.headers["X-Image-Height"] == "160"
+    from_json = base64.b64decode(json_resp.get_json()["img"].split(",", 1)[1])
+    decoded = {Image.open(io.BytesIO(body)).tobytes() for body in (from_json, raw_resp.data, form_resp.data)}
+    assert len(decoded) == 1
+
+
+def test_binary_requests_allocate_less(client, png_bytes):
+    def send_json():
+        return client.post("/api/background_remove", json={"image": _data_url(png_bytes), "tolerance": 18})
+
+    def send_raw():
+        return client.post("/api/background_remove?tolerance=18", data=png_bytes, content_type="image/png")
+
+    send_json(), send_raw()  # first-call imports and caches
+    json_peak, json_resp = _peak(send_json)
+    raw_peak, raw_resp = _peak(send_raw)
+    assert json_resp.status_code == raw_resp.status_code == 200
+    # The JSON request holds the base64 text and its decoded copy, and answers in base64.
+    assert raw_peak + len(png_bytes) < json_peak
+    assert len(raw_resp.data) * 4 // 3 <= len(json_resp.data)
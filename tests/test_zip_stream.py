@@ -0,0 +1,32 @@
+import io
+import json
+import zipfile
+
+from PIL import Image
+
+from src.exporter import iter_image_set_zip
+from src.zip_stream import ChunkSink
+
+
+def test_chunk_sink_streams_a_valid_archive():
+    sink = ChunkSink()
+    chunks = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(3):
+            archive.writestr(f"part{index}.txt", f"member {index}" * 100)
+            chunks.append(sink.take())
+    chunks.append(sink.take())
+    assert all(chunks[:3])  # each member is handed over as soon as it is written
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.read("part2.txt") == b"member 2" * 100
+
+
+def test_image_set_zip_lists_every_variant():
+    img = Image.new("RGB", (64, 40), (200, 100, 50))
+    raw = b"".join(iter_image_set_zip(img, [64, 32], ["png", "jpeg"], profile="fast"))
+    archive = zipfile.ZipFile(io.BytesIO(raw))
+    manifest = json.loads(archive.read("manifest.json"))
+    names = sorted(variant["file"] for variant in manifest["variants"])
+    assert names == ["image-32w.jpeg", "image-32w.png", "image-64w.jpeg", "image-64w.png"]
+    assert Image.open(io.BytesIO(archive.read("image-32w.png"))).size == (32, 20)